@@ -0,0 +1,93 @@
+"""
+Micro benchmark of the varint primitives of BinaryReader against the previous BytesIO + ctypes implementation.
+
+python benchmarks/bench_binary_reader.py [--count 200000] [--repeat 5]
+"""
+import argparse
+import ctypes
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from binary_reader import BinaryReader
+
+
+class LegacyBinaryReader:
+    # The BytesIO based reader before the cursor rewrite, kept here as the baseline
+    def __init__(self, buffer: bytes):
+        self._buffer = io.BytesIO(buffer)
+
+    def read_byte(self):
+        return self._buffer.read(1)[0]
+
+    def read_uleb128(self) -> int:
+        result = 0
+        shift = 0
+        while True:
+            byte = self.read_byte()
+            result |= (byte & 0x7f) << shift
+            if byte & 0x80 == 0:
+                break
+            shift += 7
+        return result
+
+    def read_sleb128(self) -> int:
+        value = self.read_uleb128()
+        sign = value & 1
+        value >>= 1
+        return value if sign == 0 else ctypes.c_int64(~(value - 1)).value
+
+    def read_hash(self) -> int:
+        value = ctypes.c_int(self.read_uleb128()).value
+        return ctypes.c_int((value & 1) ^ (value >> 1)).value
+
+
+def encode_uleb128(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def build_data(count: int) -> bytes:
+    rnd = random.Random(0)
+    values = [rnd.choice([rnd.randint(0, 0x7f), rnd.randint(0, 0x3fff), rnd.randint(0, 0xffffffff)])
+              for _ in range(count)]
+    return b''.join(encode_uleb128(v) for v in values)
+
+
+def measure(reader_factory, method: str, data: bytes, count: int, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        read = getattr(reader_factory(data), method)
+        start = time.perf_counter()
+        for _ in range(count):
+            read()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', help='Number of varints to decode per run', type=int, default=200000)
+    parser.add_argument('--repeat', help='Runs per method, the best one is reported', type=int, default=5)
+    args = parser.parse_args()
+    data = build_data(args.count)
+    print(f'{"method":<14}{"legacy (ms)":>14}{"cursor (ms)":>14}{"speedup":>10}')
+    for method in ['read_uleb128', 'read_sleb128', 'read_hash']:
+        legacy = measure(LegacyBinaryReader, method, data, args.count, args.repeat)
+        cursor = measure(lambda b: BinaryReader(buffer=b), method, data, args.count, args.repeat)
+        print(f'{method:<14}{legacy * 1000:>14.1f}{cursor * 1000:>14.1f}{legacy / cursor:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark of the dump.cs scanner of ClassLoader against the previous readlines + per line regex parser.
+Reports parse time and peak traced memory of both, and checks they produce the same schema.
+
+python benchmarks/bench_class_loader.py --cs dump.cs
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from class_loader import ClassLoader, EnumDecl, FieldDecl
+
+
+class LegacyParser:
+    # The parser before the streaming rewrite, kept here as the baseline
+    def __init__(self, header_file: str):
+        self._classes = {}
+        self._enums = {}
+        self._base_classes = {}
+        self._rev_base_class = {}
+        self._excel_row_class = []
+        self._cur_namespace = ''
+        with open(header_file, 'r', encoding='utf-8') as f:
+            self.header_raw = f.readlines()
+        self._idx = 0
+        self._len = len(self.header_raw)
+
+    def parse(self):
+        while self._idx < self._len:
+            line = self.header_raw[self._idx]
+            pat = re.search('^// Namespace: (.*)', line)
+            if pat:
+                self._cur_namespace = pat[1]
+            if re.search('public(.*)? class', line) is not None:
+                self._load_class()
+            elif line.startswith('public enum'):
+                self._load_enum()
+            else:
+                self._idx += 1
+        self._excel_row_class = list(set(self._excel_row_class))
+
+    def _load_class(self):
+        pat = re.search(r'public(?: .*)? class ([a-zA-Z0-9_]+(?:\.[a-zA-Z0-9_]+)?)(?: : ([a-zA-Z0-9_]+))?',
+                        self.header_raw[self._idx])
+        if pat is None:
+            self._idx += 1
+            return
+        class_name = pat[1]
+        base_class = pat[2]
+        if class_name in self._classes and self._cur_namespace != 'RPG.GameCore':
+            self._idx += 1
+            return
+        if base_class is not None:
+            self._base_classes[class_name] = base_class
+            self._rev_base_class.setdefault(base_class, []).append(class_name)
+        class_decl = []
+        self._idx += 1
+        if self.header_raw[self._idx].startswith('{}'):
+            self._classes[class_name] = class_decl
+            return
+        while not self.header_raw[self._idx].startswith('}'):
+            pat = re.search(r'public ([a-zA-Z0-9_]+)(\[])? ([a-zA-Z0-9_]+);', self.header_raw[self._idx])
+            if pat:
+                class_decl.append(FieldDecl(pat[3], pat[1], pat[2] is not None, False, None))
+            else:
+                pat = re.search(r'public(?: readonly)? (\w+)<([\w.,\s]+)> (\w+);', self.header_raw[self._idx])
+                if pat:
+                    class_decl.append(FieldDecl(pat[3], pat[1], False, True, pat[2]))
+            if 'Row' in self.header_raw[self._idx]:
+                pat = re.search(
+                    r'public static void [A-Z]+\(Dictionary<string, int> [A-Z]+, string\[] [A-Z]+, out ([a-zA-Z0-9]+)Row [A-Z]+\) \{ }',
+                    self.header_raw[self._idx])
+                if pat:
+                    self._excel_row_class.append(pat[1])
+            self._idx += 1
+        self._classes[class_name] = class_decl
+
+    def _load_enum(self):
+        pat = re.search(r'public enum ([a-zA-Z0-9_]+)', self.header_raw[self._idx])
+        if pat is None:
+            self._idx += 1
+            return
+        enum_decl = EnumDecl(pat[1])
+        self._idx += 1
+        while not self.header_raw[self._idx].startswith('}'):
+            pat = re.search(rf'public const {enum_decl.name} ([a-zA-Z0-9_]+) = (-?[0-9]+);', self.header_raw[self._idx])
+            if pat:
+                enum_decl.add(pat[1], int(pat[2]))
+            else:
+                pat = re.search(rf'public (\w+) value__;', self.header_raw[self._idx])
+                if pat:
+                    enum_decl.set_val_type(pat[1])
+            self._idx += 1
+        self._enums[enum_decl.name] = enum_decl
+
+
+def streaming_parser(header_file: str) -> ClassLoader:
+    # Only run the scanner, derivation guessing and caching are not part of the comparison
+    loader = ClassLoader.__new__(ClassLoader)
+    loader._classes = {}
+    loader._enums = {}
+    loader._base_classes = {}
+    loader._rev_base_class = {}
+    loader._excel_row_class = []
+    loader._cur_namespace = ''
+    loader.header_file = header_file
+    return loader
+
+
+def snapshot(parser) -> tuple:
+    return ({k: [repr(f) for f in v] for k, v in parser._classes.items()},
+            {k: (v.dict, v.val_type) for k, v in parser._enums.items()},
+            parser._base_classes, parser._rev_base_class, sorted(parser._excel_row_class))
+
+
+def measure(factory, header_file: str):
+    start = time.perf_counter()
+    parser = factory(header_file)
+    parser.parse()
+    elapsed = time.perf_counter() - start
+    result = snapshot(parser)
+    del parser
+    tracemalloc.start()
+    parser = factory(header_file)
+    parser.parse()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cs', help='Path to dump.cs', required=True)
+    args = parser.parse_args()
+    logging.getLogger('SRExtractor').setLevel(logging.WARNING)
+    size = os.path.getsize(args.cs)
+    legacy_time, legacy_peak, legacy_result = measure(LegacyParser, args.cs)
+    stream_time, stream_peak, stream_result = measure(streaming_parser, args.cs)
+    print(f'dump.cs: {size / 1048576:.1f} MB')
+    print(f'{"parser":<12}{"time (s)":>10}{"MB/s":>10}{"peak (MB)":>12}')
+    for name, elapsed, peak in [('legacy', legacy_time, legacy_peak), ('streaming', stream_time, stream_peak)]:
+        print(f'{name:<12}{elapsed:>10.2f}{size / 1048576 / elapsed:>10.1f}{peak / 1048576:>12.1f}')
+    print('Schema identical' if legacy_result == stream_result else 'Schema MISMATCH')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""
+Throughput of every extraction stage on synthetic design data (see synthetic.py), with an optional comparison
+against a saved baseline. A digest of the full extraction output is recorded too, so a baseline also catches changes
+of the output bytes.
+
+python benchmarks/bench_suite.py [--data DIR] [--beta] [--scale 5] [--repeat 3] [--save-baseline FILE]
+                                 [--baseline FILE] [--tolerance 0.1]
+
+Without --data, a data set is generated into a temporary folder, sized by --scale. Exits with 1 if a stage is slower
+than the baseline by more than the tolerance, or the output differs.
+"""
+import argparse
+import gc
+import hashlib
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+from class_loader import ClassLoader
+from config_loader import ConfigLoader
+from design_index_loader import DesignIndexLoader
+from textmap_loader import TextmapLoader, Language
+
+VERSION = '1.2.53'
+# Digests and baselines ignore files that depend on the run rather than the data
+VOLATILE_FILES = {'profile.json', 'incremental.json', '.extract_state.json'}
+
+
+def count_objects(value) -> int:
+    if isinstance(value, dict):
+        return 1 + sum(count_objects(v) for v in value.values())
+    if isinstance(value, list):
+        return sum(count_objects(v) for v in value)
+    return 0
+
+
+def get_chunk_size(design: DesignIndexLoader, name: str) -> int:
+    return design.find_entry(name).size
+
+
+def bench_index(data: str, beta: bool):
+    design_dir = os.path.join(data, 'design')
+    path = os.path.join(design_dir, next(f for f in os.listdir(design_dir) if f.startswith('DesignV_')))
+    design = DesignIndexLoader(path, VERSION)
+    return os.path.getsize(path), len(design.hash_map)
+
+
+def bench_schema(data: str, beta: bool):
+    cs = os.path.join(data, 'dump.cs')
+    cls = ClassLoader(cs, use_cache=False)
+    return os.path.getsize(cs), len(cls._classes) + len(cls._enums)
+
+
+def bench_textmap(data: str, beta: bool):
+    design = DesignIndexLoader(os.path.join(data, 'design'), VERSION)
+    size = count = 0
+    for language in Language:
+        entries = TextmapLoader.iter_by_language(design, language)
+        if entries is None:
+            continue
+        size += get_chunk_size(design, TextmapLoader.get_textmap_path(language))
+        for _ in entries:
+            count += 1
+    return size, count
+
+
+def _create_loader(data: str, beta: bool) -> ConfigLoader:
+    # A fresh loader per run, so compiling the decoders is part of the measurement
+    cls = ClassLoader(os.path.join(data, 'dump.cs'))
+    design = DesignIndexLoader(os.path.join(data, 'design'), VERSION)
+    return ConfigLoader(design, cls, beta)
+
+
+def _load_excel_map(data: str) -> dict:
+    with open(os.path.join(data, 'excel_map.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)['mapping']
+
+
+def bench_excel(data: str, beta: bool):
+    conf = _create_loader(data, beta)
+    size = count = 0
+    for _, name, class_name in conf.get_validation_tasks(['excel'], _load_excel_map(data)):
+        rows = conf.load_binary_excel(class_name, name)
+        size += get_chunk_size(conf._design, name)
+        count += len(rows)
+    return size, count
+
+
+def bench_config(data: str, beta: bool):
+    conf = _create_loader(data, beta)
+    size = count = 0
+    for _, name, class_name in conf.get_validation_tasks(['config', 'story']):
+        reader = conf._design.get_reader(name=name)
+        value = conf.load_class(reader, class_name)
+        size += len(reader)
+        count += count_objects(value)
+    return size, count
+
+
+STAGES = [
+    ('index', bench_index),
+    ('schema', bench_schema),
+    ('textmap', bench_textmap),
+    ('excel', bench_excel),
+    ('config', bench_config),
+]
+
+
+def measure(func, data: str, beta: bool, repeat: int) -> dict:
+    best = None
+    for _ in range(repeat):
+        # Garbage of the previous run (loaders, decoded rows) shouldn't be collected on this one's time
+        gc.collect()
+        start = time.perf_counter()
+        size, count = func(data, beta)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {'time': best, 'bytes': size, 'objects': count,
+            'mb_per_s': size / best / 1e6, 'objects_per_s': count / best}
+
+
+def digest_tree(path: str) -> str:
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if name in VOLATILE_FILES or name.endswith('.cache'):
+                continue
+            file_path = os.path.join(root, name)
+            digest.update(os.path.relpath(file_path, path).replace(os.sep, '/').encode('utf-8') + b'\0')
+            with open(file_path, 'rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def extract(data: str, beta: bool) -> dict:
+    """
+    Run a full extraction with main.py and digest its output.
+    """
+    with tempfile.TemporaryDirectory() as output:
+        command = [sys.executable, os.path.join(ROOT, 'main.py'), '--design', os.path.join(data, 'design'),
+                   '--cs', os.path.join(data, 'dump.cs'), '--excel-map', os.path.join(data, 'excel_map.json'),
+                   '--output', output, '--version', VERSION, '--no-schema-cache']
+        if beta:
+            command.append('--beta')
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        return {'time': elapsed, 'digest': digest_tree(output)}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    ok = True
+    if baseline.get('data') != results['data']:
+        print('Warning: the baseline was measured on different data, throughput is not comparable')
+    print(f'{"stage":<10}{"MB/s":>10}{"base":>10}{"objects/s":>12}{"base":>12}{"ratio":>8}')
+    for name, stage in results['stages'].items():
+        base = baseline['stages'].get(name)
+        if base is None:
+            print(f'{name:<10}{stage["mb_per_s"]:>10.2f}{"-":>10}{stage["objects_per_s"]:>12.0f}{"-":>12}{"-":>8}')
+            continue
+        ratio = stage['mb_per_s'] / base['mb_per_s']
+        flag = ''
+        if ratio < 1 - tolerance:
+            flag = '  slower'
+            ok = False
+        print(f'{name:<10}{stage["mb_per_s"]:>10.2f}{base["mb_per_s"]:>10.2f}{stage["objects_per_s"]:>12.0f}'
+              f'{base["objects_per_s"]:>12.0f}{ratio:>8.2f}{flag}')
+    if 'extract' in results and 'extract' in baseline:
+        print(f'extract   {results["extract"]["time"]:.2f}s, baseline {baseline["extract"]["time"]:.2f}s')
+        if baseline['data'] == results['data'] and results['extract']['digest'] != baseline['extract']['digest']:
+            print('Output differs from the baseline')
+            ok = False
+    return ok
+
+
+def run(data: str, beta: bool, repeat: int, extraction: bool) -> dict:
+    results = {
+        'python': platform.python_version(),
+        'beta': beta,
+        'data': digest_tree(data),
+        'stages': {},
+    }
+    for name, func in STAGES:
+        results['stages'][name] = measure(func, data, beta, repeat)
+    if extraction:
+        results['extract'] = extract(data, beta)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', help='Synthetic data folder from synthetic.py. Generated if not given')
+    parser.add_argument('--beta', help='Data is encoded in beta mode', action='store_true', default=False)
+    parser.add_argument('--scale', help='Size multiplier of the generated data', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', help='Runs per stage, the best one is kept', type=int, default=3)
+    parser.add_argument('--no-extract', help='Skip the full extraction and its output digest', action='store_true',
+                        default=False)
+    parser.add_argument('--save-baseline', help='Write the results to this file')
+    parser.add_argument('--baseline', help='Compare with the results saved in this file')
+    parser.add_argument('--tolerance', help='Allowed slowdown against the baseline', type=float, default=0.1)
+    args = parser.parse_args()
+    logging.getLogger('SRExtractor').setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data = args.data
+        if data is None:
+            data = os.path.join(tmp, 'data')
+            synthetic.build(data, args.seed, args.beta, configs=40 * args.scale, rows=200 * args.scale,
+                            texts=500 * args.scale, stories=30 * args.scale)
+        results = run(data, args.beta, args.repeat, not args.no_extract)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+        return
+    print(f'{"stage":<10}{"time (s)":>10}{"MB/s":>10}{"objects/s":>12}')
+    for name, stage in results['stages'].items():
+        print(f'{name:<10}{stage["time"]:>10.4f}{stage["mb_per_s"]:>10.2f}{stage["objects_per_s"]:>12.0f}')
+    if 'extract' in results:
+        print(f'extract   {results["extract"]["time"]:.2f}s, output digest {results["extract"]["digest"][:16]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,488 @@
+"""
+Generator of synthetic design data: a dump.cs, a DesignV_* index with its containers, textmaps, excels, configs and
+stories, all random but reproducible from the seed. Only the index layout of 1.2.53+ is generated.
+
+python benchmarks/synthetic.py OUTPUT [--seed 1] [--beta] [--configs 40] [--rows 200] [--texts 500] [--stories 30]
+
+The output can be extracted with
+python main.py --design OUTPUT/design --cs OUTPUT/dump.cs --excel-map OUTPUT/excel_map.json --output ... [--beta]
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+from typing import Dict, List, Tuple
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from binary_writer import BinaryWriter
+from hashing import get_stable_hash
+
+# name, base, namespace, fields of (type, name, kind), kind is '', '[]' or 'generic:K, V'
+CLASSES = [
+    ('JsonConfig', None, 'RPG.GameCore', []),
+    ('TaskConfig', 'JsonConfig', 'RPG.GameCore', [('bool', 'TaskEnabled', '')]),
+    ('DamageTask', 'TaskConfig', 'RPG.GameCore', [('DynamicFloat', 'Damage', ''), ('ElementType', 'Element', ''),
+                                                  ('TargetType', 'Target', ''), ('int', 'Ids', '[]')]),
+    ('HealTask', 'TaskConfig', 'RPG.GameCore', [('FixPoint', 'Ratio', ''), ('TaskConfig', 'SubTasks', '[]'),
+                                                ('float', 'Curve', '[]')]),
+    ('SequenceTask', 'TaskConfig', 'RPG.GameCore', [('TaskConfig', 'Tasks', '[]'), ('string', 'Tag', ''),
+                                                    ('uint', 'Weights', '[]')]),
+    ('ChangePropState', 'TaskConfig', 'RPG.GameCore', [('int', 'State', '')]),
+    # Obfuscated subclasses are not part of the derivation list
+    ('ABCDEFGHIJKL', 'TaskConfig', 'RPG.GameCore', [('int', 'Hidden', '')]),
+    ('ValueTask', 'TaskConfig', 'RPG.GameCore', [('DynamicValue', 'Value', ''), ('MVector3', 'Pos', ''),
+                                                 ('TextID', 'Texts', '[]'), ('FixPoint', 'Fix', '[]')]),
+    ('ModifierConfig', None, 'RPG.GameCore', [('string', 'Name', ''), ('uint', 'Stack', ''),
+                                              ('Dictionary', 'Params', 'generic:string, DynamicFloat'),
+                                              ('double', 'Chance', ''), ('byte', 'Flag', '')]),
+    # DynamicValues, declared as an empty obfuscated class
+    ('DKEHIOFECJD', None, 'RPG.GameCore', []),
+    ('AbilityConfig', 'JsonConfig', 'RPG.GameCore', [('string', 'Name', ''), ('TaskConfig', 'OnStart', '[]'),
+                                                     ('DKEHIOFECJD', 'DynamicValues', ''),
+                                                     ('ModifierConfig', 'Modifiers', '[]'),
+                                                     ('Dictionary', 'ModMap', 'generic:uint, ModifierConfig'),
+                                                     ('StringHash', 'Hash', ''), ('MVector2', 'Size', ''),
+                                                     ('MVector4', 'Color', '')]),
+    ('AdventureAbilityConfigList', 'JsonConfig', 'RPG.GameCore', [('AbilityConfig', 'AbilityList', '[]')]),
+    ('LevelGraphConfig', 'JsonConfig', 'RPG.GameCore', [('string', 'Name', ''), ('TaskConfig', 'OnInit', '[]'),
+                                                        ('TaskConfig', 'OnStart', '[]'),
+                                                        ('bool', 'Loop', '')]),
+    ('AvatarConfigRow', None, 'RPG.GameCore', [('uint', 'AvatarID', ''), ('TextID', 'AvatarName', ''),
+                                               ('float', 'Speed', ''), ('FixPoint', 'Atk', ''),
+                                               ('int', 'Skills', '[]'), ('string', 'Icon', ''),
+                                               ('ElementType', 'Element', ''), ('bool', 'Release', ''),
+                                               ('TextID', 'Desc', '[]'), ('uint', 'Rarity', '')]),
+    ('ItemConfigRow', None, 'RPG.GameCore', [('uint', 'ItemID', ''), ('string', 'Name', ''), ('int', 'Count', ''),
+                                             ('double', 'Value', ''), ('float', 'Weights', '[]'),
+                                             ('ModifierConfig', 'Mod', '')]),
+    ('PerformanceCRow', None, 'RPG.GameCore', [('uint', 'PerformanceID', ''), ('string', 'PerformancePath', ''),
+                                               ('TargetType', 'Type', '')]),
+]
+
+ENUMS = [
+    ('ElementType', 'int', [('Fire', 0), ('Ice', 1), ('Wind', 2), ('Neg', -3)]),
+    ('TargetType', 'uint', [('Self', 0), ('Enemy', 1), ('All', 7)]),
+]
+
+EXCELS = {
+    'AvatarConfig': 'BakedConfig/ExcelOutput/AvatarConfig.bytes',
+    'ItemConfig': 'BakedConfig/ExcelOutput/ItemConfig.bytes',
+    'PerformanceC': 'BakedConfig/ExcelOutput/PerformanceC.bytes',
+}
+
+LANGUAGES = ['cn', 'cht', 'de', 'en', 'es', 'fr', 'id', 'jp', 'kr', 'pt', 'ru', 'th', 'vi']
+
+
+def write_dump_cs(path: str, pad_classes: int = 0, seed: int = 7):
+    """
+    :param pad_classes: Number of unrelated classes to add, to make the schema parse closer to a real dump
+    """
+    lines = ['// Image 0: holder.dll - 0\n', '\n']
+    idx = 0
+    for name, base, namespace, fields in CLASSES:
+        lines.append(f'// Namespace: {namespace}\n')
+        lines.append(f'public class {name}' + (f' : {base}' if base else '') + f' // TypeDefIndex: {idx}\n')
+        idx += 1
+        if not fields and name != 'JsonConfig':
+            lines.append('{}\n\n')
+            continue
+        lines.append('{\n\t// Fields\n')
+        for i, (ty, field_name, kind) in enumerate(fields):
+            if kind.startswith('generic:'):
+                lines.append(f'\tpublic Dictionary<{kind[8:]}> {field_name}; // 0x{0x10 + i * 8:X}\n')
+            else:
+                lines.append(f'\tpublic {ty}{kind} {field_name}; // 0x{0x10 + i * 8:X}\n')
+        lines.append('\n\t// Methods\n')
+        if name.endswith('Row'):
+            # Signature the excel class detection looks for
+            lines.append(f'\tpublic static void ABCD(Dictionary<string, int> EFGH, string[] IJKL, '
+                         f'out {name} MNOP) {{ }}\n')
+        lines.append('\tpublic void .ctor() { }\n}\n\n')
+    # Same name in another namespace, ignored by the class loader
+    lines.append('// Namespace: Other\n')
+    lines.append('public class ItemConfigRow // TypeDefIndex: 999\n{\n\tpublic int Bogus; // 0x10\n}\n\n')
+    for name, value_type, values in ENUMS:
+        lines.append('// Namespace: RPG.GameCore\n')
+        lines.append(f'public enum {name} // TypeDefIndex: {idx}\n{{\n')
+        idx += 1
+        lines.append(f'\t// Fields\n\tpublic {value_type} value__; // 0x0\n')
+        for value_name, value in values:
+            lines.append(f'\tpublic const {name} {value_name} = {value};\n')
+        lines.append('}\n\n')
+    rnd = random.Random(seed)
+    for i in range(pad_classes):
+        lines.append('// Namespace: Pad\n')
+        lines.append(f'public sealed class PadClass{i} : Object // TypeDefIndex: {idx}\n{{\n')
+        idx += 1
+        for j in range(rnd.randint(0, 12)):
+            lines.append(f'\tpublic {rnd.choice(["int", "string", "float"])} Field{j}; // 0x{j * 8:X}\n')
+            if rnd.random() < 0.3:
+                lines.append(f'\tprivate List<int> priv{j}; // 0x0\n')
+        lines.append('\n\t// Methods\n')
+        for j in range(rnd.randint(0, 8)):
+            lines.append(f'\t// RVA: 0x{rnd.randint(0, 1 << 24):X} Offset: 0x0 VA: 0x0\n')
+            lines.append(f'\tpublic void Method{j}(int a, string b) {{ }}\n\n')
+        lines.append('}\n\n')
+        if i % 5 == 0:
+            lines.append('// Namespace: Pad\n')
+            lines.append(f'public enum PadEnum{i} // TypeDefIndex: {idx}\n{{\n\tpublic int value__; // 0x0\n')
+            idx += 1
+            for j in range(rnd.randint(1, 20)):
+                lines.append(f'\tpublic const PadEnum{i} V{j} = {j};\n')
+            lines.append('}\n\n')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+
+
+class SyntheticGenerator:
+    """
+    Random values of the classes in CLASSES, encoded the way ConfigLoader decodes them.
+    """
+
+    def __init__(self, seed: int, is_beta: bool):
+        self.random = random.Random(seed)
+        self.is_beta = is_beta
+        self._classes = {c[0]: c for c in CLASSES}
+        self._enums = {e[0]: e for e in ENUMS}
+        subclasses: Dict[str, List[str]] = {}
+        for name, base, _, _ in CLASSES:
+            if base:
+                subclasses.setdefault(base, []).append(name)
+
+        def descendants(name: str) -> List[str]:
+            ret = []
+            for sub in subclasses.get(name, []):
+                ret.append(sub)
+                ret.extend(descendants(sub))
+            return ret
+        # Same derivation lists as ClassLoader, sorted and without obfuscated names
+        self._derivations = {}
+        for name, base, _, _ in CLASSES:
+            if base and base != 'JsonConfig' and self._is_json_config(name):
+                self._derivations[base] = sorted(set(sub for sub in descendants(base)
+                                                     if not re.fullmatch(r'[A-Z]{11,}', sub)))
+
+    def _is_json_config(self, name: str) -> bool:
+        while name:
+            if name == 'JsonConfig':
+                return True
+            if name not in self._classes:
+                return False
+            name = self._classes[name][1]
+        return False
+
+    def _fields(self, name: str) -> list:
+        ret = []
+        while name:
+            ret = list(self._classes[name][3]) + ret
+            name = self._classes[name][1]
+        return ret
+
+    def hash(self) -> int:
+        return self.random.randint(-0x40000000, 0x3FFFFFFF)
+
+    def dynamic_float(self, writer: BinaryWriter, is_beta: bool = None):
+        r = self.random
+        if r.random() < 0.5:
+            writer.write_bool(False)
+            writer.write_sleb128(r.randint(-(1 << 40), 1 << 40))
+            return
+        writer.write_bool(True)
+        if self.is_beta if is_beta is None else is_beta:
+            fixed = [r.randint(-(1 << 40), 1 << 40) for _ in range(r.randint(1, 3))]
+            dynamic = [self.hash() for _ in range(r.randint(1, 3))]
+            ops = []
+            for _ in range(r.randint(1, 6)):
+                op = r.randint(0, 9)
+                ops.append(op)
+                if op == 0:
+                    ops.append(r.randrange(len(fixed)))
+                elif op == 1:
+                    ops.append(r.randrange(len(dynamic)))
+            writer.write_byte(len(ops))
+            for op in ops:
+                writer.write_byte(op)
+            writer.write_byte(len(fixed))
+            for value in fixed:
+                writer.write_sleb128(value)
+            writer.write_byte(len(dynamic))
+            for value in dynamic:
+                writer.write_hash(value)
+        else:
+            count = r.randint(1, 6)
+            writer.write_byte(count)
+            for _ in range(count):
+                op = r.randint(0, 9)
+                writer.write_byte(op)
+                if op == 0:
+                    writer.write_sleb128(r.randint(-(1 << 40), 1 << 40))
+                elif op == 1:
+                    writer.write_hash(self.hash())
+
+    def dynamic_value(self, writer: BinaryWriter, depth: int = 0):
+        r = self.random
+        type_ = r.randint(0, 6) if depth < 3 else r.choice([0, 1, 2, 5])
+        writer.write_sleb128(type_)
+        if type_ == 0:
+            writer.write_sleb128(r.randint(-1000, 1000))
+        elif type_ == 1:
+            writer.write_float(r.random())
+        elif type_ == 2:
+            writer.write_bool(r.random() < 0.5)
+        elif type_ in (3, 4):
+            count = r.randint(0, 3)
+            writer.write_array_len(count)
+            for _ in range(count):
+                if type_ == 4:
+                    self.dynamic_value(writer, depth + 1)
+                self.dynamic_value(writer, depth + 1)
+        elif type_ == 5:
+            writer.write_string(f'dv{r.randint(0, 100)}')
+
+    def dynamic_values(self, writer: BinaryWriter):
+        r = self.random
+        count = r.randint(0, 4)
+        writer.write_uleb128(count)
+        for _ in range(count):
+            writer.write_hash(self.hash())
+            if r.random() < 0.5:
+                writer.write_bool(True)
+                for _ in range(3):
+                    self.dynamic_float(writer, True)
+            else:
+                writer.write_bool(False)
+                writer.write_hash(self.hash())
+                has_values = r.random() < 0.5
+                writer.write_bool(has_values)
+                if has_values:
+                    writer.write_hash(self.hash())
+                    writer.write_hash(self.hash())
+            if r.random() < 0.5:
+                writer.write_byte(r.randint(1, 3))
+                writer.write_string('rt')
+                writer.write_hash(self.hash())
+            else:
+                writer.write_byte(0)
+
+    def value(self, writer: BinaryWriter, ty: str, depth: int):
+        r = self.random
+        if ty == 'string':
+            writer.write_string(r.choice(['', 'abc', 'Hello 世界', 'x' * r.randint(0, 40), '"quote"\n']))
+        elif ty == 'bool':
+            writer.write_bool(r.random() < 0.5)
+        elif ty == 'uint':
+            writer.write_uleb128(r.choice([0, 1, 127, 128, 300, 1 << 20, (1 << 32) - 1, r.randint(0, 100000)]))
+        elif ty in ('int', 'FixPoint'):
+            writer.write_sleb128(r.choice([0, -1, 1, -64, 63, 64, -(1 << 33), r.randint(-100000, 100000)]))
+        elif ty == 'float':
+            writer.write_float(r.uniform(-100, 100))
+        elif ty == 'double':
+            writer.write_double(r.uniform(-100, 100))
+        elif ty == 'byte':
+            writer.write_byte(r.randint(0, 255))
+        elif ty in ('TextID', 'StringHash'):
+            writer.write_hash(self.hash())
+        elif ty.startswith('MVector'):
+            for _ in range(int(ty[7])):
+                writer.write_float(r.uniform(-1, 1))
+        elif ty == 'DynamicFloat':
+            self.dynamic_float(writer)
+        elif ty == 'DynamicValue':
+            self.dynamic_value(writer)
+        elif ty == 'DKEHIOFECJD':
+            self.dynamic_values(writer)
+        elif ty in self._enums:
+            _, value_type, values = self._enums[ty]
+            value = r.choice(values)[1]
+            if value_type == 'int':
+                writer.write_sleb128(value)
+            else:
+                writer.write_uleb128(value)
+        elif ty in self._classes:
+            self.object(writer, ty, True, depth + 1)
+        else:
+            raise ValueError(f'Unknown type {ty}')
+
+    def object(self, writer: BinaryWriter, name: str, parse_derivation: bool, depth: int = 0, override: dict = None):
+        """
+        :param override: Field name to a function writing the value of the field. These fields are always present
+        """
+        r = self.random
+        if parse_derivation and name in self._derivations:
+            choices = [name] + self._derivations[name]
+            if depth > 3:
+                # Keep the nesting bounded
+                choices = [c for c in choices if c in ('ChangePropState', 'DamageTask', 'TaskConfig')]
+            sub = r.choice(choices)
+            writer.write_uleb128(0 if sub == name else self._derivations[name].index(sub) + 1)
+            return self.object(writer, sub, False, depth)
+        if name == 'ChangePropState':
+            # Special cased by the decoder, no field mask
+            return
+        fields = self._fields(name)
+        mask = 0
+        for i, (_, field_name, _) in enumerate(fields):
+            if (override and field_name in override) or r.random() < (0.75 if depth < 4 else 0.2):
+                mask |= 1 << i
+        writer.write_uleb128(mask)
+        for i, (ty, field_name, kind) in enumerate(fields):
+            if not mask & (1 << i):
+                continue
+            if override and field_name in override:
+                override[field_name](writer)
+            elif kind == '[]':
+                count = r.randint(0, 4 if depth < 3 else 1)
+                writer.write_array_len(count)
+                for _ in range(count):
+                    self.value(writer, ty, depth)
+            elif kind.startswith('generic:'):
+                key_type, value_type = [t.strip() for t in kind[8:].split(',')]
+                count = r.randint(0, 3)
+                writer.write_sleb128(count)
+                for j in range(count):
+                    if key_type == 'string':
+                        writer.write_string(f'k{j}')
+                    else:
+                        writer.write_uleb128(j)
+                    self.value(writer, value_type, depth)
+            else:
+                self.value(writer, ty, depth)
+
+
+def _get_chunk_path(item: str) -> str:
+    return 'BakedConfig/' + item[:item.rfind('.')] + '.bytes'
+
+
+def generate_chunks(generator: SyntheticGenerator, configs: int, rows: int, texts: int,
+                    stories: int) -> Tuple[Dict[str, bytes], Dict[str, List[str]]]:
+    """
+    :return: Chunk name to content, and the config manifest
+    """
+    chunks = {}
+    for excel, path in EXCELS.items():
+        writer = BinaryWriter()
+        if excel == 'PerformanceC':
+            writer.write_array_len(stories)
+            for i in range(stories):
+                story = f'Config/Level/Story/Story_{i}.json'
+                generator.object(writer, 'PerformanceCRow', False, override={
+                    'PerformanceID': lambda w, i=i: w.write_uleb128(i + 1000),
+                    'PerformancePath': lambda w, story=story: w.write_string(story)})
+        else:
+            writer.write_array_len(rows)
+            for _ in range(rows):
+                generator.object(writer, excel + 'Row', False)
+        chunks[path] = writer.getvalue()
+    for i in range(stories):
+        writer = BinaryWriter()
+        generator.object(writer, 'LevelGraphConfig', True)
+        chunks[_get_chunk_path(f'Config/Level/Story/Story_{i}.json')] = writer.getvalue()
+    manifest = {'AdventureAbilityConfigList': [], 'LevelConfigList': []}
+    for i in range(configs):
+        writer = BinaryWriter()
+        if i % 2 == 0:
+            item = f'Config/Ability/Adventure_{i}.json'
+            generator.object(writer, 'AdventureAbilityConfigList', True)
+            manifest['AdventureAbilityConfigList'].append(item)
+        else:
+            item = f'Config/Level/Graph_{i}.json'
+            generator.object(writer, 'LevelGraphConfig', True)
+            manifest['LevelConfigList'].append(item)
+        chunks[_get_chunk_path(item)] = writer.getvalue()
+    for language in LANGUAGES:
+        writer = BinaryWriter()
+        writer.write_array_len(texts)
+        for i in range(texts):
+            has_param = generator.random.random() < 0.3
+            writer.write_uleb128(0b111 if has_param else 0b011)
+            writer.write_hash(get_stable_hash(f'text_{i}') >> 2)
+            writer.write_string(f'[{language}] text #{i} ' + 'é' * generator.random.randint(0, 5))
+            if has_param:
+                writer.write_bool(generator.random.random() < 0.5)
+        chunks[f'BakedConfig/ExcelOutput/Textmap_{language}.bytes'] = writer.getvalue()
+    return chunks, manifest
+
+
+def write_design(design_dir: str, chunks: Dict[str, bytes], manifest: Dict[str, List[str]], rnd: random.Random,
+                 containers: int = 4):
+    """
+    Pack chunks into containers named after their md5, with random gaps between chunks, and write the index.
+    The manifest is read as a whole file by ConfigLoader, so it gets a container of its own.
+    """
+    os.makedirs(design_dir, exist_ok=True)
+    names = list(chunks)
+    rnd.shuffle(names)
+    file_entries = []
+    for i in range(containers):
+        blob = bytearray(rnd.randbytes(16))
+        entries = []
+        for name in names[i::containers]:
+            entries.append((get_stable_hash(name), len(chunks[name]), len(blob)))
+            blob += chunks[name]
+            blob += rnd.randbytes(rnd.randint(0, 8))
+        md5 = hashlib.md5(blob).digest()
+        with open(os.path.join(design_dir, md5.hex() + '.bytes'), 'wb') as f:
+            f.write(blob)
+        rnd.shuffle(entries)
+        file_entries.append((i + 1, md5, len(blob), entries))
+    data = json.dumps(manifest).encode('utf-8')
+    md5 = hashlib.md5(data).digest()
+    with open(os.path.join(design_dir, md5.hex() + '.bytes'), 'wb') as f:
+        f.write(data)
+    file_entries.append((containers + 1, md5, len(data),
+                         [(get_stable_hash('BakedConfig/ConfigManifest.json'), len(data), 0)]))
+    writer = BinaryWriter()
+    writer.write_bytes(bytes(8))
+    writer.write_b_uint(len(file_entries))
+    writer.write_bytes(bytes(4))
+    for hash_, md5, size, entries in file_entries:
+        writer.write_b_int(hash_)
+        writer.write_bytes(md5)
+        writer.write_b_ulong(size)
+        writer.write_b_uint(len(entries))
+        for entry_hash, entry_size, entry_offset in entries:
+            writer.write_b_int(entry_hash)
+            writer.write_b_uint(entry_size)
+            writer.write_b_uint(entry_offset)
+        writer.write_byte(0)
+    with open(os.path.join(design_dir, 'DesignV_0123456789abcdef.bytes'), 'wb') as f:
+        f.write(writer.getvalue())
+
+
+def build(output: str, seed: int = 1, is_beta: bool = False, configs: int = 40, rows: int = 200, texts: int = 500,
+          stories: int = 30, pad_classes: int = 50) -> Dict[str, bytes]:
+    """
+    Write dump.cs, design/ and excel_map.json into output.
+    :return: The generated chunks, without the manifest
+    """
+    os.makedirs(output, exist_ok=True)
+    write_dump_cs(os.path.join(output, 'dump.cs'), pad_classes)
+    generator = SyntheticGenerator(seed, is_beta)
+    chunks, manifest = generate_chunks(generator, configs, rows, texts, stories)
+    write_design(os.path.join(output, 'design'), chunks, manifest, generator.random)
+    with open(os.path.join(output, 'excel_map.json'), 'w', encoding='utf-8') as f:
+        json.dump({'mapping': EXCELS}, f, indent=2)
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic design data')
+    parser.add_argument('output', help='Output folder')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--beta', help='Encode dynamic floats in beta mode', action='store_true', default=False)
+    parser.add_argument('--configs', help='Number of configs', type=int, default=40)
+    parser.add_argument('--rows', help='Number of rows per excel', type=int, default=200)
+    parser.add_argument('--texts', help='Number of entries per textmap', type=int, default=500)
+    parser.add_argument('--stories', help='Number of stories', type=int, default=30)
+    parser.add_argument('--pad-classes', help='Number of unrelated classes in dump.cs', type=int, default=50)
+    args = parser.parse_args()
+    chunks = build(args.output, args.seed, args.beta, args.configs, args.rows, args.texts, args.stories,
+                   args.pad_classes)
+    print(f'Wrote {len(chunks)} chunks, {sum(len(c) for c in chunks.values())} bytes to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,86 +1,221 @@
 import io
 import struct
-import ctypes
+
+_float = struct.Struct('<f')
+_double = struct.Struct('<d')
+_b_uint = struct.Struct('>I')
+_b_int = struct.Struct('>i')
+_b_ulong = struct.Struct('>Q')
+_b_long = struct.Struct('>q')
 
 
 class BinaryReader:
+    """
+    Cursor based reader over a bytes-like buffer. Memoryviews (e.g. slices of a mapped container) are not copied.
+    """
+
     def __init__(self, path=None, buffer=None):
+        self._pos = 0
         if path is not None:
             with open(path, 'rb') as f:
-                self._buffer = io.BytesIO(f.read())
+                self._buffer = f.read()
         elif buffer is not None:
-            if isinstance(buffer, bytes):
-                self._buffer = io.BytesIO(buffer)
-            elif isinstance(buffer, bytearray):
-                self._buffer = io.BytesIO(bytes(buffer))
-            elif isinstance(buffer, io.BytesIO):
+            if isinstance(buffer, (bytes, bytearray)):
                 self._buffer = buffer
+            elif isinstance(buffer, memoryview):
+                self._buffer = buffer.cast('B') if buffer.format != 'B' else buffer
+            elif isinstance(buffer, io.BytesIO):
+                # Reading continues where the stream is, positions stay those of the stream
+                self._buffer = buffer.getvalue()
+                self._pos = buffer.tell()
             else:
-                raise ValueError("Buffer must be bytes, bytearray or BytesIO")
+                raise ValueError("Buffer must be bytes, bytearray, memoryview or BytesIO")
         else:
             raise ValueError("Either path or buffer must be specified")
+        self._len = len(self._buffer)
+
+    def __len__(self):
+        return self._len
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, pos: int):
+        self._pos = pos
 
     def read_byte(self):
-        return self._buffer.read(1)[0]
+        pos = self._pos
+        value = self._buffer[pos]
+        self._pos = pos + 1
+        return value
 
     def read_bytes(self, length: int):
-        return self._buffer.read(length)
+        pos = self._pos
+        end = min(pos + length, self._len)
+        self._pos = end
+        return bytes(self._buffer[pos:end])
 
     def read_uleb128(self) -> int:
-        result = 0
-        shift = 0
+        buf = self._buffer
+        pos = self._pos
+        byte = buf[pos]
+        pos += 1
+        if byte < 0x80:
+            self._pos = pos
+            return byte
+        result = byte & 0x7f
+        shift = 7
         while True:
-            byte = self.read_byte()
+            byte = buf[pos]
+            pos += 1
             result |= (byte & 0x7f) << shift
-            if byte & 0x80 == 0:
-                break
+            if byte < 0x80:
+                self._pos = pos
+                return result
             shift += 7
-        return result
 
     def read_string(self):
         length = self.read_uleb128()
-        return self._buffer.read(length).decode('utf-8')
+        pos = self._pos
+        end = min(pos + length, self._len)
+        self._pos = end
+        return str(self._buffer[pos:end], 'utf-8')
 
     def read_float(self) -> float:
-        return struct.unpack('f', self._buffer.read(4))[0]
+        value = _float.unpack_from(self._buffer, self._pos)[0]
+        self._pos += 4
+        return value
 
     def read_double(self) -> float:
-        return struct.unpack('d', self._buffer.read(8))[0]
+        value = _double.unpack_from(self._buffer, self._pos)[0]
+        self._pos += 8
+        return value
 
     def read_sleb128(self) -> int:
         value = self.read_uleb128()
-        sign = value & 1
-        value >>= 1
-        return value if sign == 0 else ctypes.c_int64(~(value - 1)).value
+        if value & 1:
+            # Magnitude with sign bit, wrapped to int64 like the game does
+            value = -(value >> 1) & 0xFFFFFFFFFFFFFFFF
+            return value - 0x10000000000000000 if value & 0x8000000000000000 else value
+        return value >> 1
 
     def read_bool(self) -> bool:
-        return self.read_byte() != 0
+        pos = self._pos
+        value = self._buffer[pos] != 0
+        self._pos = pos + 1
+        return value
 
     def read_b_uint(self) -> int:
-        return struct.unpack('>I', self._buffer.read(4))[0]
+        value = _b_uint.unpack_from(self._buffer, self._pos)[0]
+        self._pos += 4
+        return value
 
     def read_b_int(self) -> int:
-        return struct.unpack('>i', self._buffer.read(4))[0]
+        value = _b_int.unpack_from(self._buffer, self._pos)[0]
+        self._pos += 4
+        return value
 
     def read_b_ulong(self) -> int:
-        return struct.unpack('>Q', self._buffer.read(8))[0]
+        value = _b_ulong.unpack_from(self._buffer, self._pos)[0]
+        self._pos += 8
+        return value
 
     def read_b_long(self) -> int:
-        return struct.unpack('>q', self._buffer.read(8))[0]
+        value = _b_long.unpack_from(self._buffer, self._pos)[0]
+        self._pos += 8
+        return value
 
     def read_hash(self) -> int:
-        value = ctypes.c_int(self.read_uleb128()).value
-        return ctypes.c_int((value & 1) ^ (value >> 1)).value
+        value = self.read_uleb128() & 0xFFFFFFFF
+        if value & 0x80000000:
+            value -= 0x100000000
+        return (value & 1) ^ (value >> 1)
 
     def read_array_len(self) -> int:
         return self.read_uleb128() // 2
 
+    # Bulk readers of primitive arrays, count elements each. They read the same as count single reads
+
+    def read_uleb128_array(self, count: int) -> list:
+        buf = self._buffer
+        pos = self._pos
+        values = []
+        append = values.append
+        for _ in range(count):
+            byte = buf[pos]
+            pos += 1
+            if byte < 0x80:
+                append(byte)
+                continue
+            result = byte & 0x7f
+            shift = 7
+            while True:
+                byte = buf[pos]
+                pos += 1
+                result |= (byte & 0x7f) << shift
+                if byte < 0x80:
+                    break
+                shift += 7
+            append(result)
+        self._pos = pos
+        return values
+
+    def read_sleb128_array(self, count: int) -> list:
+        values = self.read_uleb128_array(count)
+        for idx, value in enumerate(values):
+            if value & 1:
+                value = -(value >> 1) & 0xFFFFFFFFFFFFFFFF
+                values[idx] = value - 0x10000000000000000 if value & 0x8000000000000000 else value
+            else:
+                values[idx] = value >> 1
+        return values
+
+    def read_hash_array(self, count: int) -> list:
+        values = self.read_uleb128_array(count)
+        for idx, value in enumerate(values):
+            value &= 0xFFFFFFFF
+            if value & 0x80000000:
+                value -= 0x100000000
+            values[idx] = (value & 1) ^ (value >> 1)
+        return values
+
+    def read_float_array(self, count: int) -> list:
+        values = list(struct.unpack_from(f'<{count}f', self._buffer, self._pos))
+        self._pos += 4 * count
+        return values
+
+    def read_double_array(self, count: int) -> list:
+        values = list(struct.unpack_from(f'<{count}d', self._buffer, self._pos))
+        self._pos += 8 * count
+        return values
+
+    def read_byte_array(self, count: int) -> list:
+        pos = self._pos
+        if pos + count > self._len:
+            raise IndexError('Array is out of range')
+        self._pos = pos + count
+        return list(self._buffer[pos:pos + count])
+
+    def read_bool_array(self, count: int) -> list:
+        return [value != 0 for value in self.read_byte_array(count)]
+
     def read_all(self) -> bytes:
-        self.reset()
-        return self._buffer.read()
+        self._pos = self._len
+        return bytes(self._buffer)
 
     def skip(self, length: int):
-        self._buffer.seek(length, io.SEEK_CUR)
+        self._pos += length
+
+    def skip_uleb128(self):
+        buf = self._buffer
+        pos = self._pos
+        while buf[pos] >= 0x80:
+            pos += 1
+        self._pos = pos + 1
+
+    def skip_string(self):
+        length = self.read_uleb128()
+        self._pos = min(self._pos + length, self._len)
 
     def reset(self):
-        self._buffer.seek(0)
+        self._pos = 0
@@ -0,0 +1,81 @@
+import struct
+
+_float = struct.Struct('<f')
+_double = struct.Struct('<d')
+_b_uint = struct.Struct('>I')
+_b_int = struct.Struct('>i')
+_b_ulong = struct.Struct('>Q')
+_b_long = struct.Struct('>q')
+
+
+class BinaryWriter:
+    """
+    Encoder mirroring BinaryReader, every write_x produces bytes that read_x decodes back to the same value.
+    Used to build synthetic design data for benchmarks.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def tell(self) -> int:
+        return len(self._buffer)
+
+    def getvalue(self) -> bytes:
+        return bytes(self._buffer)
+
+    def write_byte(self, value: int):
+        self._buffer.append(value & 0xFF)
+
+    def write_bytes(self, data: bytes):
+        self._buffer += data
+
+    def write_uleb128(self, value: int):
+        if value < 0:
+            raise ValueError(f'Negative value for uleb128: {value}')
+        buf = self._buffer
+        while value >= 0x80:
+            buf.append((value & 0x7f) | 0x80)
+            value >>= 7
+        buf.append(value)
+
+    def write_sleb128(self, value: int):
+        # Magnitude with sign bit, see BinaryReader.read_sleb128
+        self.write_uleb128(((-value) << 1) | 1 if value < 0 else value << 1)
+
+    def write_string(self, value: str):
+        data = value.encode('utf-8')
+        self.write_uleb128(len(data))
+        self._buffer += data
+
+    def write_float(self, value: float):
+        self._buffer += _float.pack(value)
+
+    def write_double(self, value: float):
+        self._buffer += _double.pack(value)
+
+    def write_bool(self, value: bool):
+        self._buffer.append(1 if value else 0)
+
+    def write_b_uint(self, value: int):
+        self._buffer += _b_uint.pack(value)
+
+    def write_b_int(self, value: int):
+        self._buffer += _b_int.pack(value)
+
+    def write_b_ulong(self, value: int):
+        self._buffer += _b_ulong.pack(value)
+
+    def write_b_long(self, value: int):
+        self._buffer += _b_long.pack(value)
+
+    def write_hash(self, value: int):
+        # read_hash decodes an even value to value >> 1, so only 31 bit signed hashes round trip
+        if not -0x40000000 <= value < 0x40000000:
+            raise ValueError(f'Hash out of the encodable range: {value}')
+        self.write_uleb128((value << 1) & 0xFFFFFFFF)
+
+    def write_array_len(self, length: int):
+        self.write_uleb128(length * 2)
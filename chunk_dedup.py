@@ -0,0 +1,127 @@
+import hashlib
+import os
+import shutil
+from typing import Callable, Dict, Hashable, List, Optional, Tuple, TypeVar
+from design_index_loader import DesignConfigEntry, DesignIndexLoader
+from logger import get_logger
+
+logger = get_logger('ChunkDeduplicator')
+
+T = TypeVar('T')
+
+DEDUP_MODES = ['copy', 'link', 'off']
+
+
+class ChunkDeduplicator:
+    """
+    Find work items whose chunks have identical content, so each distinct payload is decoded and serialized once
+    and its output is reused for the duplicates.
+    Content is only hashed for chunks whose size collides with another one of the same variant.
+    """
+
+    def __init__(self, design: DesignIndexLoader, mode: str = 'copy'):
+        """
+        :param mode: How outputs are reused. copy, link for hardlinks (falls back to copy), or off
+        """
+        if mode not in DEDUP_MODES:
+            raise ValueError(f'Unknown dedup mode {mode}')
+        self._design = design
+        self.mode = mode
+        # phase -> [decodes saved, outputs linked, outputs copied, bytes reused]
+        self._stats: Dict[str, List[int]] = {}
+
+    @staticmethod
+    def digest(chunk) -> str:
+        return hashlib.blake2b(chunk, digest_size=16).hexdigest()
+
+    def split(self, items: List[T], get_name: Callable[[T], Optional[str]],
+              get_variant: Callable[[T], Hashable]) -> Tuple[List[T], List[Tuple[T, T]]]:
+        """
+        :param items: Work items, in the order they should be processed
+        :param get_name: Map an item to the name of the chunk it reads
+        :param get_variant: Anything besides the chunk that affects the output, e.g. the class it is decoded as
+        :return: Items to process in their original order, and (duplicate, original) pairs.
+                 Items without a chunk are always processed
+        """
+        if self.mode == 'off':
+            return items, []
+        by_size: Dict[tuple, List[Tuple[int, DesignConfigEntry]]] = {}
+        skipped = set()
+        for idx, item in enumerate(items):
+            name = get_name(item)
+            entry = self._design.find_entry(name) if name else None
+            if entry is not None:
+                by_size.setdefault((get_variant(item), entry.size), []).append((idx, entry))
+        duplicates = []
+        for (variant, _), group in by_size.items():
+            if len(group) == 1:
+                continue
+            originals: Dict[str, int] = {}
+            for idx, entry in group:
+                original = originals.setdefault(self.digest(self._design.get_chunk(entry)), idx)
+                if original != idx:
+                    duplicates.append((items[idx], items[original]))
+                    skipped.add(idx)
+        return [item for idx, item in enumerate(items) if idx not in skipped], duplicates
+
+    def reuse_file(self, src: str, dst: str) -> Optional[Tuple[str, int]]:
+        """
+        Reuse an output file, by hardlink in link mode or by copy.
+        :return: same, link or copy, and the size of the output. None on failure
+        """
+        if os.path.abspath(src) == os.path.abspath(dst):
+            return 'same', 0
+        tmp_path = f'{dst}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
+            method = 'copy'
+            if self.mode == 'link':
+                try:
+                    os.link(src, tmp_path)
+                    method = 'link'
+                except OSError:
+                    pass
+            if method == 'copy':
+                shutil.copyfile(src, tmp_path)
+            os.replace(tmp_path, dst)
+            return method, os.path.getsize(dst)
+        except OSError as e:
+            logger.warning(f'Failed to reuse output {src} for {dst}. Error: {e}')
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+
+    def replicate(self, phase: str, duplicates: List[Tuple[T, T]], results: Dict[T, bool],
+                  get_output: Callable[[T], str],
+                  reuse: Callable[[str, str], Optional[Tuple[str, int]]] = None) -> List[bool]:
+        """
+        Reuse the outputs of the originals for their duplicates.
+        :param results: Result of every processed original
+        :param reuse: Reuse the output of an original for a duplicate, reuse_file by default
+        :return: Result of every duplicate. A duplicate fails if its original failed
+        """
+        reuse = reuse or self.reuse_file
+        stats = self._stats.setdefault(phase, [0, 0, 0, 0])
+        ret = []
+        for item, original in duplicates:
+            reused = None
+            if results.get(original, False):
+                reused = reuse(get_output(original), get_output(item))
+                if reused is not None:
+                    method, size = reused
+                    stats[0] += 1
+                    if method != 'same':
+                        stats[1 if method == 'link' else 2] += 1
+                        stats[3] += size
+            ret.append(reused is not None)
+        if duplicates:
+            logger.info(f'Skipped {stats[0]} decodes of identical {phase} chunks. Outputs reused: {stats[1]} linked, '
+                        f'{stats[2]} copied, {stats[3]} bytes.')
+        return ret
+
+    def report(self) -> dict:
+        """
+        :return: Per phase, decodes saved and how the outputs were reused. Linked outputs are writes saved as well
+        """
+        return {phase: {'decodes_saved': decodes, 'writes_saved': linked, 'copied': copied, 'bytes_reused': size}
+                for phase, (decodes, linked, copied, size) in self._stats.items()}
@@ -1,10 +1,36 @@
+import hashlib
 import json
+import os
+import pickle
 import re
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Set
 from logger import get_logger
 
 log = get_logger('ClassLoader')
 
+# Bump when the parser output or the layout of the cached fields changes
+SCHEMA_CACHE_VERSION = 1
+# Precompiled patterns of the dump.cs scanner
+NAMESPACE_PREFIX = '// Namespace: '
+CLASS_DECL_PATTERN = re.compile(r'public(?: .*)? class ([a-zA-Z0-9_]+(?:\.[a-zA-Z0-9_]+)?)(?: : ([a-zA-Z0-9_]+))?')
+FIELD_PATTERN = re.compile(r'public ([a-zA-Z0-9_]+)(\[])? ([a-zA-Z0-9_]+);')
+GENERIC_FIELD_PATTERN = re.compile(r'public(?: readonly)? (\w+)<([\w.,\s]+)> (\w+);')
+ROW_METHOD_PATTERN = re.compile(
+    r'public static void [A-Z]+\(Dictionary<string, int> [A-Z]+, string\[] [A-Z]+, out ([a-zA-Z0-9]+)Row [A-Z]+\) \{ }')
+ENUM_DECL_PATTERN = re.compile(r'public enum ([a-zA-Z0-9_]+)')
+ENUM_CONST_PATTERN = re.compile(r'public const ([a-zA-Z0-9_]+) ([a-zA-Z0-9_]+) = (-?[0-9]+);')
+ENUM_VALUE_TYPE_PATTERN = re.compile(r'public (\w+) value__;')
+
+SCHEMA_CACHE_FIELDS = [
+    '_classes',
+    '_enums',
+    '_base_classes',
+    '_rev_base_class',
+    '_excel_row_class',
+    '_cls_index',
+    '_dyn_value_decl',
+]
+
 BLACK_LIST = {
     'TaskConfig': [
         'LevelShowDialog',
@@ -60,7 +86,13 @@ class EnumDecl:
 
 
 class ClassLoader:
-    def __init__(self, header_file: str, index_file: str = None):
+    def __init__(self, header_file: str, index_file: str = None, use_cache: bool = True, cache_path: str = None):
+        """
+        :param header_file: dump.cs from Il2CppDumper
+        :param index_file: Optional json file of derivation class index
+        :param use_cache: Load the parsed schema from cache file if dump.cs and index file are unchanged
+        :param cache_path: Path of the schema cache file. Default to dump.cs path with .schema.cache suffix
+        """
         self._classes: Dict[str, List[FieldDecl]] = {}
         self._enums: Dict[str, EnumDecl] = {}
         self._base_classes: Dict[str, str] = {}
@@ -68,32 +100,139 @@ class ClassLoader:
         self._excel_row_class: List[str] = []
         self._cur_namespace = ''
         self._dyn_value_decl = ''
-        with open(header_file, 'r', encoding='utf-8') as f:
-            self.header_raw = f.readlines()
+        self.header_file = header_file
+        self.index_file = index_file
+        self.use_cache = use_cache
+        self.cache_path = cache_path if cache_path else header_file + '.schema.cache'
+        self._schema_key = None
+        if use_cache:
+            self._schema_key = self._get_cache_key()
+            if self._load_cache(self._schema_key):
+                return
         if index_file is not None:
             with open(index_file, 'r', encoding='utf-8') as f:
                 self._cls_index = json.load(f)
         else:
             self._cls_index = {}
-        self._idx = 0
-        self._len = len(self.header_raw)
         self.parse()
         self._guess_derivation_idx()
         self._find_dyn_value()
+        if use_cache:
+            self._save_cache(self._schema_key)
+
+    @property
+    def schema_key(self) -> str:
+        """
+        Content hash of dump.cs and the class index file
+        """
+        if self._schema_key is None:
+            self._schema_key = self._get_cache_key()
+        return self._schema_key
+
+    def _get_cache_key(self) -> str:
+        digest = hashlib.sha1(str(SCHEMA_CACHE_VERSION).encode())
+        for path in [self.header_file, self.index_file]:
+            if path is None:
+                digest.update(b'\0')
+                continue
+            with open(path, 'rb') as f:
+                while True:
+                    block = f.read(1 << 20)
+                    if not block:
+                        break
+                    digest.update(block)
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _load_cache(self, cache_key: str) -> bool:
+        if not os.path.isfile(self.cache_path):
+            return False
+        try:
+            with open(self.cache_path, 'rb') as f:
+                cache = pickle.load(f)
+        except Exception as e:
+            log.warning(f'Failed to load schema cache {self.cache_path}. Error: {e}')
+            return False
+        if not isinstance(cache, dict) or cache.get('version') != SCHEMA_CACHE_VERSION:
+            log.info('Schema cache version mismatch. Reparse dump.cs')
+            return False
+        if cache.get('key') != cache_key:
+            log.info('dump.cs or class index changed since last run. Reparse dump.cs')
+            return False
+        try:
+            schema = {name: cache['schema'][name] for name in SCHEMA_CACHE_FIELDS}
+        except (KeyError, TypeError) as e:
+            log.warning(f'Schema cache {self.cache_path} is incomplete. Error: {e!r}. Reparse dump.cs')
+            return False
+        for name, value in schema.items():
+            setattr(self, name, value)
+        log.info(f'Loaded {len(self._classes)} classes and {len(self._enums)} enums from schema cache')
+        return True
+
+    def _save_cache(self, cache_key: str):
+        cache = {
+            'version': SCHEMA_CACHE_VERSION,
+            'key': cache_key,
+            'schema': {name: getattr(self, name) for name in SCHEMA_CACHE_FIELDS},
+        }
+        tmp_path = f'{self.cache_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+            # Atomic replace, other processes may be reading or writing the same cache
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            log.warning(f'Failed to save schema cache {self.cache_path}. Error: {e}')
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
     def parse(self):
-        while self._idx < self._len:
-            line = self.header_raw[self._idx]
-            # TODO: Use dump from frida-il2cpp-bridge instead of this shit
-            pat = re.search('^// Namespace: (.*)', line)
-            if pat:
-                self._cur_namespace = pat[1]
-            if re.search('public(.*)? class', line) is not None:
-                self._load_class()
-            elif line.startswith('public enum'):
-                self._load_enum()
-            else:
-                self._idx += 1
+        """
+        Scan dump.cs line by line in a single pass. Only the class or enum being declared is kept in memory.
+        """
+        # TODO: Use dump from frida-il2cpp-bridge instead of this shit
+        class_name = None
+        class_decl = None
+        first_body_line = False
+        enum_decl = None
+        with open(self.header_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if class_decl is not None:
+                    if first_body_line:
+                        first_body_line = False
+                        if line.startswith('{}'):
+                            # Fix empty class decl
+                            self._classes[class_name] = class_decl
+                            class_decl = None
+                    if class_decl is not None:
+                        if not line.startswith('}'):
+                            self._parse_class_line(line, class_decl)
+                            continue
+                        self._classes[class_name] = class_decl
+                        class_decl = None
+                elif enum_decl is not None:
+                    if not line.startswith('}'):
+                        self._parse_enum_line(line, enum_decl)
+                        continue
+                    self._enums[enum_decl.name] = enum_decl
+                    enum_decl = None
+
+                if line.startswith(NAMESPACE_PREFIX):
+                    self._cur_namespace = line[len(NAMESPACE_PREFIX):].rstrip('\n')
+                idx = line.find('public')
+                if idx != -1 and line.find(' class', idx + 6) != -1:
+                    class_name = self._parse_class_decl(line)
+                    if class_name is not None:
+                        class_decl = []
+                        first_body_line = True
+                elif line.startswith('public enum'):
+                    pat = ENUM_DECL_PATTERN.search(line)
+                    if pat:
+                        enum_decl = EnumDecl(pat[1])
+        if class_decl is not None:
+            self._classes[class_name] = class_decl
+        if enum_decl is not None:
+            self._enums[enum_decl.name] = enum_decl
         self._excel_row_class = list(set(self._excel_row_class))
         log.info(f'Loaded {len(self._classes)} classes and {len(self._enums)} enums')
         log.info(f'Found {len(self._excel_row_class)} excel row classes')
@@ -155,6 +294,12 @@ class ClassLoader:
     def get_excel_classes(self):
         return self._excel_row_class
 
+    def get_field_names(self) -> Set[str]:
+        """
+        :return: Names of the fields of every class
+        """
+        return {field.name for fields in self._classes.values() for field in fields}
+
     def get_enum(self, name: str) -> EnumDecl:
         return self._enums.get(name, None)
 
@@ -191,61 +336,47 @@ class ClassLoader:
     def has_derivation_class(self, base_name: str) -> bool:
         return base_name in self._cls_index
 
-    def _load_class(self):
-        pat = re.search(r'public(?: .*)? class ([a-zA-Z0-9_]+(?:\.[a-zA-Z0-9_]+)?)(?: : ([a-zA-Z0-9_]+))?',
-                        self.header_raw[self._idx])
+    def _parse_class_decl(self, line: str) -> Optional[str]:
+        pat = CLASS_DECL_PATTERN.search(line)
         if pat is None:
-            log.warning('Fail to extract metadata from class decl: ' + self.header_raw[self._idx].strip())
-            self._idx += 1
-            return
+            log.warning('Fail to extract metadata from class decl: ' + line.strip())
+            return None
         class_name = pat[1]
         base_class = pat[2]
         # TODO: Skip other namespaces to avoid duplicate class name. May remove when using frida-il2cpp-bridge dump
         if class_name in self._classes and self._cur_namespace != 'RPG.GameCore':
-            self._idx += 1
-            return
+            return None
         if base_class is not None:
             self._base_classes[class_name] = base_class
             if base_class in self._rev_base_class:
                 self._rev_base_class[base_class].append(class_name)
             else:
                 self._rev_base_class[base_class] = [class_name]
-        class_decl = []
-        self._idx += 1
-        if self.header_raw[self._idx].startswith('{}'):
-            # Fix empty class decl
-            self._classes[class_name] = class_decl
+        return class_name
+
+    def _parse_class_line(self, line: str, class_decl: List[FieldDecl]):
+        if 'public ' not in line:
             return
-        while not self.header_raw[self._idx].startswith('}'):
-            pat = re.search(r'public ([a-zA-Z0-9_]+)(\[])? ([a-zA-Z0-9_]+);', self.header_raw[self._idx])
+        pat = FIELD_PATTERN.search(line)
+        if pat:
+            class_decl.append(FieldDecl(pat[3], pat[1], pat[2] is not None, False, None))
+        else:
+            pat = GENERIC_FIELD_PATTERN.search(line)
             if pat:
-                class_decl.append(FieldDecl(pat[3], pat[1], pat[2] is not None, False, None))
-            else:
-                pat = re.search(r'public(?: readonly)? (\w+)<([\w.,\s]+)> (\w+);', self.header_raw[self._idx])
-                if pat:
-                    class_decl.append(FieldDecl(pat[3], pat[1], False, True, pat[2]))
-            if 'Row' in self.header_raw[self._idx]:
-                pat = re.search(
-                    r'public static void [A-Z]+\(Dictionary<string, int> [A-Z]+, string\[] [A-Z]+, out ([a-zA-Z0-9]+)Row [A-Z]+\) \{ }',
-                    self.header_raw[self._idx])
-                if pat:
-                    self._excel_row_class.append(pat[1])
-            self._idx += 1
-        self._classes[class_name] = class_decl
-
-    def _load_enum(self):
-        pat = re.search(r'public enum ([a-zA-Z0-9_]+)', self.header_raw[self._idx])
-        if pat is None:
+                class_decl.append(FieldDecl(pat[3], pat[1], False, True, pat[2]))
+        if 'Row' in line:
+            pat = ROW_METHOD_PATTERN.search(line)
+            if pat:
+                self._excel_row_class.append(pat[1])
+
+    @staticmethod
+    def _parse_enum_line(line: str, enum_decl: EnumDecl):
+        if 'public ' not in line:
             return
-        enum_decl = EnumDecl(pat[1])
-        self._idx += 1
-        while not self.header_raw[self._idx].startswith('}'):
-            pat = re.search(rf'public const {enum_decl.name} ([a-zA-Z0-9_]+) = (-?[0-9]+);', self.header_raw[self._idx])
+        pat = ENUM_CONST_PATTERN.search(line)
+        if pat and pat[1] == enum_decl.name:
+            enum_decl.add(pat[2], int(pat[3]))
+        else:
+            pat = ENUM_VALUE_TYPE_PATTERN.search(line)
             if pat:
-                enum_decl.add(pat[1], int(pat[2]))
-            else:
-                pat = re.search(rf'public (\w+) value__;', self.header_raw[self._idx])
-                if pat:
-                    enum_decl.set_val_type(pat[1])
-            self._idx += 1
-        self._enums[enum_decl.name] = enum_decl
+                enum_decl.set_val_type(pat[1])
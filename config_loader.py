@@ -1,9 +1,21 @@
 import os
 import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Collection, Dict, FrozenSet, Iterator, List, Optional, Set, Tuple
 from design_index_loader import DesignIndexLoader
-from class_loader import ClassLoader, FieldDecl
+from class_loader import ClassLoader
 from binary_reader import BinaryReader
+from chunk_dedup import ChunkDeduplicator
+from decoder_compiler import DecodeError, DecoderCompiler
+from extraction_planner import ExtractionPlanner
+from excel_columns import ExcelColumns
+from excel_table import ExcelTable
+from extraction_state import ExtractionState
+from json_writer import DuplicateKeyError, JsonStreamWriter, atomic_open, dump_json
 from logger import get_logger
+from profiler import DecodeProfiler
+from sqlite_writer import SqliteWriter, to_json
 
 logger = get_logger('ConfigLoader')
 
@@ -23,21 +35,73 @@ CONFIG_MAP = {
     'GlobalTaskTemplateList': 'GlobalTaskListTemplateConfig',
 }
 
-ZIPPED_CLASS = {
-    'ChangePropState',
-    'SyncAllSubPropState',
-    'SyncSubPropState',
-    'LoopWaitBeHit',
-    'WaitPredicateSucc',
-    'ComparePropState',
+
+class ReadOnlyDict(dict):
+    """
+    Dict that can't be modified, for values shared by every decoded object. It still encodes as a JSON object,
+    and pickles and copies as a new ReadOnlyDict.
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError(f'{type(self).__name__} is shared and can\'t be modified, copy it with dict() first')
+
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+
+# Dynamic float expression ops by opcode. FixedNumber and DynamicNumber carry an operand, the others are
+# read-only dicts shared between all expressions
+EXPRESSION_OPS = ('FixedNumber', 'DynamicNumber', 'Add', 'Sub', 'Mul', 'Div', 'Neg', 'Floor', 'Round', 'Int')
+_OPERATORS = {code: ReadOnlyDict(Type=name) for code, name in enumerate(EXPRESSION_OPS) if code >= 2}
+_COMPACT_OPERATORS = {code: (name,) for code, name in enumerate(EXPRESSION_OPS) if code >= 2}
+# The beta analyzer drops Int
+_BETA_OPERATORS = {code: op for code, op in _OPERATORS.items() if code != 9}
+_BETA_COMPACT_OPERATORS = {code: op for code, op in _COMPACT_OPERATORS.items() if code != 9}
+
+# Dynamic value types by type code, and (value key, reader) of the scalar ones
+DYNAMIC_VALUE_TYPES = ('INT', 'FLOAT', 'BOOL', 'ARRAY', 'MAP', 'STRING', 'NULL')
+_SCALAR_VALUES = {
+    0: ('IntValue', BinaryReader.read_sleb128),
+    1: ('FloatValue', BinaryReader.read_float),
+    2: ('BoolValue', BinaryReader.read_bool),
+    5: ('StringValue', BinaryReader.read_string),
 }
+_NULL_VALUE = ReadOnlyDict(Type='NULL')
+_COMPACT_NULL_VALUE = (6, None)
 
 
 class ConfigLoader:
-    def __init__(self, design: DesignIndexLoader, cls: ClassLoader, is_beta: bool = True):
+    def __init__(self, design: DesignIndexLoader, cls: ClassLoader, is_beta: bool = True,
+                 state: ExtractionState = None, indent: Optional[int] = 2, fields: Collection[str] = None,
+                 profiler: DecodeProfiler = None, dedup: str = 'copy', db: SqliteWriter = None,
+                 compact_dynamic: bool = False):
+        """
+        :param design: Design index
+        :param cls: Class schema
+        :param is_beta: Parse in beta mode
+        :param state: Incremental extraction state. Chunks unchanged since the last run are skipped if provided
+        :param indent: Indent of the output JSON, None for compact output
+        :param fields: Only extract these top level fields of excel rows, configs and stories
+        :param profiler: Collect decode statistics of every class and field type if provided
+        :param dedup: How configs and stories with identical content reuse one output, see ChunkDeduplicator
+        :param db: Write excels, configs and stories to this database instead of JSON files
+        :param compact_dynamic: Decode dynamic floats and values as tuples instead of their JSON shape,
+                                see parse_dynamic_float_compact and parse_dynamic_value_compact
+        """
         self._design = design
         self._class = cls
         self._beta = is_beta
+        self._state = state
+        self._indent = indent
+        self._fields = self._projection(fields)
+        self._profiler = profiler
+        self._compact_dynamic = compact_dynamic
+        self._compiler = DecoderCompiler(self, profiler)
+        self._planner = ExtractionPlanner(design)
+        self._dedup = ChunkDeduplicator(design, dedup)
+        self._db = db
         try:
             with open(
                     os.path.join(design.dir_path, design.get_entry(name='BakedConfig/ConfigManifest.json').parent.filename),
@@ -45,11 +109,29 @@ class ConfigLoader:
                 self._manifest = json.load(f)
         except:
             self._manifest = {}
+        self.register_known_names()
+
+    def register_known_names(self):
+        """
+        Build the reverse name index of the design data from everything the extractor may look up:
+        manifest items and candidate paths of all excel classes.
+        """
+        names = [self.get_config_path(item) for items in self._manifest.values() for item in items]
+        for excel_name in self._class.get_excel_classes():
+            names.extend(self.get_excel_candidates(excel_name))
+        self._design.register_names(names)
 
-    def load_binary_config(self, s_config: str, base_class: str, dump: str = None):
+    @staticmethod
+    def get_config_path(s_config: str) -> str:
         idx = s_config.rfind('.')
-        s_config = 'BakedConfig/' + s_config[:idx] + '.bytes'
-        reader = self._design.get_reader(name=s_config)
+        return 'BakedConfig/' + s_config[:idx] + '.bytes'
+
+    @staticmethod
+    def _projection(fields: Optional[Collection[str]]) -> Optional[FrozenSet[str]]:
+        return frozenset(fields) if fields is not None else None
+
+    def load_binary_config(self, s_config: str, base_class: str, dump: str = None, fields: Collection[str] = None):
+        reader = self._design.get_reader(name=self.get_config_path(s_config))
         if dump:
             try:
                 with open(dump, 'wb') as f:
@@ -57,33 +139,43 @@ class ConfigLoader:
             except:
                 pass
             reader.reset()
-        return self.load_class(reader, base_class)
+        return self.load_class(reader, base_class, fields=fields)
 
-    def _try_get_binary_excel_reader(self, base_class: str):
-        reader = self._design.get_reader(name=f'BakedConfig/ExcelOutput/{base_class}.bytes')
-        if reader is not None:
-            return reader
-        reader = self._design.get_reader(name=f'BakedConfig/ExcelOutputGameCore/{base_class}.bytes')
-        if reader is not None:
-            return reader
+    @staticmethod
+    def get_excel_candidates(base_class: str) -> List[str]:
+        candidates = [
+            f'BakedConfig/ExcelOutput/{base_class}.bytes',
+            f'BakedConfig/ExcelOutputGameCore/{base_class}.bytes',
+        ]
         if base_class.endswith('Config'):
             base_class = base_class[:-6]
-            reader = self._design.get_reader(name=f'BakedConfig/ExcelOutput/{base_class}.bytes')
-            if reader is not None:
-                return reader
-            reader = self._design.get_reader(name=f'BakedConfig/ExcelOutputGameCore/{base_class}.bytes')
-            if reader is not None:
-                return reader
+            candidates.append(f'BakedConfig/ExcelOutput/{base_class}.bytes')
+            candidates.append(f'BakedConfig/ExcelOutputGameCore/{base_class}.bytes')
         else:
-            reader = self._design.get_reader(name=f'BakedConfig/ExcelOutput/{base_class}Config.bytes')
-            if reader is not None:
-                return reader
-            reader = self._design.get_reader(name=f'BakedConfig/ExcelOutputGameCore/{base_class}Config.bytes')
+            candidates.append(f'BakedConfig/ExcelOutput/{base_class}Config.bytes')
+            candidates.append(f'BakedConfig/ExcelOutputGameCore/{base_class}Config.bytes')
+        return candidates
+
+    def find_excel_path(self, base_class: str) -> Optional[str]:
+        for name in self.get_excel_candidates(base_class):
+            if self._design.find_entry(name) is not None:
+                return name
+        return None
+
+    def _try_get_binary_excel_reader(self, base_class: str):
+        for name in self.get_excel_candidates(base_class):
+            reader = self._design.get_reader(name=name)
             if reader is not None:
                 return reader
         return None
 
-    def load_binary_excel(self, base_class: str, s_path: str = None):
+    def iter_binary_excel(self, base_class: str, s_path: str = None,
+                          fields: Collection[str] = None) -> Optional[Iterator[Tuple[str, dict]]]:
+        """
+        Decode the rows of an excel one by one.
+        :param fields: Only decode these fields of each row. The key field is always decoded
+        :return: Iterator of (key, row), or None if the excel is not found
+        """
         if not s_path:
             reader = self._try_get_binary_excel_reader(base_class)
         else:
@@ -93,227 +185,621 @@ class ConfigLoader:
         arr_len = reader.read_array_len()
         logger.info(f'{base_class} excel item count: {arr_len}')
         index_field = self._class.get_class(base_class + 'Row')[0].name
-        result = {}
+        if fields is not None:
+            fields = self._projection(fields) | {index_field}
+        return self._iter_excel_rows(reader, base_class + 'Row', index_field, arr_len, fields)
+
+    def _iter_excel_rows(self, reader: BinaryReader, row_class: str, index_field: str, arr_len: int,
+                         fields: Optional[FrozenSet[str]]):
         for _ in range(arr_len):
             data = {index_field: _}
-            data.update(self.load_class(reader, base_class + 'Row', False, False))
-            result[str(data[index_field])] = data
-        return result
+            data.update(self.load_class(reader, row_class, False, False, fields))
+            yield str(data[index_field]), data
+
+    def load_binary_excel(self, base_class: str, s_path: str = None, fields: Collection[str] = None):
+        rows = self.iter_binary_excel(base_class, s_path, fields)
+        if rows is None:
+            return None
+        return dict(rows)
+
+    def open_excel(self, base_class: str, s_path: str = None, output_dir: str = None,
+                   fields: Collection[str] = None) -> Optional[ExcelTable]:
+        """
+        Open an excel for lazy random access by key, see ExcelTable.
+        :param output_dir: Excel output directory. The offset index of the table is cached there, next to its JSON
+        :param fields: Only decode these fields of each row. The key field is always decoded
+        :return: None if the excel is not found
+        """
+        name = s_path or self.find_excel_path(base_class)
+        entry = self._design.find_entry(name) if name else None
+        if entry is None:
+            return None
+        chunk = self._design.get_chunk(entry)
+        row_class = base_class + 'Row'
+        index_field = self._class.get_class(row_class)[0]
+        if fields is not None:
+            fields = self._projection(fields) | {index_field.name}
+        cache_path = cache_key = None
+        if output_dir is not None:
+            cache_path = os.path.splitext(self.get_excel_output_path(base_class, s_path, output_dir))[0] + '.index'
+            cache_key = f'{ExtractionState.digest(chunk)}:{self._class.schema_key}:{self._beta}'
+        return ExcelTable(base_class, BinaryReader(buffer=chunk), index_field.name,
+                          self._compiler.get_class_decoder(row_class, False, False, fields),
+                          self._compiler.get_member_decoder(index_field),
+                          self._compiler.get_class_skipper(row_class, False), cache_path, cache_key)
+
+    def load_excel_columns(self, base_class: str, s_path: str = None,
+                           fields: Collection[str] = None) -> Optional[ExcelColumns]:
+        """
+        Columnar counterpart of load_binary_excel, every field of the rows decoded into one NumPy array.
+        Needs numpy, see ExcelColumns.
+        :param fields: Only decode these fields of each row. The key field is always decoded
+        :return: None if the excel is not found
+        """
+        name = s_path or self.find_excel_path(base_class)
+        reader = self._design.get_reader(name=name) if name else None
+        if reader is None:
+            return None
+        row_class = base_class + 'Row'
+        return ExcelColumns.decode(base_class, reader, self._compiler, self._class.get_class(row_class, True),
+                                   self._class.get_class(row_class)[0].name, self._projection(fields))
+
+    def dump_binary_excel(self, base_class: str, s_path: Optional[str], path: str) -> bool:
+        """
+        Stream an excel to a JSON file row by row.
+        :return: False if the excel is not found
+        """
+        rows = self.iter_binary_excel(base_class, s_path, self._fields)
+        if rows is None:
+            if not s_path:
+                return False
+            # An explicitly mapped excel is written even if missing
+            with open(path, 'w', encoding='utf-8') as f:
+                dump_json(None, f, self._indent, ensure_ascii=False)
+            return True
+        with atomic_open(path) as f:
+            writer = JsonStreamWriter(f, self._indent, ensure_ascii=False, unique_keys=True)
+            try:
+                for key, row in rows:
+                    writer.write_item(key, row)
+                writer.close()
+            except DuplicateKeyError:
+                # A repeated key keeps its first position with the last row, which can't be streamed.
+                # Such tables are rare and small, so fall back to building the dict
+                f.seek(0)
+                f.truncate()
+                dump_json(self.load_binary_excel(base_class, s_path, self._fields), f, self._indent,
+                          ensure_ascii=False)
+        return True
+
+    def insert_binary_excel(self, base_class: str, s_path: Optional[str]) -> bool:
+        """
+        Write an excel to the database as the table excel_<class>, see SqliteWriter.write_excel.
+        :return: False if the excel is not found
+        """
+        rows = self.iter_binary_excel(base_class, s_path, self._fields)
+        if rows is None and not s_path:
+            return False
+        fields = self._class.get_class(base_class + 'Row', True)
+        index_field = self._class.get_class(base_class + 'Row')[0].name
+        if self._fields is not None:
+            fields = [field for field in fields if field.name in self._fields or field.name == index_field]
+        # An explicitly mapped excel gets an empty table even if missing
+        self._db.write_excel(base_class, fields, index_field, rows or ())
+        return True
 
     def load_all_excels(self, output_dir: str, path_mapping: dict = None):
-        err_list = []
-        os.makedirs(output_dir, exist_ok=True)
+        if self._db is None:
+            os.makedirs(output_dir, exist_ok=True)
         if path_mapping is not None:
-            for class_name, s_path in path_mapping.items():
-                try:
-                    data = self.load_binary_excel(class_name, s_path)
-                    with open(os.path.join(output_dir, os.path.basename(s_path)[:-6] + '.json'), 'w',
-                              encoding='utf-8') as f:
-                        json.dump(data, f, indent=2, ensure_ascii=False)
-                except:
-                    err_list.append(class_name)
+            items = list(path_mapping.items())
         else:
-            for excel_name in self._class.get_excel_classes():
-                try:
-                    data = self.load_binary_excel(excel_name)
-                    if data is None:
-                        err_list.append(excel_name)
-                    else:
-                        with open(os.path.join(output_dir, excel_name + '.json'), 'w', encoding='utf-8') as f:
-                            json.dump(data, f, indent=2, ensure_ascii=False)
-                except:
-                    err_list.append(excel_name)
-        return err_list
+            items = [(excel_name, None) for excel_name in self._class.get_excel_classes()]
+        names = {class_name: s_path or self.find_excel_path(class_name) for class_name, s_path in items}
+
+        def get_output(item):
+            return self.get_excel_output_path(item[0], item[1], output_dir)
+        tasks = self._planner.plan(items, lambda item: names[item[0]])
+        tasks = self._skip_unchanged('excel', tasks, lambda item: names[item[0]], get_output)
+        results = [self.load_excel_item(class_name, s_path, output_dir) for class_name, s_path in tasks]
+        self._mark_done(tasks, results, get_output)
+        if self._db is not None:
+            self._db.commit()
+        failed = {class_name for (class_name, _), ok in zip(tasks, results) if not ok}
+        return [class_name for class_name, _ in items if class_name in failed]
+
+    @staticmethod
+    def get_excel_output_path(class_name: str, s_path: Optional[str], output_dir: str) -> str:
+        if s_path is not None:
+            return os.path.join(output_dir, os.path.basename(s_path)[:-6] + '.json')
+        return os.path.join(output_dir, class_name + '.json')
+
+    def load_excel_item(self, class_name: str, s_path: Optional[str], output_dir: str) -> bool:
+        try:
+            if self._db is not None:
+                return self.insert_binary_excel(class_name, s_path)
+            return self.dump_binary_excel(class_name, s_path, self.get_excel_output_path(class_name, s_path, output_dir))
+        except:
+            return False
 
-    def load_all_story(self, output_dir: str):
+    def get_story_paths(self) -> List[str]:
+        """
+        :return: Output paths of all stories, e.g. Config/Level/Foo.json
+        """
         story_config = self.load_binary_excel('PerformanceC', 'BakedConfig/ExcelOutput/PerformanceC.bytes')
-        err = []
-        for config in story_config.values():
-            path = config['PerformancePath']
-            try:
-                data = self.load_binary_config(path[:-5] + '.bytes', 'LevelGraphConfig')
-                os.makedirs(os.path.join(output_dir, os.path.dirname(path)), exist_ok=True)
-                with open(os.path.join(output_dir, path), 'w', encoding='utf-8') as f:
-                    json.dump(data, f, indent=2, ensure_ascii=False)
-            except:
-                err.append(path)
-        return err
+        return [config['PerformancePath'] for config in story_config.values()]
+
+    def load_all_story(self, output_dir: str, jobs: int = 1):
+        paths = self.get_story_paths()
+
+        def get_name(path):
+            return self.get_config_path(path[:-5] + '.bytes')
+
+        def get_output(path):
+            return os.path.join(output_dir, path)
+        self._design.register_names(get_name(path) for path in paths)
+        planned = self._planner.plan(paths, get_name)
+        planned = self._skip_unchanged('story', planned, get_name, get_output)
+        planned, duplicates = self._dedup.split(planned, get_name, lambda path: 'LevelGraphConfig')
+        if self._db is not None:
+            results = self._insert_decoded(planned, jobs, self.decode_story, _decode_story_worker, lambda path: path)
+            results += self._dedup.replicate('story', duplicates, dict(zip(planned, results)), lambda path: path,
+                                             self._copy_config)
+            self._db.commit()
+        elif jobs > 1:
+            with self._create_pool(jobs) as pool:
+                results = self._collect(pool.map(_load_story_worker, planned, [output_dir] * len(planned),
+                                                 chunksize=_chunk_size(len(planned), jobs)))
+        else:
+            results = [self.load_story(path, output_dir) for path in planned]
+        if self._db is None:
+            results += self._dedup.replicate('story', duplicates, dict(zip(planned, results)), get_output)
+        planned += [path for path, _ in duplicates]
+        self._mark_done(planned, results, get_output)
+        failed = {path for path, ok in zip(planned, results) if not ok}
+        return [path for path in paths if path in failed]
+
+    def decode_story(self, path: str) -> Optional[Tuple[str, str]]:
+        """
+        :return: Class name and JSON of a story, or None if it fails to decode
+        """
+        try:
+            return 'LevelGraphConfig', to_json(self.load_binary_config(path[:-5] + '.bytes', 'LevelGraphConfig',
+                                                                       fields=self._fields))
+        except:
+            return None
+
+    def load_story(self, path: str, output_dir: str) -> bool:
+        try:
+            data = self.load_binary_config(path[:-5] + '.bytes', 'LevelGraphConfig', fields=self._fields)
+            os.makedirs(os.path.join(output_dir, os.path.dirname(path)), exist_ok=True)
+            with atomic_open(os.path.join(output_dir, path)) as f:
+                dump_json(data, f, self._indent, ensure_ascii=False)
+        except:
+            return False
+        return True
 
-    def load_all_configs(self, output_dir: str):
+    def load_all_configs(self, output_dir: str, jobs: int = 1):
+        tasks = [(config_name, item) for config_name, items in self._manifest.items() for item in items]
+        failed = self._load_config_items(tasks, output_dir, jobs)
         err_list = {}
         for config_name in self._manifest.keys():
-            err = self.load_config(config_name, output_dir)
+            err = self._collect_config_errors(config_name, failed)
             if err:
                 err_list[config_name] = err
         return err_list
 
-    def load_config(self, config_name: str, output_dir: str):
-        err_list = []
-        for item in self._manifest[config_name]:
-            logger.info(f'Parsing {item}')
-            try:
-                # This shit doesn't save in the config
-                if os.path.basename(item).startswith('MissionInfo'):
-                    class_name = 'MainMissionInfoConfig'
-                elif os.path.basename(item).startswith('MunicipalChatConfig'):
-                    class_name = 'ConfigMunicipalNPCChatGroup'
-                elif '/NPCOverrideConfig/' in item:
-                    class_name = 'LevelNPCInfoOverride'
-                else:
-                    class_name = CONFIG_MAP.get(config_name, None)
-                    if not class_name:
-                        logger.warning(f'Can\'t find class name for config {config_name}. Roll back to item name.')
-                        class_name = config_name
-                data = self.load_binary_config(item, class_name)
-                os.makedirs(os.path.dirname(os.path.join(output_dir, item)), exist_ok=True)
-                with open(os.path.join(output_dir, item), 'w', encoding='utf-8') as f:
-                    json.dump(data, f, indent=2)
-            except Exception as e:
-                logger.warning(f'Failed to parse {item}. Error: {e}')
-                err_list.append(item)
+    def get_config_items(self) -> Dict[str, str]:
+        """
+        :return: Output path of every config in the manifest, e.g. Config/Level/Foo.json, to its config name
+        """
+        return {item: config_name for config_name, items in self._manifest.items() for item in items}
+
+    def load_config(self, config_name: str, output_dir: str, jobs: int = 1):
+        tasks = [(config_name, item) for item in self._manifest[config_name]]
+        failed = self._load_config_items(tasks, output_dir, jobs)
+        return self._collect_config_errors(config_name, failed)
+
+    def _load_config_items(self, tasks: List[Tuple[str, str]], output_dir: str, jobs: int) -> Set[Tuple[str, str]]:
+        def get_name(task):
+            return self.get_config_path(task[1])
+
+        def get_output(task):
+            return os.path.join(output_dir, task[1])
+        tasks = self._planner.plan(tasks, get_name)
+        tasks = self._skip_unchanged('config', tasks, get_name, get_output)
+        # Items of an unmapped config are decoded as the config name, see get_config_class_name
+        tasks, duplicates = self._dedup.split(tasks, get_name,
+                                              lambda task: self._find_config_class_name(*task) or task[0])
+        if self._db is not None:
+            results = self._insert_decoded(tasks, jobs, lambda task: self.decode_config_item(*task),
+                                           _decode_config_item_worker, lambda task: task[1])
+            results += self._dedup.replicate('config', duplicates, dict(zip(tasks, results)), lambda task: task[1],
+                                             self._copy_config)
+            self._db.commit()
+        elif jobs > 1:
+            # Consecutive planned items go to the same worker, so each one still reads mostly sequentially
+            with self._create_pool(jobs) as pool:
+                results = self._collect(pool.map(_load_config_item_worker, tasks, [output_dir] * len(tasks),
+                                                 chunksize=_chunk_size(len(tasks), jobs)))
+        else:
+            results = [self.load_config_item(config_name, item, output_dir) for config_name, item in tasks]
+        if self._db is None:
+            results += self._dedup.replicate('config', duplicates, dict(zip(tasks, results)), get_output)
+        tasks += [task for task, _ in duplicates]
+        self._mark_done(tasks, results, get_output)
+        return {task for task, ok in zip(tasks, results) if not ok}
+
+    def _insert_decoded(self, tasks: list, jobs: int, decode: Callable[..., Optional[Tuple[str, str]]], worker,
+                        get_path: Callable[..., str]) -> List[bool]:
+        # The database has a single writer, so workers only decode, and every config is inserted here as it arrives
+        if jobs > 1:
+            pool = self._create_pool(jobs)
+            decoded = self._iter_results(pool.map(worker, tasks, chunksize=_chunk_size(len(tasks), jobs)))
+        else:
+            pool = None
+            decoded = (decode(task) for task in tasks)
+        try:
+            results = []
+            for task, config in zip(tasks, decoded):
+                if config is not None:
+                    self._db.insert_config(get_path(task), *config)
+                results.append(config is not None)
+            return results
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    def _copy_config(self, src: str, dst: str) -> Optional[Tuple[str, int]]:
+        size = self._db.copy_config(src, dst)
+        return ('copy', size) if size is not None else None
+
+    def _skip_unchanged(self, phase: str, tasks: list, get_name: Callable[..., Optional[str]],
+                        get_output: Callable[..., str]) -> list:
+        if self._state is None:
+            return tasks
+        pending = []
+        for task in tasks:
+            name = get_name(task)
+            entry = self._design.find_entry(name) if name else None
+            # Unresolved items still go through the regular path to be reported as errors
+            if entry is None or self._state.needs_update(phase, get_output(task), entry, self._design.get_chunk(entry)):
+                pending.append(task)
+        return pending
+
+    def _mark_done(self, tasks: list, results: List[bool], get_output: Callable[..., str]):
+        if self._state is None:
+            return
+        for task, ok in zip(tasks, results):
+            self._state.mark_done(get_output(task), ok)
+
+    def _collect_config_errors(self, config_name: str, failed: Set[Tuple[str, str]]) -> List[str]:
+        items = self._manifest[config_name]
+        err_list = [item for item in items if (config_name, item) in failed]
         logger.info(
-            f'Parsing complete. Extracted {len(self._manifest[config_name]) - len(err_list)} of {len(self._manifest[config_name])} files.')
+            f'Parsing {config_name} complete. Extracted {len(items) - len(err_list)} of {len(items)} files.')
         return err_list
 
-    def load_class(self, reader: BinaryReader, class_name: str, parse_derivation=True, add_typing=True) -> dict:
-        result = {}
-        logger.debug(f'Loading class {class_name}. Position: {hex(reader._buffer.tell())}')
-        if not parse_derivation and add_typing:
-            result['$type'] = 'RPG.GameCore.' + class_name
-        if class_name in ZIPPED_CLASS:
-            # Fuck the zipper
-            result['TaskEnabled'] = True
-            return result
-        if self._class.is_derivation_class(class_name) and parse_derivation:
-            # Find Real Signature of Class. Avoid death loop.
-            if self._class.has_derivation_class(class_name):
-                cls_idx = reader.read_uleb128()
-                cls_name = self._class.get_derivation_class_name(class_name, cls_idx)
-                if not cls_name:
-                    raise ValueError(f'Unknown class index {cls_idx} for class {class_name}')
-                return self.load_class(reader, cls_name, False)
-        # TaskConfig use merge field instead of lookup base class.
-        class_decl = self._class.get_class(class_name, True)
-        if class_decl is None:
-            raise ValueError(f'Unknown class {class_name}')
-        mask = reader.read_uleb128()
-        mask_bit = 1
-        for field in class_decl:
-            if mask & mask_bit != 0:
-                if field.is_array:
-                    count = reader.read_array_len()
-                    result[field.name] = []
-                    for _ in range(count):
-                        result[field.name].append(self.load_field(reader, field))
+    @staticmethod
+    def _find_config_class_name(config_name: str, item: str) -> Optional[str]:
+        # This shit doesn't save in the config
+        if os.path.basename(item).startswith('MissionInfo'):
+            return 'MainMissionInfoConfig'
+        elif os.path.basename(item).startswith('MunicipalChatConfig'):
+            return 'ConfigMunicipalNPCChatGroup'
+        elif '/NPCOverrideConfig/' in item:
+            return 'LevelNPCInfoOverride'
+        return CONFIG_MAP.get(config_name, None)
+
+    @classmethod
+    def get_config_class_name(cls, config_name: str, item: str) -> str:
+        class_name = cls._find_config_class_name(config_name, item)
+        if not class_name:
+            logger.warning(f'Can\'t find class name for config {config_name}. Roll back to item name.')
+            class_name = config_name
+        return class_name
+
+    def decode_config_item(self, config_name: str, item: str) -> Optional[Tuple[str, str]]:
+        """
+        :return: Class name and JSON of a config, or None if it fails to decode
+        """
+        logger.info(f'Parsing {item}')
+        try:
+            class_name = self.get_config_class_name(config_name, item)
+            return class_name, to_json(self.load_binary_config(item, class_name, fields=self._fields))
+        except Exception as e:
+            logger.warning(f'Failed to parse {item}. Error: {e}')
+            return None
+
+    def load_config_item(self, config_name: str, item: str, output_dir: str) -> bool:
+        logger.info(f'Parsing {item}')
+        try:
+            class_name = self.get_config_class_name(config_name, item)
+            data = self.load_binary_config(item, class_name, fields=self._fields)
+            os.makedirs(os.path.dirname(os.path.join(output_dir, item)), exist_ok=True)
+            with atomic_open(os.path.join(output_dir, item)) as f:
+                dump_json(data, f, self._indent)
+        except Exception as e:
+            logger.warning(f'Failed to parse {item}. Error: {e}')
+            return False
+        return True
+
+    def get_validation_tasks(self, kinds: Collection[str] = ('excel', 'config', 'story'),
+                             path_mapping: dict = None) -> List[Tuple[str, str, str]]:
+        """
+        :param kinds: Kinds of chunks to validate
+        :param path_mapping: Excel class to path mapping, same as load_all_excels
+        :return: List of (kind, chunk name, class name)
+        """
+        tasks = []
+        if 'excel' in kinds:
+            if path_mapping is not None:
+                items = list(path_mapping.items())
+            else:
+                items = [(excel_name, None) for excel_name in self._class.get_excel_classes()]
+            for class_name, s_path in items:
+                name = s_path or self.find_excel_path(class_name)
+                # Excels declared in dump.cs but not shipped are not schema drift
+                if name is not None:
+                    tasks.append(('excel', name, class_name))
+        if 'config' in kinds:
+            for config_name, items in self._manifest.items():
+                for item in items:
+                    tasks.append(('config', self.get_config_path(item), self.get_config_class_name(config_name, item)))
+        if 'story' in kinds:
+            story_config = self.load_binary_excel('PerformanceC', 'BakedConfig/ExcelOutput/PerformanceC.bytes') or {}
+            for config in story_config.values():
+                tasks.append(('story', self.get_config_path(config['PerformancePath'][:-5] + '.bytes'),
+                              'LevelGraphConfig'))
+        return tasks
+
+    def validate_chunk(self, kind: str, name: str, class_name: str) -> Optional[dict]:
+        """
+        Walk a chunk with skippers only, and check that exactly the whole chunk is consumed.
+        :return: None if the chunk is fine, otherwise a report of the mismatch
+        """
+        report = {'kind': kind, 'name': name, 'class': class_name}
+        entry = self._design.find_entry(name)
+        if entry is None:
+            report['error'] = 'Chunk not found'
+            return report
+        reader = BinaryReader(buffer=self._design.get_chunk(entry))
+        row = None
+        try:
+            if kind == 'excel':
+                report['class'] = class_name + 'Row'
+                skipper = self._compiler.get_class_skipper(class_name + 'Row', False)
+                for row in range(reader.read_array_len()):
+                    skipper(reader)
+            else:
+                self._compiler.get_class_skipper(class_name)(reader)
+        except DecodeError as e:
+            report.update({'class': e.class_name, 'offset': e.offset, 'error': str(e)})
+        except Exception as e:
+            report.update({'offset': reader.tell(), 'error': f'{type(e).__name__}: {e}'})
+        else:
+            if reader.tell() == entry.size:
+                return None
+            report.update({'offset': reader.tell(), 'error': f'Consumed {reader.tell()} of {entry.size} bytes'})
+        if row is not None:
+            report['row'] = row
+        return report
+
+    def validate_all(self, jobs: int = 1, kinds: Collection[str] = ('excel', 'config', 'story'),
+                     path_mapping: dict = None) -> List[dict]:
+        """
+        Check that every chunk still decodes with the current schema, without building or writing anything.
+        :return: Reports of the mismatched chunks, see validate_chunk
+        """
+        tasks = self._planner.plan(self.get_validation_tasks(kinds, path_mapping), lambda task: task[1])
+        if jobs > 1:
+            with self._create_pool(jobs) as pool:
+                results = self._collect(pool.map(_validate_worker, tasks, chunksize=_chunk_size(len(tasks), jobs)))
+        else:
+            results = [self.validate_chunk(*task) for task in tasks]
+        reports = [report for report in results if report is not None]
+        for report in reports:
+            logger.warning(f'Validation failed for {report["kind"]} {report["name"]}: {report["error"]}')
+        logger.info(f'Validated {len(tasks)} chunks. {len(reports)} mismatched.')
+        return reports
+
+    def probe_excel(self, class_name: str, name: str, rows: int = 8) -> bool:
+        """
+        Cheap check that an excel chunk may hold rows of an excel class, to prune candidates before match_excel.
+        The first rows are walked with the row skipper, and each row bitmask must fit the fields of the class.
+        Empty excels never match.
+        """
+        fields = self._class.get_class(class_name + 'Row', True)
+        entry = self._design.find_entry(name)
+        if not fields or entry is None:
+            return False
+        reader = BinaryReader(buffer=self._design.get_chunk(entry))
+        limit = 1 << len(fields)
+        try:
+            skipper = self._compiler.get_class_skipper(class_name + 'Row', False)
+            count = reader.read_array_len()
+            if count == 0:
+                return False
+            for _ in range(min(count, rows)):
+                pos = reader.tell()
+                if reader.read_uleb128() >= limit:
+                    return False
+                reader.seek(pos)
+                skipper(reader)
+        except Exception:
+            return False
+        return reader.tell() <= entry.size
+
+    def match_excel(self, class_name: str, names: List[str]) -> Optional[str]:
+        """
+        :param names: Candidate chunk names, in order of preference
+        :return: The first candidate that passes probe_excel and decodes to its exact size, or None
+        """
+        for name in names:
+            if self.probe_excel(class_name, name) and self.validate_chunk('excel', name, class_name) is None:
+                return name
+        return None
+
+    def match_excels(self, candidates: Dict[str, List[str]], jobs: int = 1) -> Dict[str, Optional[str]]:
+        """
+        Find the chunk of every excel class among its candidates, see match_excel.
+        Classes are matched independently, so a chunk may be matched by several of them.
+        :param candidates: Excel class name to candidate chunk names
+        :return: Excel class name to the matched chunk name, or None
+        """
+        tasks = list(candidates.items())
+        if jobs > 1:
+            with self._create_pool(jobs) as pool:
+                results = self._collect(pool.map(_match_excel_worker, tasks, chunksize=_chunk_size(len(tasks), jobs)))
+        else:
+            results = [self.match_excel(*task) for task in tasks]
+        matched = dict(zip(candidates, results))
+        logger.info(f'Matched {sum(name is not None for name in results)} of {len(tasks)} excel classes')
+        return matched
+
+    def _create_pool(self, jobs: int) -> ProcessPoolExecutor:
+        # Workers can't share mapped files and compiled decoders, so each one builds its own loaders once
+        return ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(
+            self._class.header_file, self._class.index_file, self._class.use_cache, self._class.cache_path,
+            self._design.path, self._design.version, self._beta, self._indent, self._fields,
+            self._profiler is not None, self._compact_dynamic))
+
+    def _collect(self, results) -> list:
+        return list(self._iter_results(results))
+
+    def _iter_results(self, results):
+        # Worker results come with the decode statistics of the task, see _worker_result
+        for result, stats in results:
+            if stats is not None and self._profiler is not None:
+                self._profiler.merge(stats)
+            yield result
+
+    def load_class(self, reader: BinaryReader, class_name: str, parse_derivation=True, add_typing=True,
+                   fields: Collection[str] = None) -> dict:
+        """
+        :param fields: Only decode these fields of the class, the others are skipped without building anything
+        """
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f'Loading class {class_name}. Position: {hex(reader.tell())}')
+        return self._compiler.get_class_decoder(class_name, parse_derivation, add_typing,
+                                                self._projection(fields))(reader)
+
+    @staticmethod
+    def parse_dynamic_float_rel(reader: BinaryReader) -> dict:
+        """
+        :return: Dynamic float as JSON. Operator ops without operand are ReadOnlyDicts shared by every expression
+        """
+        # REL version differ from BETA version, the operands are inline
+        if not reader.read_bool():
+            return {"IsDynamic": False, "FixedValue": {"Value": reader.read_sleb128() / 4294967296}}
+        expression = []
+        for _ in range(reader.read_byte()):
+            op_code = reader.read_byte()
+            op = _OPERATORS.get(op_code)
+            if op is None:
+                if op_code == 0:
+                    op = {'Type': 'FixedNumber', 'FixedValue': {'Value': reader.read_sleb128() / 4294967296}}
+                elif op_code == 1:
+                    op = {'Type': 'DynamicNumber', 'DynamicHash': reader.read_hash()}
                 else:
-                    result[field.name] = self.load_field(reader, field)
-            mask_bit <<= 1
-        return result
+                    raise ValueError(f'Unknown opcode {op_code}')
+            expression.append(op)
+        return {"IsDynamic": True, "Expressions": expression}
 
     @staticmethod
-    def parse_dynamic_float_rel(reader: BinaryReader):
-        # REL version differ from BETA version
-        is_dynamic = reader.read_bool()
-        if is_dynamic:
-            num_ops = reader.read_byte()
-            expression = []
-            for _ in range(num_ops):
-                op_code = reader.read_byte()
+    def parse_dynamic_float_rel_compact(reader: BinaryReader):
+        """
+        parse_dynamic_float_rel without the JSON shape.
+        :return: The value of a fixed float, or a tuple of ops of a dynamic one. Operand ops are ('FixedNumber', value)
+                 and ('DynamicNumber', hash), the others shared tuples like ('Add',)
+        """
+        if not reader.read_bool():
+            return reader.read_sleb128() / 4294967296
+        expression = []
+        for _ in range(reader.read_byte()):
+            op_code = reader.read_byte()
+            op = _COMPACT_OPERATORS.get(op_code)
+            if op is None:
                 if op_code == 0:
-                    expression.append({'Type': 'FixedNumber', 'FixedValue': {
-                                'Value': reader.read_sleb128() / 4294967296}})
+                    op = ('FixedNumber', reader.read_sleb128() / 4294967296)
                 elif op_code == 1:
-                    expression.append({'Type': 'DynamicNumber', 'DynamicHash': reader.read_hash()})
-                elif op_code == 2:
-                    expression.append({'Type': 'Add'})
-                elif op_code == 3:
-                    expression.append({'Type': 'Sub'})
-                elif op_code == 4:
-                    expression.append({'Type': 'Mul'})
-                elif op_code == 5:
-                    expression.append({'Type': 'Div'})
-                elif op_code == 6:
-                    expression.append({'Type': 'Neg'})
-                elif op_code == 7:
-                    expression.append({'Type': 'Floor'})
-                elif op_code == 8:
-                    expression.append({'Type': 'Round'})
-                elif op_code == 9:
-                    expression.append({'Type': 'Int'})
+                    op = ('DynamicNumber', reader.read_hash())
                 else:
                     raise ValueError(f'Unknown opcode {op_code}')
-            return {"IsDynamic": True, "Expressions": expression}
-        else:
-            value = reader.read_sleb128() / 4294967296
-            return {"IsDynamic": False, "FixedValue": {"Value": value}}
+            expression.append(op)
+        return tuple(expression)
 
+    @staticmethod
+    def _read_expression_raw(reader: BinaryReader) -> Tuple[bytes, list, list]:
+        op_count = reader.read_byte()
+        op_list = reader.read_bytes(op_count)
+        if len(op_list) != op_count:
+            raise IndexError('Expression is out of range')
+        fixed = [reader.read_sleb128() for _ in range(reader.read_byte())]
+        dynamic = [reader.read_hash() for _ in range(reader.read_byte())]
+        return op_list, fixed, dynamic
 
     @staticmethod
     def parse_dynamic_float(reader: BinaryReader, parse_expression=True) -> dict:
+        """
+        :return: Dynamic float as JSON. Operator ops without operand are ReadOnlyDicts shared by every expression
+        """
         # Dynamic float parser
-        is_dynamic = reader.read_bool()
-        if is_dynamic:
+        if not reader.read_bool():
+            return {"IsDynamic": False, "FixedValue": {"Value": reader.read_sleb128() / 4294967296}}
+        op_list, fixed, dynamic = ConfigLoader._read_expression_raw(reader)
+        if parse_expression:
+            """
+            [1, 0, 0, 0, 1, 1, 2, 1, 2, 3, 8, 1, 9]
+            # Strange in some white box item, roll to raw
+            """
             expression = []
-            expression_raw = {
-                'Op': [],
-                'Fixed': [],
-                'Dynamic': []
-            }
-            op_count = reader.read_byte()
-            for _ in range(op_count):
-                expression_raw['Op'].append(reader.read_byte())
-            fixed_count = reader.read_byte()
-            for _ in range(fixed_count):
-                expression_raw['Fixed'].append(reader.read_sleb128())
-            dynamic_count = reader.read_byte()
-            for _ in range(dynamic_count):
-                expression_raw['Dynamic'].append(reader.read_hash())
-            if parse_expression:
-                """
-                [1, 0, 0, 0, 1, 1, 2, 1, 2, 3, 8, 1, 9]
-                # Strange in some white box item, roll to raw
-                """
-                try:
-                    op_list = expression_raw['Op']
-                    idx = 0
-                    while idx < len(op_list):
-                        op = op_list[idx]
-                        if op == 0:
-                            idx += 1
-                            expression.append({'Type': 'FixedNumber', 'FixedValue': {
-                                'Value': expression_raw['Fixed'][op_list[idx]] / 4294967296}})
-                        elif op == 1:
-                            idx += 1
-                            expression.append(
-                                {'Type': 'DynamicNumber', 'DynamicHash': expression_raw['Dynamic'][op_list[idx]]})
-                        elif op == 2:
-                            expression.append({'Type': 'Add'})
-                        elif op == 3:
-                            expression.append({'Type': 'Sub'})
-                        elif op == 4:
-                            expression.append({'Type': 'Mul'})
-                        elif op == 5:
-                            expression.append({'Type': 'Div'})
-                        elif op == 6:
-                            expression.append({'Type': 'Neg'})
-                        elif op == 7:
-                            expression.append({'Type': 'Floor'})
-                        elif op == 8:
-                            expression.append({'Type': 'Round'})
-                        elif op == 9:
-                            # Type 9 is Int, skip
-                            pass
-                        else:
-                            raise ValueError(f'Unknown op type {op}')
-                        idx += 1
-                    expression_raw = expression
-                except IndexError or ValueError:
-                    expression_raw['$warning'] = 'Analyzer failed to parse expression'
-                    logger.warning('Failed to parse expression. Use raw expression instead')
-            return {"IsDynamic": True, "Expressions": expression_raw}
-        else:
-            value = reader.read_sleb128() / 4294967296
-            return {"IsDynamic": False, "FixedValue": {"Value": value}}
+            op_iter = iter(op_list)
+            try:
+                for op in op_iter:
+                    operator = _BETA_OPERATORS.get(op)
+                    if operator is not None:
+                        expression.append(operator)
+                    elif op == 0:
+                        expression.append({'Type': 'FixedNumber', 'FixedValue': {
+                            'Value': fixed[next(op_iter)] / 4294967296}})
+                    elif op == 1:
+                        expression.append({'Type': 'DynamicNumber', 'DynamicHash': dynamic[next(op_iter)]})
+                    elif op != 9:
+                        # Unknown ops are not a reason to fall back to the raw expression
+                        raise ValueError(f'Unknown op type {op}')
+                return {"IsDynamic": True, "Expressions": expression}
+            except (IndexError, StopIteration):
+                logger.warning('Failed to parse expression. Use raw expression instead')
+                return {"IsDynamic": True, "Expressions": {'Op': list(op_list), 'Fixed': fixed, 'Dynamic': dynamic,
+                                                           '$warning': 'Analyzer failed to parse expression'}}
+        return {"IsDynamic": True, "Expressions": {'Op': list(op_list), 'Fixed': fixed, 'Dynamic': dynamic}}
+
+    @staticmethod
+    def parse_dynamic_float_compact(reader: BinaryReader):
+        """
+        parse_dynamic_float without the JSON shape, see parse_dynamic_float_rel_compact.
+        An expression the analyzer fails on is ('Raw', ops, fixed, dynamic)
+        """
+        if not reader.read_bool():
+            return reader.read_sleb128() / 4294967296
+        op_list, fixed, dynamic = ConfigLoader._read_expression_raw(reader)
+        try:
+            expression = []
+            op_iter = iter(op_list)
+            for op in op_iter:
+                operator = _BETA_COMPACT_OPERATORS.get(op)
+                if operator is not None:
+                    expression.append(operator)
+                elif op == 0:
+                    expression.append(('FixedNumber', fixed[next(op_iter)] / 4294967296))
+                elif op == 1:
+                    expression.append(('DynamicNumber', dynamic[next(op_iter)]))
+                elif op != 9:
+                    raise ValueError(f'Unknown op type {op}')
+            return tuple(expression)
+        except (IndexError, StopIteration):
+            return 'Raw', tuple(op_list), tuple(fixed), tuple(dynamic)
 
     @staticmethod
     def parse_dynamic_value_read_type(reader: BinaryReader):
@@ -355,45 +841,78 @@ class ConfigLoader:
         return ret
 
     @staticmethod
-    def parse_dynamic_value(reader: BinaryReader):
-        ret = {}
-        _type = reader.read_sleb128()
-        if _type == 0:
-            ret['Type'] = 'INT'
-            ret['IntValue'] = reader.read_sleb128()
-        elif _type == 1:
-            ret['Type'] = 'FLOAT'
-            ret['FloatValue'] = reader.read_float()
-        elif _type == 2:
-            ret['Type'] = 'BOOL'
-            ret['BoolValue'] = reader.read_bool()
-        elif _type == 3:
-            ret['Type'] = 'ARRAY'
-            data = []
-            arr_len = reader.read_array_len()
-            for _ in range(arr_len):
-                data.append(ConfigLoader.parse_dynamic_value(reader))
-            ret['ArrayValue'] = data
-        elif _type == 4:
-            ret['Type'] = 'MAP'
-            data = []
-            arr_len = reader.read_array_len()
-            for _ in range(arr_len):
-                key = ConfigLoader.parse_dynamic_value(reader)
-                value = ConfigLoader.parse_dynamic_value(reader)
-                data.append({
-                    'Key': key,
-                    'Value': value
-                })
-            ret['MapValue'] = data
-        elif _type == 5:
-            ret['Type'] = 'STRING'
-            ret['StringValue'] = reader.read_string()
-        elif _type == 6:
-            ret['Type'] = 'NULL'
-        else:
-            raise ValueError(f'Unknown dynamic value type {_type}')
-        return ret
+    def parse_dynamic_value(reader: BinaryReader) -> dict:
+        """
+        :return: Dynamic value as JSON. NULL values are one ReadOnlyDict shared by every dynamic value
+        """
+        # Nested arrays and maps are decoded with an explicit stack. A container is built once its items are complete
+        stack = []
+        while True:
+            _type = reader.read_sleb128()
+            scalar = _SCALAR_VALUES.get(_type)
+            if scalar is not None:
+                value = {'Type': DYNAMIC_VALUE_TYPES[_type], scalar[0]: scalar[1](reader)}
+            elif _type == 3 or _type == 4:
+                count = reader.read_array_len() * (_type - 2)
+                if count:
+                    # Type, items, items left
+                    stack.append([_type, [], count])
+                    continue
+                value = {'Type': 'ARRAY', 'ArrayValue': []} if _type == 3 else {'Type': 'MAP', 'MapValue': []}
+            elif _type == 6:
+                value = _NULL_VALUE
+            else:
+                raise ValueError(f'Unknown dynamic value type {_type}')
+            while stack:
+                frame = stack[-1]
+                frame[1].append(value)
+                frame[2] -= 1
+                if frame[2]:
+                    break
+                stack.pop()
+                items = frame[1]
+                if frame[0] == 3:
+                    value = {'Type': 'ARRAY', 'ArrayValue': items}
+                else:
+                    value = {'Type': 'MAP', 'MapValue': [{'Key': key, 'Value': item}
+                                                         for key, item in zip(items[::2], items[1::2])]}
+            else:
+                return value
+
+    @staticmethod
+    def parse_dynamic_value_compact(reader: BinaryReader) -> tuple:
+        """
+        parse_dynamic_value without the JSON shape.
+        :return: (type code, value), see DYNAMIC_VALUE_TYPES. The value of an array is a tuple of items,
+                 of a map a tuple of (key, value) pairs, and of NULL None
+        """
+        stack = []
+        while True:
+            _type = reader.read_sleb128()
+            scalar = _SCALAR_VALUES.get(_type)
+            if scalar is not None:
+                value = (_type, scalar[1](reader))
+            elif _type == 3 or _type == 4:
+                count = reader.read_array_len() * (_type - 2)
+                if count:
+                    stack.append([_type, [], count])
+                    continue
+                value = (_type, ())
+            elif _type == 6:
+                value = _COMPACT_NULL_VALUE
+            else:
+                raise ValueError(f'Unknown dynamic value type {_type}')
+            while stack:
+                frame = stack[-1]
+                frame[1].append(value)
+                frame[2] -= 1
+                if frame[2]:
+                    break
+                stack.pop()
+                items = frame[1]
+                value = (3, tuple(items)) if frame[0] == 3 else (4, tuple(zip(items[::2], items[1::2])))
+            else:
+                return value
 
     def parse_dictionary(self, reader: BinaryReader, key_type: str, value_type: str):
         ret = {}
@@ -426,60 +945,50 @@ class ConfigLoader:
             }
 
     def load_field(self, reader, field_type) -> dict:
-        if isinstance(field_type, FieldDecl):
-            if field_type.is_generic:
-                if field_type.type == 'Dictionary':
-                    gen_t = field_type.generic_type
-                    key_ty = gen_t[0]
-                    value_ty = gen_t[-1]
-                    return self.parse_dictionary(reader, key_ty, value_ty)
-                else:
-                    raise NotImplementedError("Unsupported generic type: " + str(field_type))
-            field_type = field_type.type
-        if field_type == 'string':
-            return reader.read_string()
-        elif field_type == 'bool':
-            return reader.read_bool()
-        elif field_type == 'uint':
-            return reader.read_uleb128()
-        elif field_type == 'FixPoint':
-            return reader.read_sleb128() / 4294967296
-        elif field_type == 'int':
-            return reader.read_sleb128()
-        elif field_type == 'float':
-            return reader.read_float()
-        elif field_type == 'double':
-            return reader.read_double()
-        elif field_type == 'byte':
-            return reader.read_byte()
-        elif field_type == 'DynamicFloat':
-            if self._beta:
-                return self.parse_dynamic_float(reader)
-            else:
-                return self.parse_dynamic_float_rel(reader)
-        elif field_type == 'DynamicValue':
-            return self.parse_dynamic_value(reader)
-        # TODO: DynamicValues in AbilityConfig
-        #   Version 1.1.00: EILFONIHBCB
-        #   Version 1.1.5x-1.2.00: FMIOFJDICOO
-        #   Version 1.2.5x-1.3.00: JNKGHEGHNAC
-        #   Version 1.3.5x-1.4.00: DEHIOFECJDK
-        elif field_type == self._class.dyn_value_decl:
-            return self.parse_dynamic_values(reader)
-        elif field_type == 'TextID' or field_type == 'StringHash':
-            return {"Hash": reader.read_hash()}
-        elif field_type.startswith('MVector'):
-            return self.parse_vector(reader, int(field_type[7]))
-        elif self._class.contain_enum(field_type):
-            enum_decl = self._class.get_enum(field_type)
-            if enum_decl.is_int():
-                val = reader.read_sleb128()
-            elif enum_decl.is_ushort() or enum_decl.is_uint():
-                val = reader.read_uleb128()
-            else:
-                raise NotImplementedError(f'Unknown enum value type {enum_decl.val_type}')
-            return enum_decl.get_name_by_value(val)
-        elif self._class.contain_class(field_type):
-            return self.load_class(reader, field_type)
-        else:
-            raise NotImplementedError(f'Unknown type {field_type}')
+        return self._compiler.get_field_decoder(field_type)(reader)
+
+
+_worker_loader: ConfigLoader = None
+
+
+def _init_worker(header_file: str, index_file: str, use_cache: bool, cache_path: str, design_path: str, version: str,
+                 is_beta: bool, indent: Optional[int], fields: Optional[FrozenSet[str]], profile: bool,
+                 compact_dynamic: bool):
+    global _worker_loader
+    _worker_loader = ConfigLoader(DesignIndexLoader(design_path, version),
+                                  ClassLoader(header_file, index_file, use_cache, cache_path), is_beta, indent=indent,
+                                  fields=fields, profiler=DecodeProfiler() if profile else None,
+                                  compact_dynamic=compact_dynamic)
+
+
+def _worker_result(result):
+    profiler = _worker_loader._profiler
+    return result, profiler.pop_stats() if profiler is not None else None
+
+
+def _load_config_item_worker(task, output_dir: str):
+    return _worker_result(_worker_loader.load_config_item(task[0], task[1], output_dir))
+
+
+def _load_story_worker(path: str, output_dir: str):
+    return _worker_result(_worker_loader.load_story(path, output_dir))
+
+
+def _validate_worker(task: Tuple[str, str, str]):
+    return _worker_result(_worker_loader.validate_chunk(*task))
+
+
+def _decode_config_item_worker(task: Tuple[str, str]):
+    return _worker_result(_worker_loader.decode_config_item(*task))
+
+
+def _decode_story_worker(path: str):
+    return _worker_result(_worker_loader.decode_story(path))
+
+
+def _match_excel_worker(task: Tuple[str, List[str]]):
+    return _worker_result(_worker_loader.match_excel(*task))
+
+
+def _chunk_size(task_count: int, jobs: int) -> int:
+    return max(1, task_count // (jobs * 8))
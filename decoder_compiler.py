@@ -0,0 +1,537 @@
+from typing import Callable, Dict, FrozenSet, Optional, Set, Tuple, Union
+from binary_reader import BinaryReader
+from class_loader import FieldDecl
+from logger import get_logger
+from profiler import DecodeProfiler
+
+logger = get_logger('DecoderCompiler')
+
+ZIPPED_CLASS = {
+    'ChangePropState',
+    'SyncAllSubPropState',
+    'SyncSubPropState',
+    'LoopWaitBeHit',
+    'WaitPredicateSucc',
+    'ComparePropState',
+}
+
+Decoder = Callable[[BinaryReader], object]
+# Advance the reader over a value without building it
+Skipper = Callable[[BinaryReader], None]
+
+
+class DecodeError(ValueError):
+    """
+    Failure inside a class, raised by skippers with the innermost class and the offset its object starts at.
+    """
+
+    def __init__(self, class_name: str, offset: int, error: Exception):
+        super().__init__(class_name, offset, error)
+        self.class_name = class_name
+        self.offset = offset
+        self.error = error
+        # Enclosing classes, innermost first
+        self.path = []
+
+    def __str__(self):
+        path = ' in '.join([self.class_name] + self.path)
+        return f'{type(self.error).__name__}: {self.error} ({path} at {hex(self.offset)})'
+
+
+def _raise_on_decode(exc_type: type, message: str) -> Decoder:
+    # Schema errors are only raised when the field is actually met in the data
+    def decode(reader):
+        raise exc_type(message)
+    return decode
+
+
+def _fix_point(reader: BinaryReader) -> float:
+    return reader.read_sleb128() / 4294967296
+
+
+def _hash_object(reader: BinaryReader) -> dict:
+    return {"Hash": reader.read_hash()}
+
+
+def _fix_point_array(reader: BinaryReader, count: int) -> list:
+    return [value / 4294967296 for value in reader.read_sleb128_array(count)]
+
+
+def _hash_object_array(reader: BinaryReader, count: int) -> list:
+    return [{"Hash": value} for value in reader.read_hash_array(count)]
+
+
+def _skip_none(reader: BinaryReader):
+    pass
+
+
+def _skip_byte(reader: BinaryReader):
+    reader.skip(1)
+
+
+def _skip_float(reader: BinaryReader):
+    reader.skip(4)
+
+
+def _skip_double(reader: BinaryReader):
+    reader.skip(8)
+
+
+def _skip_dynamic_float(reader: BinaryReader):
+    # Beta layout, see ConfigLoader.parse_dynamic_float
+    if reader.read_bool():
+        reader.skip(reader.read_byte())
+        for _ in range(reader.read_byte()):
+            reader.skip_uleb128()
+        for _ in range(reader.read_byte()):
+            reader.skip_uleb128()
+    else:
+        reader.skip_uleb128()
+
+
+def _skip_dynamic_float_rel(reader: BinaryReader):
+    # Release layout, see ConfigLoader.parse_dynamic_float_rel
+    if reader.read_bool():
+        for _ in range(reader.read_byte()):
+            op_code = reader.read_byte()
+            if op_code == 0 or op_code == 1:
+                reader.skip_uleb128()
+            elif op_code > 9:
+                raise ValueError(f'Unknown opcode {op_code}')
+    else:
+        reader.skip_uleb128()
+
+
+def _skip_dynamic_value(reader: BinaryReader):
+    # Nested values only add to the number of values left, so no recursion is needed
+    left = 1
+    while left:
+        left -= 1
+        _type = reader.read_sleb128()
+        if _type == 0:
+            reader.skip_uleb128()
+        elif _type == 1:
+            reader.skip(4)
+        elif _type == 2:
+            reader.skip(1)
+        elif _type == 3:
+            left += reader.read_array_len()
+        elif _type == 4:
+            left += reader.read_array_len() * 2
+        elif _type == 5:
+            reader.skip_string()
+        elif _type != 6:
+            raise ValueError(f'Unknown dynamic value type {_type}')
+
+
+def _skip_dynamic_values(reader: BinaryReader):
+    # See ConfigLoader.parse_dynamic_values, which always uses the beta dynamic float
+    for _ in range(reader.read_uleb128()):
+        reader.skip_uleb128()
+        if reader.read_bool():
+            _skip_dynamic_float(reader)
+            _skip_dynamic_float(reader)
+            _skip_dynamic_float(reader)
+        else:
+            reader.skip_uleb128()
+            if reader.read_bool():
+                reader.skip_uleb128()
+                reader.skip_uleb128()
+        if reader.read_byte() != 0:
+            reader.skip_string()
+            reader.skip_uleb128()
+
+
+class DecoderCompiler:
+    """
+    Compile class declarations into decoder closures.
+    Each class is resolved once (base class merging, derivation lookup, zipped class and enum typing),
+    the result is cached and reused for every instance in every config.
+    """
+
+    PRIMITIVE_DECODERS: Dict[str, Decoder] = {
+        'string': BinaryReader.read_string,
+        'bool': BinaryReader.read_bool,
+        'uint': BinaryReader.read_uleb128,
+        'FixPoint': _fix_point,
+        'int': BinaryReader.read_sleb128,
+        'float': BinaryReader.read_float,
+        'double': BinaryReader.read_double,
+        'byte': BinaryReader.read_byte,
+    }
+
+    # Arrays of these element types are read in one call instead of one decoder call per element
+    PRIMITIVE_ARRAY_DECODERS: Dict[str, Callable[[BinaryReader, int], list]] = {
+        'bool': BinaryReader.read_bool_array,
+        'uint': BinaryReader.read_uleb128_array,
+        'FixPoint': _fix_point_array,
+        'int': BinaryReader.read_sleb128_array,
+        'float': BinaryReader.read_float_array,
+        'double': BinaryReader.read_double_array,
+        'byte': BinaryReader.read_byte_array,
+        'TextID': _hash_object_array,
+        'StringHash': _hash_object_array,
+    }
+
+    # Byte size of the elements of fixed size types, whose arrays are skipped in one step
+    FIXED_SIZES: Dict[str, int] = {
+        'bool': 1,
+        'float': 4,
+        'double': 8,
+        'byte': 1,
+    }
+
+    PRIMITIVE_SKIPPERS: Dict[str, Skipper] = {
+        'string': BinaryReader.skip_string,
+        'bool': _skip_byte,
+        'uint': BinaryReader.skip_uleb128,
+        'FixPoint': BinaryReader.skip_uleb128,
+        'int': BinaryReader.skip_uleb128,
+        'float': _skip_float,
+        'double': _skip_double,
+        'byte': _skip_byte,
+    }
+
+    def __init__(self, loader, profiler: DecodeProfiler = None):
+        """
+        :param loader: ConfigLoader providing the class loader and dynamic value parsers
+        :param profiler: Wrap every class and field type decoder to collect statistics if provided
+        """
+        self._loader = loader
+        self._profiler = profiler
+        self._class = loader._class
+        self._class_decoders: Dict[Tuple[str, bool, bool, Optional[FrozenSet[str]]], Decoder] = {}
+        self._type_decoders: Dict[Union[str, Tuple[str, ...]], Decoder] = {}
+        self._class_skippers: Dict[Tuple[str, bool], Skipper] = {}
+        self._type_skippers: Dict[Union[str, Tuple[str, ...]], Skipper] = {}
+        # Classes already reported to have none of the projected fields
+        self._unmatched_classes: Set[str] = set()
+
+    def get_class_decoder(self, class_name: str, parse_derivation: bool = True, add_typing: bool = True,
+                          fields: FrozenSet[str] = None) -> Decoder:
+        """
+        :param fields: Only decode these fields of the class, the others are skipped. Nested classes are decoded whole
+        """
+        key = (class_name, parse_derivation, add_typing, fields)
+        decoder = self._class_decoders.get(key)
+        if decoder is None:
+            decoder = self._compile_class(class_name, parse_derivation, add_typing, fields)
+        return decoder
+
+    def get_field_decoder(self, field_type: Union[FieldDecl, str]) -> Decoder:
+        if isinstance(field_type, FieldDecl):
+            if field_type.is_generic:
+                key = (field_type.type, *field_type.generic_type)
+                decoder = self._type_decoders.get(key)
+                if decoder is None:
+                    decoder = self._compile_generic(field_type)
+                    if self._profiler is not None:
+                        decoder = self._profiler.wrap('type', f'{key[0]}<{", ".join(key[1:])}>', decoder)
+                    self._type_decoders[key] = decoder
+                return decoder
+            field_type = field_type.type
+        decoder = self._type_decoders.get(field_type)
+        if decoder is None:
+            decoder = self._compile_type(field_type)
+            # Class decoders are wrapped when compiled
+            if self._profiler is not None and decoder is not self._class_decoders.get((field_type, True, True, None)):
+                decoder = self._profiler.wrap('type', field_type, decoder)
+            self._type_decoders[field_type] = decoder
+        return decoder
+
+    def _compile_class(self, class_name: str, parse_derivation: bool, add_typing: bool,
+                       projection: Optional[FrozenSet[str]]) -> Decoder:
+        key = (class_name, parse_derivation, add_typing, projection)
+        type_name = 'RPG.GameCore.' + class_name
+        typed = not parse_derivation and add_typing
+
+        if class_name in ZIPPED_CLASS:
+            # Fuck the zipper
+            if typed:
+                def decode_zipped(reader):
+                    return {'$type': type_name, 'TaskEnabled': True}
+            else:
+                def decode_zipped(reader):
+                    return {'TaskEnabled': True}
+            self._class_decoders[key] = decode_zipped
+            return decode_zipped
+
+        if parse_derivation and self._class.has_derivation_class(class_name):
+            # Find Real Signature of Class. Avoid death loop.
+            sub_decoders: Dict[int, Decoder] = {}
+
+            def decode_derivation(reader):
+                cls_idx = reader.read_uleb128()
+                decoder = sub_decoders.get(cls_idx)
+                if decoder is None:
+                    cls_name = self._class.get_derivation_class_name(class_name, cls_idx)
+                    if not cls_name:
+                        raise ValueError(f'Unknown class index {cls_idx} for class {class_name}')
+                    decoder = sub_decoders[cls_idx] = self.get_class_decoder(cls_name, False, True, projection)
+                return decoder(reader)
+            self._class_decoders[key] = decode_derivation
+            return decode_derivation
+
+        # TaskConfig use merge field instead of lookup base class.
+        class_decl = self._class.get_class(class_name, True)
+        if class_decl is None:
+            decoder = _raise_on_decode(ValueError, f'Unknown class {class_name}')
+            self._class_decoders[key] = decoder
+            return decoder
+
+        # Filled after the decoder is registered, so self-referencing classes resolve to the same closure
+        fields = []
+
+        if projection is None:
+            def decode_class(reader):
+                result = {'$type': type_name} if typed else {}
+                mask = reader.read_uleb128()
+                for name, decoder, bit in fields:
+                    if mask & bit:
+                        result[name] = decoder(reader)
+                    elif mask < bit:
+                        break
+                return result
+        else:
+            def decode_class(reader):
+                result = {'$type': type_name} if typed else {}
+                mask = reader.read_uleb128()
+                for name, decoder, bit in fields:
+                    if mask & bit:
+                        # Unwanted fields have no name and a skipper as decoder
+                        if name is None:
+                            decoder(reader)
+                        else:
+                            result[name] = decoder(reader)
+                    elif mask < bit:
+                        break
+                return result
+        if self._profiler is not None:
+            decode_class = self._profiler.wrap('class', class_name, decode_class)
+        self._class_decoders[key] = decode_class
+
+        mask_bit = 1
+        for field in class_decl:
+            if projection is None or field.name in projection:
+                fields.append((field.name, self.get_member_decoder(field), mask_bit))
+            else:
+                fields.append((None, self.get_member_skipper(field), mask_bit))
+            mask_bit <<= 1
+        if projection is not None and all(name is None for name, _, _ in fields) and \
+                class_name not in self._unmatched_classes:
+            self._unmatched_classes.add(class_name)
+            logger.warning(f'Class {class_name} has none of the fields {", ".join(sorted(projection))}, '
+                           f'its objects are extracted without fields')
+        return decode_class
+
+    def get_member_decoder(self, field: FieldDecl) -> Decoder:
+        """
+        Decoder of a field of a class, arrays included.
+        """
+        if field.is_array and not field.is_generic and field.type in self.PRIMITIVE_ARRAY_DECODERS:
+            key = field.type + '[]'
+            decoder = self._type_decoders.get(key)
+            if decoder is None:
+                decoder = self._compile_primitive_array(self.PRIMITIVE_ARRAY_DECODERS[field.type])
+                if self._profiler is not None:
+                    decoder = self._profiler.wrap('type', key, decoder)
+                self._type_decoders[key] = decoder
+            return decoder
+        decoder = self.get_field_decoder(field)
+        if field.is_array:
+            decoder = self._compile_array(decoder)
+        return decoder
+
+    @staticmethod
+    def _compile_primitive_array(read_array: Callable[[BinaryReader, int], list]) -> Decoder:
+        def decode_array(reader):
+            return read_array(reader, reader.read_array_len())
+        return decode_array
+
+    @staticmethod
+    def _compile_array(element_decoder: Decoder) -> Decoder:
+        def decode_array(reader):
+            return [element_decoder(reader) for _ in range(reader.read_array_len())]
+        return decode_array
+
+    def _compile_generic(self, field: FieldDecl) -> Decoder:
+        if field.type != 'Dictionary':
+            return _raise_on_decode(NotImplementedError, "Unsupported generic type: " + str(field))
+        key_decoder = self.get_field_decoder(field.generic_type[0])
+        value_decoder = self.get_field_decoder(field.generic_type[-1])
+
+        def decode_dictionary(reader):
+            ret = {}
+            for _ in range(reader.read_sleb128()):
+                key = key_decoder(reader)
+                ret[key] = value_decoder(reader)
+            return ret
+        return decode_dictionary
+
+    def _compile_type(self, field_type: str) -> Decoder:
+        decoder = self.PRIMITIVE_DECODERS.get(field_type)
+        if decoder is not None:
+            return decoder
+        loader = self._loader
+        if field_type == 'DynamicFloat':
+            if loader._compact_dynamic:
+                return loader.parse_dynamic_float_compact if loader._beta else loader.parse_dynamic_float_rel_compact
+            return loader.parse_dynamic_float if loader._beta else loader.parse_dynamic_float_rel
+        if field_type == 'DynamicValue':
+            return loader.parse_dynamic_value_compact if loader._compact_dynamic else loader.parse_dynamic_value
+        if field_type == self._class.dyn_value_decl:
+            return loader.parse_dynamic_values
+        if field_type == 'TextID' or field_type == 'StringHash':
+            return _hash_object
+        if field_type.startswith('MVector'):
+            try:
+                vector_size = int(field_type[7])
+            except (IndexError, ValueError) as e:
+                return _raise_on_decode(type(e), str(e))
+            parse_vector = loader.parse_vector
+            return lambda reader: parse_vector(reader, vector_size)
+        if self._class.contain_enum(field_type):
+            enum_decl = self._class.get_enum(field_type)
+            if enum_decl.is_int():
+                read_value = BinaryReader.read_sleb128
+            elif enum_decl.is_ushort() or enum_decl.is_uint():
+                read_value = BinaryReader.read_uleb128
+            else:
+                return _raise_on_decode(NotImplementedError, f'Unknown enum value type {enum_decl.val_type}')
+            names = enum_decl.rev_dict
+            return lambda reader: names[read_value(reader)]
+        if self._class.contain_class(field_type):
+            return self.get_class_decoder(field_type)
+        return _raise_on_decode(NotImplementedError, f'Unknown type {field_type}')
+
+    def get_class_skipper(self, class_name: str, parse_derivation: bool = True) -> Skipper:
+        key = (class_name, parse_derivation)
+        skipper = self._class_skippers.get(key)
+        if skipper is None:
+            skipper = self._compile_class_skipper(class_name, parse_derivation)
+        return skipper
+
+    def get_field_skipper(self, field_type: Union[FieldDecl, str]) -> Skipper:
+        if isinstance(field_type, FieldDecl):
+            if field_type.is_generic:
+                key = (field_type.type, *field_type.generic_type)
+                skipper = self._type_skippers.get(key)
+                if skipper is None:
+                    skipper = self._type_skippers[key] = self._compile_generic_skipper(field_type)
+                return skipper
+            field_type = field_type.type
+        skipper = self._type_skippers.get(field_type)
+        if skipper is None:
+            skipper = self._type_skippers[field_type] = self._compile_type_skipper(field_type)
+        return skipper
+
+    def get_member_skipper(self, field: FieldDecl) -> Skipper:
+        if field.is_array and not field.is_generic and field.type in self.FIXED_SIZES:
+            size = self.FIXED_SIZES[field.type]
+            return lambda reader: reader.skip(reader.read_array_len() * size)
+        skipper = self.get_field_skipper(field)
+        if field.is_array:
+            skipper = self._compile_array_skipper(skipper)
+        return skipper
+
+    def _compile_class_skipper(self, class_name: str, parse_derivation: bool) -> Skipper:
+        # Mirrors _compile_class, only the reader position matters
+        key = (class_name, parse_derivation)
+        if class_name in ZIPPED_CLASS:
+            self._class_skippers[key] = _skip_none
+            return _skip_none
+
+        if parse_derivation and self._class.has_derivation_class(class_name):
+            sub_skippers: Dict[int, Skipper] = {}
+
+            def skip_derivation(reader):
+                cls_idx = reader.read_uleb128()
+                skipper = sub_skippers.get(cls_idx)
+                if skipper is None:
+                    cls_name = self._class.get_derivation_class_name(class_name, cls_idx)
+                    if not cls_name:
+                        raise ValueError(f'Unknown class index {cls_idx} for class {class_name}')
+                    skipper = sub_skippers[cls_idx] = self.get_class_skipper(cls_name, False)
+                skipper(reader)
+            self._class_skippers[key] = skip_derivation
+            return skip_derivation
+
+        if self._class.get_class(class_name, True) is None:
+            skipper = _raise_on_decode(ValueError, f'Unknown class {class_name}')
+            self._class_skippers[key] = skipper
+            return skipper
+
+        fields = []
+
+        def skip_class(reader):
+            start = reader.tell()
+            try:
+                mask = reader.read_uleb128()
+                bit = 1
+                for skipper in fields:
+                    if mask & bit:
+                        skipper(reader)
+                    elif mask < bit:
+                        break
+                    bit <<= 1
+            except DecodeError as e:
+                e.path.append(class_name)
+                raise
+            except Exception as e:
+                raise DecodeError(class_name, start, e) from e
+        self._class_skippers[key] = skip_class
+        fields.extend(self.get_member_skipper(field) for field in self._class.get_class(class_name, True))
+        return skip_class
+
+    @staticmethod
+    def _compile_array_skipper(element_skipper: Skipper) -> Skipper:
+        if element_skipper is _skip_none:
+            return BinaryReader.skip_uleb128
+
+        def skip_array(reader):
+            for _ in range(reader.read_array_len()):
+                element_skipper(reader)
+        return skip_array
+
+    def _compile_generic_skipper(self, field: FieldDecl) -> Skipper:
+        if field.type != 'Dictionary':
+            return _raise_on_decode(NotImplementedError, "Unsupported generic type: " + str(field))
+        key_skipper = self.get_field_skipper(field.generic_type[0])
+        value_skipper = self.get_field_skipper(field.generic_type[-1])
+
+        def skip_dictionary(reader):
+            for _ in range(reader.read_sleb128()):
+                key_skipper(reader)
+                value_skipper(reader)
+        return skip_dictionary
+
+    def _compile_type_skipper(self, field_type: str) -> Skipper:
+        # Mirrors _compile_type
+        skipper = self.PRIMITIVE_SKIPPERS.get(field_type)
+        if skipper is not None:
+            return skipper
+        if field_type == 'DynamicFloat':
+            return _skip_dynamic_float if self._loader._beta else _skip_dynamic_float_rel
+        if field_type == 'DynamicValue':
+            return _skip_dynamic_value
+        if field_type == self._class.dyn_value_decl:
+            return _skip_dynamic_values
+        if field_type == 'TextID' or field_type == 'StringHash':
+            return BinaryReader.skip_uleb128
+        if field_type.startswith('MVector'):
+            try:
+                vector_size = int(field_type[7])
+            except (IndexError, ValueError) as e:
+                return _raise_on_decode(type(e), str(e))
+            if vector_size not in (2, 3, 4):
+                # parse_vector reads nothing for other sizes
+                return _skip_none
+            return lambda reader: reader.skip(vector_size * 4)
+        if self._class.contain_enum(field_type):
+            enum_decl = self._class.get_enum(field_type)
+            if not (enum_decl.is_int() or enum_decl.is_ushort() or enum_decl.is_uint()):
+                return _raise_on_decode(NotImplementedError, f'Unknown enum value type {enum_decl.val_type}')
+            return BinaryReader.skip_uleb128
+        if self._class.contain_class(field_type):
+            return self.get_class_skipper(field_type)
+        return _raise_on_decode(NotImplementedError, f'Unknown type {field_type}')
@@ -1,8 +1,10 @@
 import os
-from typing import List, Optional
+import mmap
+from typing import Dict, Iterable, List, Optional
 from logger import get_logger
 from binary_reader import BinaryReader
-from utils import bytes_to_hex_string, get_stable_hash
+from hashing import get_stable_hash, get_stable_hashes
+from utils import bytes_to_hex_string
 
 logger = get_logger('DesignIndexLoader')
 
@@ -53,9 +55,14 @@ class FileEntry:
 class DesignIndexLoader:
     def __init__(self, path: str, version: str = '1.0.0'):
         path = os.path.abspath(path)
+        self.path = path
         self.file_entries: List[FileEntry] = []
         self.hash_map = {}
+        # Reverse index of known names, see register_names
+        self.name_map: Dict[str, DesignConfigEntry] = {}
         self.dir_path = None
+        # Container files are mapped once and kept open for the lifetime of the loader
+        self._containers: Dict[str, mmap.mmap] = {}
         self.version = version
         if os.path.isdir(path):
             self.dir_path = path
@@ -94,9 +101,40 @@ class DesignIndexLoader:
         logger.info(f'Loaded {len(self.file_entries)} files')
         logger.info(f'Loaded {len(self.hash_map)} entries')
 
+    def register_names(self, names: Iterable[str]) -> int:
+        """
+        Add known names (manifest items, excel candidates, string literals...) to the reverse index,
+        so lookups and existence checks of them are a single dict hit.
+        :param names:
+        :return: Number of names found in the index
+        """
+        names = list(names)
+        found = 0
+        for name, hash_ in zip(names, get_stable_hashes(names)):
+            entry = self.hash_map.get(hash_)
+            if entry is not None:
+                self.name_map[name] = entry
+                found += 1
+        logger.info(f'Registered {found} of {len(names)} known names')
+        return found
+
+    def find_entry(self, name: str) -> Optional[DesignConfigEntry]:
+        # Same as get_entry, but without warning for missing entries. Used to probe candidate names
+        entry = self.name_map.get(name)
+        if entry is not None:
+            return entry
+        return self.hash_map.get(get_stable_hash(name))
+
+    def contains(self, name: str) -> bool:
+        return self.find_entry(name) is not None
+
     def get_entry(self, hash_: int = None, name: str = None) -> Optional[DesignConfigEntry]:
         if (not hash_ and not name) or (hash_ and name):
             raise ValueError('Only one of hash_ and name should be provided')
+        if name is not None:
+            entry = self.name_map.get(name)
+            if entry is not None:
+                return entry
         if not hash_:
             hash_ = get_stable_hash(name)
         entry = self.hash_map.get(hash_)
@@ -104,13 +142,56 @@ class DesignIndexLoader:
             logger.warning(f'Can\'t find entry for hash {hash_} ({name})')
         return entry
 
+    def _map_container(self, filename: str) -> Optional[mmap.mmap]:
+        mapped = self._containers.get(filename)
+        if mapped is None:
+            with open(os.path.join(self.dir_path, filename), 'rb') as f:
+                try:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    # Empty file can't be mapped
+                    return None
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                # Chunks are extracted in container order, see ExtractionPlanner. Advised on mapping, so worker
+                # processes that map their own containers read ahead as well
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            self._containers[filename] = mapped
+        return mapped
+
+    def get_container(self, filename: str) -> memoryview:
+        """
+        Get a read-only view of a container file. The file is mapped on first access and kept open.
+        :param filename: Container file name, aka. FileEntry.filename
+        :return:
+        """
+        mapped = self._map_container(filename)
+        if mapped is None:
+            return memoryview(b'')
+        return memoryview(mapped)
+
+    def get_chunk(self, entry: DesignConfigEntry) -> memoryview:
+        return self.get_container(entry.parent.filename)[entry.offset:entry.offset + entry.size]
+
     def get_reader(self, hash_: int = None, name: str = None) -> Optional[BinaryReader]:
         entry = self.get_entry(hash_, name)
         if not entry:
             return None
-        with open(os.path.join(self.dir_path, entry.parent.filename), 'rb') as f:
-            buffer = f.read()
-        return BinaryReader(buffer=buffer[entry.offset:entry.offset + entry.size])
+        return BinaryReader(buffer=self.get_chunk(entry))
+
+    def close(self):
+        for mapped in self._containers.values():
+            try:
+                mapped.close()
+            except BufferError:
+                # Still referenced by some reader, let the gc release it
+                pass
+        self._containers.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
     def dump(self, path: str, hash_: int = None, name: str = None):
         reader = self.get_reader(hash_, name)
@@ -0,0 +1,251 @@
+import json
+from array import array
+from collections.abc import Mapping
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from binary_reader import BinaryReader
+from class_loader import FieldDecl
+from decoder_compiler import DecoderCompiler
+from logger import get_logger
+
+logger = get_logger('ExcelColumns')
+
+# Field type -> (array typecode, numpy dtype, decoder) of fields stored as typed arrays.
+# TextID and StringHash columns hold the hash instead of {"Hash": hash}
+SCALAR_COLUMNS = {
+    'int': ('q', 'int64', BinaryReader.read_sleb128),
+    'uint': ('Q', 'uint64', BinaryReader.read_uleb128),
+    'FixPoint': ('d', 'float64', DecoderCompiler.PRIMITIVE_DECODERS['FixPoint']),
+    'float': ('f', 'float32', BinaryReader.read_float),
+    'double': ('d', 'float64', BinaryReader.read_double),
+    'bool': ('B', 'bool', BinaryReader.read_bool),
+    'byte': ('B', 'uint8', BinaryReader.read_byte),
+    'TextID': ('i', 'int32', BinaryReader.read_hash),
+    'StringHash': ('i', 'int32', BinaryReader.read_hash),
+}
+
+# Bump when the layout of saved columns changes
+NPZ_VERSION = 1
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError('Columnar excels need numpy, install it with pip install numpy') from e
+    return numpy
+
+
+def _read_raw_string(reader: BinaryReader) -> bytes:
+    # Strings stay UTF-8, they are only decoded on access
+    return reader.read_bytes(reader.read_uleb128())
+
+
+def get_column_kind(field: FieldDecl) -> str:
+    """
+    :return: scalar, string or object
+    """
+    if field.is_array or field.is_generic:
+        return 'object'
+    if field.type in SCALAR_COLUMNS:
+        return 'scalar'
+    return 'string' if field.type == 'string' else 'object'
+
+
+class Column:
+    """
+    Values of one field for every row of an excel, with a mask of the rows that have the field.
+    kind is scalar for a typed array, string for UTF-8 texts in one buffer with offsets, or object for nested values.
+    Absent scalars are 0 in values.
+    """
+
+    def __init__(self, kind: str, values, mask, offsets=None):
+        """
+        :param values: Typed array for scalar, uint8 buffer for string and object array for object
+        :param offsets: Start of every string in values and the end of the last one, for string
+        """
+        self.kind = kind
+        self.values = values
+        self.mask = mask
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.mask)
+
+    def __getitem__(self, row: int):
+        """
+        :return: Value of a row, None if the row doesn't have the field
+        """
+        if not self.mask[row]:
+            return None
+        if self.kind == 'string':
+            return self.values[self.offsets[row]:self.offsets[row + 1]].tobytes().decode('utf-8')
+        value = self.values[row]
+        return value.item() if self.kind == 'scalar' else value
+
+    def tolist(self) -> list:
+        return [self[row] for row in range(len(self))]
+
+
+class ExcelColumns(Mapping):
+    """
+    Excel decoded into one Column per row field, see ConfigLoader.load_excel_columns.
+    Rows stay in the order of the chunk, repeated keys included. Fields of a row are written straight to their columns,
+    no row dict is built.
+    """
+
+    def __init__(self, name: str, index_field: str, row_count: int, columns: Dict[str, Column]):
+        self.name = name
+        self.index_field = index_field
+        self.row_count = row_count
+        self._columns = columns
+
+    def __getitem__(self, field: str) -> Column:
+        return self._columns[field]
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return len(self._columns)
+
+    @classmethod
+    def decode(cls, name: str, reader: BinaryReader, compiler: DecoderCompiler, fields: List[FieldDecl],
+               index_field: str, projection: Optional[FrozenSet[str]] = None) -> 'ExcelColumns':
+        """
+        :param reader: Reader over the excel chunk, positioned at the start
+        :param fields: Fields of the row class, base classes included
+        :param index_field: Name of the field whose value is the key of a row
+        :param projection: Only decode these fields, the others are skipped. The index field is always decoded
+        """
+        np = _numpy()
+        row_count = reader.read_array_len()
+        # A field redeclared by a subclass shares the column of its name, which is an object column if they differ
+        kinds: Dict[str, str] = {}
+        types: Dict[str, Tuple[str, str]] = {}
+        for field in fields:
+            kind = get_column_kind(field)
+            kind_type = (kind, field.type if kind == 'scalar' else '')
+            kinds[field.name] = kind if types.setdefault(field.name, kind_type) == kind_type else 'object'
+        stores = {}
+        masks = {}
+        dtypes = {}
+        plan = []
+        mask_bit = 1
+        for field in fields:
+            field_name = field.name
+            if projection is not None and field_name not in projection and field_name != index_field:
+                plan.append((None, None, compiler.get_member_skipper(field), mask_bit))
+                mask_bit <<= 1
+                continue
+            kind = kinds[field_name]
+            if field_name not in stores:
+                if kind == 'scalar':
+                    typecode, dtypes[field_name], _ = SCALAR_COLUMNS[field.type]
+                    stores[field_name] = array(typecode, bytes(row_count * array(typecode).itemsize))
+                else:
+                    stores[field_name] = [b'' if kind == 'string' else None] * row_count
+                masks[field_name] = bytearray(row_count)
+            if kind == 'scalar':
+                decoder = SCALAR_COLUMNS[field.type][2]
+            elif kind == 'string':
+                decoder = _read_raw_string
+            else:
+                decoder = compiler.get_member_decoder(field)
+            plan.append((stores[field_name], masks[field_name], decoder, mask_bit))
+            mask_bit <<= 1
+
+        for row in range(row_count):
+            bits = reader.read_uleb128()
+            for store, present, decoder, bit in plan:
+                if bits & bit:
+                    if store is None:
+                        decoder(reader)
+                    else:
+                        store[row] = decoder(reader)
+                        present[row] = 1
+                elif bits < bit:
+                    break
+
+        # Rows without a key are keyed by their position, same as load_binary_excel
+        index_store, index_mask = stores[index_field], masks[index_field]
+        for row in range(row_count):
+            if not index_mask[row]:
+                index_store[row] = str(row).encode() if kinds[index_field] == 'string' else row
+                index_mask[row] = 1
+
+        columns = {}
+        for field_name, store in stores.items():
+            kind = kinds[field_name]
+            mask = np.frombuffer(masks[field_name], dtype=bool)
+            if kind == 'scalar':
+                columns[field_name] = Column(kind, np.frombuffer(store, dtype=dtypes[field_name]), mask)
+            elif kind == 'string':
+                offsets = np.zeros(row_count + 1, dtype=np.int64)
+                np.cumsum(np.fromiter(map(len, store), dtype=np.int64, count=row_count), out=offsets[1:])
+                columns[field_name] = Column(kind, np.frombuffer(b''.join(store), dtype=np.uint8), mask, offsets)
+            else:
+                values = np.empty(row_count, dtype=object)
+                # Element by element, so nested lists aren't turned into more dimensions
+                for row, value in enumerate(store):
+                    values[row] = value
+                columns[field_name] = Column(kind, values, mask)
+        logger.info(f'{name} excel decoded into {len(columns)} columns, {row_count} rows')
+        return cls(name, index_field, row_count, columns)
+
+    def save(self, path: str, compressed: bool = False):
+        """
+        Write the columns as a .npz file, readable without pickle.
+        Arrays of a field are stored as <field>/values, <field>/mask and <field>/offsets.
+        Object columns are stored as JSON texts like string columns, so nested values come back as JSON would
+        """
+        np = _numpy()
+        arrays = {}
+        kinds = []
+        for name, column in self._columns.items():
+            arrays[f'{name}/mask'] = column.mask
+            if column.kind == 'object':
+                texts = [json.dumps(value, ensure_ascii=False).encode('utf-8') if present else b''
+                         for value, present in zip(column.values, column.mask)]
+                offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+                np.cumsum(np.fromiter(map(len, texts), dtype=np.int64, count=len(texts)), out=offsets[1:])
+                arrays[f'{name}/values'] = np.frombuffer(b''.join(texts), dtype=np.uint8)
+                arrays[f'{name}/offsets'] = offsets
+                kinds.append((name, 'json'))
+                continue
+            arrays[f'{name}/values'] = column.values
+            if column.offsets is not None:
+                arrays[f'{name}/offsets'] = column.offsets
+            kinds.append((name, column.kind))
+        arrays['__meta__'] = np.array(json.dumps({
+            'version': NPZ_VERSION,
+            'name': self.name,
+            'index_field': self.index_field,
+            'row_count': self.row_count,
+            'columns': kinds,
+        }))
+        with open(path, 'wb') as f:
+            (np.savez_compressed if compressed else np.savez)(f, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> 'ExcelColumns':
+        np = _numpy()
+        with np.load(path) as data:
+            meta = json.loads(data['__meta__'].item())
+            if meta.get('version') != NPZ_VERSION:
+                raise ValueError(f'Unsupported columns file version {meta.get("version")}')
+            columns = {}
+            for name, kind in meta['columns']:
+                mask = data[f'{name}/mask']
+                values = data[f'{name}/values']
+                if kind == 'json':
+                    offsets = data[f'{name}/offsets']
+                    texts = Column('string', values, mask, offsets)
+                    objects = np.empty(len(mask), dtype=object)
+                    for row in range(len(mask)):
+                        objects[row] = json.loads(texts[row]) if mask[row] else None
+                    columns[name] = Column('object', objects, mask)
+                elif kind == 'string':
+                    columns[name] = Column(kind, values, mask, data[f'{name}/offsets'])
+                else:
+                    columns[name] = Column(kind, values, mask)
+        return cls(meta['name'], meta['index_field'], meta['row_count'], columns)
@@ -0,0 +1,138 @@
+import os
+import pickle
+import sys
+from array import array
+from collections.abc import Mapping
+from typing import Dict, List, Optional
+from binary_reader import BinaryReader
+from decoder_compiler import Decoder, Skipper
+from logger import get_logger
+
+logger = get_logger('ExcelTable')
+
+# Bump when the layout of the offset index file changes
+INDEX_CACHE_VERSION = 1
+
+
+class ExcelTable(Mapping):
+    """
+    Read only view of an excel, keyed the same way as ConfigLoader.load_binary_excel.
+    The table is scanned once to record the offset and key of every row, rows are only decoded when accessed.
+    Supports table[key], iteration over keys, and table[start:stop] for a list of rows in key order.
+    The design index the table was opened from must stay open while the table is in use.
+    """
+
+    def __init__(self, name: str, reader: BinaryReader, index_field: str, decoder: Decoder,
+                 key_decoder: Decoder, skipper: Skipper, cache_path: str = None, cache_key: str = None):
+        """
+        :param name: Excel class name, for logging
+        :param reader: Reader over the excel chunk, positioned at the start
+        :param index_field: Name of the first field, whose value is the key of a row
+        :param decoder: Row decoder
+        :param key_decoder: Decoder of the first field
+        :param skipper: Row skipper, used when scanning
+        :param cache_path: Offset index cache file. The scan is skipped if the cache matches cache_key
+        :param cache_key: Identity of the chunk content and schema
+        """
+        self.name = name
+        self._reader = reader
+        self._index_field = index_field
+        self._decoder = decoder
+        self._keys: Optional[List[str]] = None
+        if cache_path and cache_key and self._load_index(cache_path, cache_key):
+            return
+        self._offsets, self._index = self._scan(reader, key_decoder, skipper)
+        if cache_path and cache_key:
+            self._save_index(cache_path, cache_key)
+
+    @staticmethod
+    def _scan(reader: BinaryReader, key_decoder: Decoder, skipper: Skipper):
+        reader.reset()
+        offsets = array('Q')
+        # A repeated key keeps its first position with the last row, same as load_binary_excel
+        index: Dict[str, int] = {}
+        for row in range(reader.read_array_len()):
+            offset = reader.tell()
+            offsets.append(offset)
+            if reader.read_uleb128() & 1:
+                key = str(key_decoder(reader))
+            else:
+                key = str(row)
+            reader.seek(offset)
+            skipper(reader)
+            index[key] = row
+        return offsets, index
+
+    def _load_index(self, cache_path: str, cache_key: str) -> bool:
+        if not os.path.isfile(cache_path):
+            return False
+        try:
+            with open(cache_path, 'rb') as f:
+                cache = pickle.load(f)
+        except Exception as e:
+            logger.warning(f'Failed to load offset index {cache_path}. Error: {e}')
+            return False
+        if not isinstance(cache, dict) or cache.get('version') != INDEX_CACHE_VERSION or \
+                cache.get('key') != cache_key:
+            return False
+        self._offsets = array('Q')
+        self._offsets.frombytes(cache['offsets'])
+        self._index = cache['index']
+        return True
+
+    def _save_index(self, cache_path: str, cache_key: str):
+        cache = {
+            'version': INDEX_CACHE_VERSION,
+            'key': cache_key,
+            'offsets': self._offsets.tobytes(),
+            'index': self._index,
+        }
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f'Failed to save offset index {cache_path}. Error: {e}')
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @property
+    def row_count(self) -> int:
+        """
+        Number of rows in the chunk, repeated keys included.
+        """
+        return len(self._offsets)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Estimated memory held by the offset index, rows are not kept.
+        """
+        return self._offsets.itemsize * len(self._offsets) + sys.getsizeof(self._index) + \
+            sum(sys.getsizeof(key) for key in self._index)
+
+    def decode_row(self, row: int) -> dict:
+        reader = self._reader
+        reader.seek(self._offsets[row])
+        data = {self._index_field: row}
+        data.update(self._decoder(reader))
+        return data
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if self._keys is None:
+                self._keys = list(self._index)
+            return [self.decode_row(self._index[k]) for k in self._keys[key]]
+        return self.decode_row(self._index[key if isinstance(key, str) else str(key)])
+
+    def __contains__(self, key) -> bool:
+        return (key if isinstance(key, str) else str(key)) in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
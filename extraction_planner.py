@@ -0,0 +1,47 @@
+from typing import Callable, Dict, Iterable, List, Optional, TypeVar
+from design_index_loader import DesignIndexLoader, DesignConfigEntry
+from logger import get_logger
+
+logger = get_logger('ExtractionPlanner')
+
+T = TypeVar('T')
+
+
+class ExtractionPlanner:
+    """
+    Schedule extraction work by its location in the design data.
+    Items are grouped by container file and sorted by offset, so each container is read from start to end once
+    instead of jumping between containers and offsets in manifest order.
+    """
+
+    def __init__(self, design: DesignIndexLoader):
+        self._design = design
+
+    def resolve(self, name: Optional[str]) -> Optional[DesignConfigEntry]:
+        if not name:
+            return None
+        return self._design.find_entry(name)
+
+    def plan(self, items: Iterable[T], get_name: Callable[[T], Optional[str]]) -> List[T]:
+        """
+        Order items by (container, offset).
+        :param items: Work items
+        :param get_name: Map an item to the name of the chunk it reads
+        :return: Items in reading order. Items without a chunk are kept at the end in their original order,
+                 so the regular error handling still reports them.
+        """
+        groups: Dict[str, List[tuple]] = {}
+        missing = []
+        for idx, item in enumerate(items):
+            entry = self.resolve(get_name(item))
+            if entry is None:
+                missing.append(item)
+                continue
+            groups.setdefault(entry.parent.filename, []).append((entry.offset, idx, item))
+        ordered = []
+        for filename in sorted(groups.keys()):
+            group = groups[filename]
+            group.sort(key=lambda it: it[:2])
+            ordered.extend(it[2] for it in group)
+        logger.info(f'Planned {len(ordered)} chunks in {len(groups)} containers. {len(missing)} items not found.')
+        return ordered + missing
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Set
+from design_index_loader import DesignConfigEntry
+from logger import get_logger
+
+logger = get_logger('ExtractionState')
+
+STATE_FILE_NAME = '.extract_state.json'
+# Bump when the layout of the state file changes
+STATE_VERSION = 1
+
+
+class ExtractionState:
+    """
+    Digest of every chunk extracted into an output directory, used to skip chunks unchanged since the last run.
+    Records are keyed by output path relative to the output directory, since one chunk may be written to several
+    outputs. Each record keeps the phase, entry hash and content digest of the chunk.
+    """
+
+    def __init__(self, output_dir: str, fingerprint: str):
+        """
+        :param output_dir: Root output directory. The state file is stored inside
+        :param fingerprint: Everything besides chunk content that affects the output, e.g. schema hash and options.
+                            All records are invalidated when it changes
+        """
+        self.root = os.path.abspath(output_dir)
+        self.path = os.path.join(self.root, STATE_FILE_NAME)
+        self.fingerprint = fingerprint
+        self._invalidated = False
+        self._previous: Dict[str, dict] = self._load()
+        self._current: Dict[str, dict] = {}
+        self._pending: Dict[str, dict] = {}
+        self._visited: Set[str] = set()
+        self._phases: Set[str] = set()
+        self.added: List[str] = []
+        self.changed: List[str] = []
+        self._unchanged: Set[str] = set()
+
+    def _load(self) -> Dict[str, dict]:
+        if not os.path.isfile(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f'Failed to load extraction state {self.path}. Error: {e}')
+            return {}
+        if state.get('version') != STATE_VERSION or state.get('fingerprint') != self.fingerprint:
+            logger.info('Schema or options changed since last run. Extract everything again.')
+            self._invalidated = True
+        return state.get('entries', {})
+
+    @staticmethod
+    def digest(chunk) -> str:
+        return hashlib.blake2b(chunk, digest_size=16).hexdigest()
+
+    def _key(self, output_path: str) -> str:
+        return os.path.relpath(os.path.abspath(output_path), self.root).replace(os.sep, '/')
+
+    def needs_update(self, phase: str, output_path: str, entry: DesignConfigEntry, chunk) -> bool:
+        """
+        Check a chunk against the previous run.
+        :param phase: Extraction phase of the output, e.g. config, excel, story or textmap
+        :param output_path: Path of the output file
+        :param entry: Chunk entry
+        :param chunk: Raw bytes of the chunk
+        :return: False if the output is up to date and can be skipped. Otherwise, call mark_done after extracting
+        """
+        key = self._key(output_path)
+        self._phases.add(phase)
+        self._visited.add(key)
+        record = {'phase': phase, 'hash': entry.hash, 'digest': self.digest(chunk)}
+        if not self._invalidated and self._previous.get(key) == record and os.path.isfile(output_path):
+            self._current[key] = record
+            self._unchanged.add(key)
+            return False
+        self._pending[key] = record
+        return True
+
+    def mark_done(self, output_path: str, ok: bool):
+        record = self._pending.pop(self._key(output_path), None)
+        if record is None or not ok:
+            # Failed outputs are dropped from the state, so they are retried next time
+            return
+        key = self._key(output_path)
+        self._current[key] = record
+        if key in self._previous:
+            self.changed.append(key)
+        else:
+            self.added.append(key)
+
+    @property
+    def unchanged(self) -> int:
+        return len(self._unchanged)
+
+    @property
+    def removed(self) -> List[str]:
+        # Only phases that ran this time can tell an output is gone
+        return [key for key, record in self._previous.items()
+                if record.get('phase') in self._phases and key not in self._visited]
+
+    def report(self) -> dict:
+        return {
+            'added': self.added,
+            'changed': self.changed,
+            'removed': self.removed,
+            'unchanged': self.unchanged,
+        }
+
+    def save(self):
+        entries = dict(self._current)
+        if not self._invalidated:
+            # Keep records of skipped phases, e.g. configs when running with --skip-config
+            for key, record in self._previous.items():
+                if record.get('phase') not in self._phases:
+                    entries.setdefault(key, record)
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': STATE_VERSION, 'fingerprint': self.fingerprint, 'entries': entries}, f)
+        os.replace(tmp_path, self.path)
+        logger.info(f'Incremental extraction: {len(self.added)} added, {len(self.changed)} changed, '
+                    f'{len(self.removed)} removed, {self.unchanged} unchanged.')
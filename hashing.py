@@ -0,0 +1,33 @@
+from functools import lru_cache
+from typing import Iterable, List
+
+
+@lru_cache(maxsize=1 << 17)
+def get_stable_hash(s: str) -> int:
+    """
+    Python version of GNUHash, copy from @CMAGMDKBOOB
+    Both hash lanes are kept as masked unsigned 32-bit integers and converted to int32 once at the end.
+    Results are memoized, the same few thousand paths are hashed over and over during extraction.
+    :param s:
+    :return:
+    """
+    if s is None:
+        return 0
+    # Even characters feed the first lane and odd characters the second one
+    num = 5381
+    for c in s[0::2]:
+        num = (num * 33 ^ ord(c)) & 0xFFFFFFFF
+    num2 = 5381
+    for c in s[1::2]:
+        num2 = (num2 * 33 ^ ord(c)) & 0xFFFFFFFF
+    value = (num + num2 * 1566083941) & 0xFFFFFFFF
+    return value - 0x100000000 if value & 0x80000000 else value
+
+
+def get_stable_hashes(names: Iterable[str]) -> List[int]:
+    """
+    Hash a batch of names, e.g. all candidate paths of an excel class
+    :param names:
+    :return: Hashes in the same order as names
+    """
+    return [get_stable_hash(name) for name in names]
@@ -0,0 +1,93 @@
+import json
+import os
+from contextlib import contextmanager
+from typing import Optional, TextIO
+
+
+class DuplicateKeyError(Exception):
+    pass
+
+
+def get_separators(indent: Optional[int]):
+    # Compact output drops the spaces after separators too
+    return None if indent is not None else (',', ':')
+
+
+def dump_json(data, f: TextIO, indent: Optional[int] = 2, ensure_ascii: bool = True):
+    json.dump(data, f, indent=indent, ensure_ascii=ensure_ascii, separators=get_separators(indent))
+
+
+@contextmanager
+def atomic_open(path: str):
+    """
+    Open a text file for writing through a temp file, which replaces the target only if the block succeeds.
+    A failed streaming write never leaves a truncated output behind.
+    """
+    # Workers may write the same output concurrently, e.g. a story referenced twice
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    f = open(tmp_path, 'w', encoding='utf-8')
+    try:
+        yield f
+    except BaseException:
+        f.close()
+        os.remove(tmp_path)
+        raise
+    f.close()
+    os.replace(tmp_path, path)
+
+
+class JsonStreamWriter:
+    """
+    Write a JSON object member by member, so a table never has to be held in memory as a whole.
+    With indent=2 the output is byte identical to json.dump of the equivalent dict.
+    """
+
+    def __init__(self, f: TextIO, indent: Optional[int] = 2, ensure_ascii: bool = True, unique_keys: bool = False):
+        """
+        :param f: Output file
+        :param indent: Indent of the output, None for compact output
+        :param ensure_ascii: Same as json.dump
+        :param unique_keys: Raise DuplicateKeyError when a key is written twice. A dict keeps the first position
+                            of a key with the last value, which a stream can't reproduce
+        """
+        self._f = f
+        self._indent = indent
+        self._ensure_ascii = ensure_ascii
+        self._separators = get_separators(indent)
+        self._keys = set() if unique_keys else None
+        self._count = 0
+        if indent is not None:
+            self._newline = '\n' + ' ' * indent
+            self._item_separator = ','
+            self._key_separator = ': '
+        else:
+            self._newline = ''
+            self._item_separator = ','
+            self._key_separator = ':'
+
+    def _encode_key(self, key) -> str:
+        if isinstance(key, str):
+            return json.dumps(key, ensure_ascii=self._ensure_ascii)
+        if key is True or key is False or key is None:
+            return json.dumps(json.dumps(key))
+        return '"' + str(key) + '"'
+
+    def write_item(self, key, value):
+        if self._keys is not None:
+            if key in self._keys:
+                raise DuplicateKeyError(key)
+            self._keys.add(key)
+        encoded = json.dumps(value, indent=self._indent, ensure_ascii=self._ensure_ascii,
+                             separators=self._separators)
+        if self._indent is not None:
+            # Strings never contain a raw newline, so it is safe to indent the nested document this way
+            encoded = encoded.replace('\n', self._newline)
+        self._f.write(('{' if self._count == 0 else self._item_separator) + self._newline +
+                      self._encode_key(key) + self._key_separator + encoded)
+        self._count += 1
+
+    def close(self):
+        if self._count == 0:
+            self._f.write('{}')
+        else:
+            self._f.write(('\n' if self._indent is not None else '') + '}')
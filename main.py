@@ -1,59 +1,186 @@
 import json
 import argparse
 import os
+import sys
+from contextlib import nullcontext
 
+from chunk_dedup import DEDUP_MODES
 from class_loader import ClassLoader
 from design_index_loader import DesignIndexLoader
 from textmap_loader import TextmapLoader, Language
 from config_loader import ConfigLoader
+from extraction_planner import ExtractionPlanner
+from extraction_state import ExtractionState
+from profiler import DecodeProfiler
+from query_service import ExtractionService, serve
+from sqlite_writer import SqliteWriter
 
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--design', help='Path to design data folder', required=True)
-parser.add_argument('--cs', help='Path to dump.cs', required=True)
-parser.add_argument('--output', help='Path to output folder', required=True)
-parser.add_argument('--excel-map', help='ExcelClass - sPath map file path')
-parser.add_argument('--beta', help='Parse in beta mode', action='store_true', default=False)
-parser.add_argument('--version', help='Version of the game', default='1.2.53')
-parser.add_argument('--skip-textmap', help='Skip textmap loading', action='store_true', default=False)
-parser.add_argument('--skip-config', help='Skip config loading', action='store_true', default=False)
-parser.add_argument('--skip-excel', help='Skip excel loading', action='store_true', default=False)
-parser.add_argument('--skip-story', help='Skip story loading', action='store_true', default=False)
-args = parser.parse_args()
-
-cls = ClassLoader(args.cs)
-design = DesignIndexLoader(args.design, args.version)
-conf = ConfigLoader(design, cls, args.beta)
-# Load text map
-if not args.skip_textmap:
-    tm_loader = TextmapLoader()
-    os.makedirs(os.path.join(args.output, 'TextMap'), exist_ok=True)
-    for lang in Language:
-        tm_loader.load_by_language(design, lang)
-        tm_loader.dump(os.path.join(args.output, 'TextMap', 'TextMap' + '_' + lang.value.upper() + '.json'))
-# Load configs
-if not args.skip_config:
-    err_conf = conf.load_all_configs(args.output)
-else:
-    err_conf = 'skipped'
-# Load excels
-if not args.skip_excel:
+def serve_main(argv):
+    parser = argparse.ArgumentParser(prog='main.py serve',
+                                     description='Answer lookups of excel rows, configs and texts over local HTTP')
+    parser.add_argument('--design', help='Path to design data folder', required=True)
+    parser.add_argument('--cs', help='Path to dump.cs', required=True)
+    parser.add_argument('--excel-map', help='ExcelClass - sPath map file path')
+    parser.add_argument('--beta', help='Parse in beta mode', action='store_true', default=False)
+    parser.add_argument('--version', help='Version of the game', default='1.2.53')
+    parser.add_argument('--no-schema-cache', help='Always reparse dump.cs instead of using the schema cache',
+                        action='store_true', default=False)
+    parser.add_argument('--host', help='Address to listen on', default='127.0.0.1')
+    parser.add_argument('--port', help='Port to listen on', type=int, default=8642)
+    parser.add_argument('--socket', help='Listen on this Unix socket instead of a port')
+    parser.add_argument('--cache-size', help='Size limit of the cache of opened excels, textmaps and responses in MB', type=int, default=256)
+    args = parser.parse_args(argv)
+
+    cls = ClassLoader(args.cs, use_cache=not args.no_schema_cache)
+    design = DesignIndexLoader(args.design, args.version)
+    conf = ConfigLoader(design, cls, args.beta)
+    excel_map = None
+    if args.excel_map:
+        with open(args.excel_map, 'r', encoding='utf-8') as f:
+            excel_map = json.load(f)['mapping']
+    serve(ExtractionService(design, cls, conf, excel_map, args.cache_size << 20), args.host, args.port, args.socket)
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        serve_main(sys.argv[2:])
+        return
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--design', help='Path to design data folder', required=True)
+    parser.add_argument('--cs', help='Path to dump.cs', required=True)
+    parser.add_argument('--output', help='Path to output folder', required=True)
+    parser.add_argument('--excel-map', help='ExcelClass - sPath map file path')
+    parser.add_argument('--beta', help='Parse in beta mode', action='store_true', default=False)
+    parser.add_argument('--version', help='Version of the game', default='1.2.53')
+    parser.add_argument('--skip-textmap', help='Skip textmap loading', action='store_true', default=False)
+    parser.add_argument('--skip-config', help='Skip config loading', action='store_true', default=False)
+    parser.add_argument('--skip-excel', help='Skip excel loading', action='store_true', default=False)
+    parser.add_argument('--skip-story', help='Skip story loading', action='store_true', default=False)
+    parser.add_argument('--no-schema-cache', help='Always reparse dump.cs instead of using the schema cache',
+                        action='store_true', default=False)
+    parser.add_argument('--incremental', help='Only extract chunks changed since the last run into the same output',
+                        action='store_true', default=False)
+    parser.add_argument('--jobs', help='Number of worker processes for textmaps, configs and stories', type=int,
+                        default=1)
+    parser.add_argument('--compact', help='Write JSON without indentation', action='store_true', default=False)
+    parser.add_argument('--fields', help='Comma separated top level fields to extract from excel rows, configs and '
+                                         'stories. Other fields are skipped, and configs and stories whose class has '
+                                         'none of them are written as {}')
+    parser.add_argument('--textmap-index', help='Also write textmaps as binary index files for fast lookup',
+                        action='store_true', default=False)
+    parser.add_argument('--validate', help='Only check that every excel, config and story decodes to its exact size, '
+                                           'without writing them', action='store_true', default=False)
+    parser.add_argument('--dedup', help='How configs and stories with identical content reuse one decoded output: '
+                                        'copy, link (hardlink) or off', choices=DEDUP_MODES, default='copy')
+    parser.add_argument('--format', help='Write JSON files, or a single SQLite database data.db with a table per excel',
+                        choices=['json', 'sqlite'], default='json')
+    parser.add_argument('--profile', help='Collect decode statistics per class and field type, and write them to '
+                                          'profile.json', action='store_true', default=False)
+    args = parser.parse_args()
+    if args.format == 'sqlite' and not args.validate:
+        if args.incremental:
+            parser.error('--incremental is not supported with --format sqlite')
+        if args.textmap_index:
+            parser.error('--textmap-index is not supported with --format sqlite')
+
+    cls = ClassLoader(args.cs, use_cache=not args.no_schema_cache)
+    design = DesignIndexLoader(args.design, args.version)
+    fields = None
+    if args.fields:
+        fields = sorted({name.strip() for name in args.fields.split(',')} - {''})
+        unknown = set(fields) - cls.get_field_names()
+        if not fields:
+            parser.error('--fields: no field names given')
+        if unknown:
+            parser.error(f'--fields: no class has the fields {", ".join(sorted(unknown))}')
+    state = None
+    if args.incremental and not args.validate:
+        state = ExtractionState(args.output, f'{cls.schema_key}:{args.version}:{args.beta}:{args.compact}:'
+                                             f'{args.textmap_index}:{fields}')
+    indent = None if args.compact else 2
+    profiler = DecodeProfiler() if args.profile else None
+
+    def phase(name: str):
+        return profiler.phase(name) if profiler is not None else nullcontext()
+    excel_map = None
     if args.excel_map:
         with open(args.excel_map, 'r', encoding='utf-8') as f:
-            excel_map = json.load(f)
-    err_excel = conf.load_all_excels(os.path.join(args.output, 'ExcelOutput'), excel_map['mapping'] if args.excel_map else None)
-else:
-    err_excel = 'skipped'
-# Load stories
-if not args.skip_story:
-    err_story = conf.load_all_story(args.output)
-else:
-    err_story = 'skipped'
-# Dump errors
-with open(os.path.join(args.output, 'err.json'), 'w', encoding='utf-8') as f:
-    json.dump({
-        'config': err_conf,
-        'excel': err_excel,
-        'story': err_story
-    }, f, indent=2)
+            excel_map = json.load(f)['mapping']
+    db = None
+    if args.format == 'sqlite' and not args.validate:
+        db = SqliteWriter(os.path.join(args.output, 'data.db'))
+    conf = ConfigLoader(design, cls, args.beta, state, indent, fields, profiler, args.dedup, db)
+    if args.validate:
+        kinds = [kind for kind, skipped in [('excel', args.skip_excel), ('config', args.skip_config),
+                                            ('story', args.skip_story)] if not skipped]
+        with phase('validate'):
+            reports = conf.validate_all(args.jobs, kinds, excel_map)
+        os.makedirs(args.output, exist_ok=True)
+        with open(os.path.join(args.output, 'validate.json'), 'w', encoding='utf-8') as f:
+            json.dump(reports, f, indent=2)
+        if profiler is not None:
+            profiler.log_report()
+            profiler.dump(os.path.join(args.output, 'profile.json'))
+        if reports:
+            sys.exit(1)
+        return
+    # The database only replaces data.db if every phase got through, see SqliteWriter.close
+    with db if db is not None else nullcontext():
+        # Load text map
+        if not args.skip_textmap and db is not None:
+            with phase('textmap'):
+                for lang in ExtractionPlanner(design).plan(list(Language), TextmapLoader.get_textmap_path):
+                    TextmapLoader.insert_language(design, lang, db)
+                db.commit()
+        elif not args.skip_textmap:
+            os.makedirs(os.path.join(args.output, 'TextMap'), exist_ok=True)
+            tasks = []
+            for lang in ExtractionPlanner(design).plan(list(Language), TextmapLoader.get_textmap_path):
+                out_path = os.path.join(args.output, 'TextMap', 'TextMap' + '_' + lang.value.upper() + '.json')
+                entry = design.find_entry(TextmapLoader.get_textmap_path(lang))
+                if state is not None and entry is not None and \
+                        not state.needs_update('textmap', out_path, entry, design.get_chunk(entry)):
+                    continue
+                tasks.append((lang, out_path))
+            with phase('textmap'):
+                TextmapLoader.dump_languages(design, tasks, indent, args.jobs, args.textmap_index)
+            if state is not None:
+                for _, out_path in tasks:
+                    state.mark_done(out_path, True)
+        # Load configs
+        if not args.skip_config:
+            with phase('config'):
+                err_conf = conf.load_all_configs(args.output, args.jobs)
+        else:
+            err_conf = 'skipped'
+        # Load excels
+        if not args.skip_excel:
+            with phase('excel'):
+                err_excel = conf.load_all_excels(os.path.join(args.output, 'ExcelOutput'), excel_map)
+        else:
+            err_excel = 'skipped'
+        # Load stories
+        if not args.skip_story:
+            with phase('story'):
+                err_story = conf.load_all_story(args.output, args.jobs)
+        else:
+            err_story = 'skipped'
+        # Dump errors
+        with open(os.path.join(args.output, 'err.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'config': err_conf,
+                'excel': err_excel,
+                'story': err_story
+            }, f, indent=2)
+    if state is not None:
+        state.save()
+        with open(os.path.join(args.output, 'incremental.json'), 'w', encoding='utf-8') as f:
+            json.dump(state.report(), f, indent=2)
+    if profiler is not None:
+        profiler.log_report()
+        profiler.dump(os.path.join(args.output, 'profile.json'))
+
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+import json
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+from binary_reader import BinaryReader
+from logger import get_logger
+
+logger = get_logger('Profiler')
+
+
+class DecodeProfiler:
+    """
+    Call count, bytes consumed and decode time of every class and field type.
+    Decoders are wrapped once when compiled, so nothing is paid when profiling is off. Timing a decoder adds a
+    constant overhead per call, so primitive types look slower than they are relative to classes.
+    """
+
+    def __init__(self):
+        # (kind, name) -> [calls, bytes, total time, self time]
+        self._stats: Dict[Tuple[str, str], list] = {}
+        # Time spent in nested decoders of every decoder being timed
+        self._child_time = [0.0]
+        self._phases: Dict[str, float] = {}
+
+    def wrap(self, kind: str, name: str, decoder):
+        """
+        :param kind: class or type
+        :param name: Class or type name. Decoders with the same kind and name share their statistics
+        """
+        stats = self._stats.setdefault((kind, name), [0, 0, 0.0, 0.0])
+        child_time = self._child_time
+        clock = time.perf_counter
+
+        def profiled(reader: BinaryReader):
+            pos = reader.tell()
+            child_time.append(0.0)
+            start = clock()
+            try:
+                return decoder(reader)
+            finally:
+                elapsed = clock() - start
+                nested = child_time.pop()
+                child_time[-1] += elapsed
+                stats[0] += 1
+                stats[1] += reader.tell() - pos
+                stats[2] += elapsed
+                stats[3] += elapsed - nested
+        return profiled
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Record the wall time of an extraction phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._phases[name] = self._phases.get(name, 0.0) + time.perf_counter() - start
+
+    def report(self) -> dict:
+        entries = [{'kind': kind, 'name': name, 'calls': calls, 'bytes': size, 'total_time': total,
+                    'self_time': self_time}
+                   for (kind, name), (calls, size, total, self_time) in self._stats.items() if calls]
+        entries.sort(key=lambda entry: entry['self_time'], reverse=True)
+        return {'phases': self._phases, 'decoders': entries}
+
+    def log_report(self, limit: int = 30):
+        report = self.report()
+        for name, elapsed in report['phases'].items():
+            logger.info(f'Phase {name}: {elapsed:.2f}s')
+        lines = [f'{"kind":<6}{"name":<48}{"calls":>10}{"bytes":>12}{"total (s)":>11}{"self (s)":>10}']
+        for entry in report['decoders'][:limit]:
+            lines.append(f'{entry["kind"]:<6}{entry["name"][:47]:<48}{entry["calls"]:>10}{entry["bytes"]:>12}'
+                         f'{entry["total_time"]:>11.3f}{entry["self_time"]:>10.3f}')
+        logger.info('Decoders by self time:\n' + '\n'.join(lines))
+
+    def dump(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def merge(self, stats: List[list]):
+        """
+        Add statistics taken from another profiler with pop_stats.
+        """
+        for kind, name, calls, size, total, self_time in stats:
+            entry = self._stats.setdefault((kind, name), [0, 0, 0.0, 0.0])
+            entry[0] += calls
+            entry[1] += size
+            entry[2] += total
+            entry[3] += self_time
+
+    def pop_stats(self) -> List[list]:
+        """
+        Take the statistics collected so far and reset them, e.g. to send them from a worker process.
+        """
+        stats = [[kind, name, *values] for (kind, name), values in self._stats.items() if values[0]]
+        for values in self._stats.values():
+            values[:] = [0, 0, 0.0, 0.0]
+        return stats
@@ -0,0 +1,279 @@
+import json
+import os
+import socketserver
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+from class_loader import ClassLoader
+from config_loader import ConfigLoader
+from design_index_loader import DesignIndexLoader
+from excel_table import ExcelTable
+from logger import get_logger
+from textmap_loader import Language, TextmapLoader
+
+logger = get_logger('QueryService')
+
+
+class ByteSizeLRU:
+    """
+    Least recently used cache of encoded values and loaded objects, bounded by their total size in bytes.
+    """
+
+    def __init__(self, max_bytes: int):
+        """
+        :param max_bytes: Values are evicted once the cache holds more than this. Larger values are never cached
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        # Key to (value, size)
+        self._values: 'OrderedDict[Hashable, Tuple[object, int]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, key: Hashable):
+        item = self._values.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        self._values.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def put(self, key: Hashable, value, size: int = None):
+        """
+        :param size: Size of the value in bytes, len(value) if not given
+        """
+        if size is None:
+            size = len(value)
+        if size > self.max_bytes:
+            return
+        old = self._values.pop(key, None)
+        if old is not None:
+            self.size -= old[1]
+        self._values[key] = (value, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self._values.popitem(last=False)
+            self.size -= evicted
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {'entries': len(self._values), 'bytes': self.size, 'max_bytes': self.max_bytes, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+
+class QueryError(Exception):
+    """
+    Request that can't be answered, with the HTTP status of the response.
+    """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ExtractionService:
+    """
+    Lookups of excel rows, configs, stories and texts of one design data folder, answered from warm state:
+    schema, index and containers are loaded once, excels are opened as lazy tables and textmaps loaded on first use.
+    Opened tables, loaded textmaps and responses as encoded JSON share one cache bounded by their estimated size.
+    Requests are served one at a time, as tables share their readers.
+    """
+
+    def __init__(self, design: DesignIndexLoader, cls: ClassLoader, conf: ConfigLoader,
+                 excel_map: Dict[str, str] = None, cache_bytes: int = 256 << 20):
+        """
+        :param excel_map: Excel class to sPath mapping, see guess_config_name
+        :param cache_bytes: Size limit of the cache of tables, textmaps and responses
+        """
+        self._design = design
+        self._class = cls
+        self._conf = conf
+        self._excel_map = excel_map or {}
+        self._cache = ByteSizeLRU(cache_bytes)
+        self._lock = threading.Lock()
+        # Output path of every config and story to the class it is decoded as, built on first use
+        self._config_classes: Optional[Dict[str, str]] = None
+
+    def handle(self, parts: List[str], query: Dict[str, List[str]]) -> bytes:
+        """
+        Answer a request:
+        excel/<class>/<key>, config/<path>, text/<language>/<hash>, list/excel, list/excel/<class>, list/config,
+        list/textmap and stats. Lists take prefix, offset and limit from the query.
+        :param parts: Path of the request split at /
+        :return: Response as JSON
+        """
+        with self._lock:
+            kind = parts[0] if parts else ''
+            if kind == 'excel' and len(parts) == 3:
+                return self._cached(tuple(parts), lambda: self.get_excel_row(parts[1], parts[2]))
+            if kind == 'config' and len(parts) > 1:
+                path = '/'.join(parts[1:])
+                return self._cached(('config', path), lambda: self.get_config(path))
+            if kind == 'text' and len(parts) == 3:
+                hash_ = self._parse_int(parts[2], 'hash')
+                return self._cached(('text', parts[1].upper(), hash_), lambda: self.get_text(parts[1], hash_))
+            if kind == 'list' and len(parts) in (2, 3):
+                prefix = query.get('prefix', [''])[0]
+                offset = self._parse_int(query.get('offset', ['0'])[0], 'offset')
+                limit = self._parse_int(query.get('limit', ['1000'])[0], 'limit')
+                return self._cached(('list', *parts[1:], prefix, offset, limit),
+                                    lambda: self._list_page(parts[1:], prefix, offset, limit))
+            if kind == 'stats' and len(parts) == 1:
+                return self._encode({'cache': self._cache.stats()})
+            raise QueryError(404, f'Unknown request /{"/".join(parts)}')
+
+    @staticmethod
+    def _parse_int(value: str, name: str) -> int:
+        try:
+            return int(value)
+        except ValueError:
+            raise QueryError(400, f'Invalid {name} {value}')
+
+    @staticmethod
+    def _encode(value) -> bytes:
+        return json.dumps(value, ensure_ascii=False).encode('utf-8')
+
+    def _cached(self, key: tuple, build: Callable[[], object]) -> bytes:
+        value = self._cache.get(key)
+        if value is None:
+            try:
+                value = self._encode(build())
+            except QueryError:
+                raise
+            except Exception as e:
+                logger.warning(f'Failed to answer {key}. Error: {e}')
+                raise QueryError(500, f'Failed to decode: {e}')
+            self._cache.put(key, value)
+        return value
+
+    def _open_excel(self, name: str) -> ExcelTable:
+        table = self._cache.get(('table', name))
+        if table is None:
+            if name in self._excel_map or self._conf.find_excel_path(name):
+                table = self._conf.open_excel(name, self._excel_map.get(name))
+            if table is None:
+                raise QueryError(404, f'Excel {name} not found')
+            self._cache.put(('table', name), table, table.nbytes)
+        return table
+
+    def get_excel_row(self, name: str, key: str) -> dict:
+        table = self._open_excel(name)
+        if key not in table:
+            raise QueryError(404, f'Row {key} not found in {name}')
+        return table[key]
+
+    def _get_config_classes(self) -> Dict[str, str]:
+        if self._config_classes is None:
+            classes = {item: self._conf.get_config_class_name(config_name, item)
+                       for item, config_name in self._conf.get_config_items().items()}
+            try:
+                classes.update((path, 'LevelGraphConfig') for path in self._conf.get_story_paths())
+            except Exception as e:
+                logger.warning(f'Failed to load story paths. Error: {e}')
+            self._config_classes = classes
+        return self._config_classes
+
+    def get_config(self, path: str) -> dict:
+        """
+        :param path: Output path of a config or story, e.g. Config/Level/Foo.json
+        """
+        class_name = self._get_config_classes().get(path)
+        if class_name is None or self._design.find_entry(self._conf.get_config_path(path)) is None:
+            raise QueryError(404, f'Config {path} not found')
+        return self._conf.load_binary_config(path, class_name)
+
+    def _load_textmap(self, language: str) -> TextmapLoader:
+        code = language.upper()
+        textmap = self._cache.get(('textmap', code))
+        if textmap is None:
+            lang = next((lang for lang in Language if lang.value.upper() == code), None)
+            if lang is None or self._design.find_entry(TextmapLoader.get_textmap_path(lang)) is None:
+                raise QueryError(404, f'Textmap {language} not found')
+            textmap = TextmapLoader()
+            textmap.load_by_language(self._design, lang)
+            self._cache.put(('textmap', code), textmap, textmap.nbytes)
+        return textmap
+
+    def get_text(self, language: str, hash_: int) -> dict:
+        textmap = self._load_textmap(language)
+        if hash_ not in textmap:
+            raise QueryError(404, f'Text {hash_} not found in {language}')
+        return {'Text': textmap.get_text_by_hash(hash_), 'HasParam': textmap.has_param_by_hash(hash_)}
+
+    def _list_page(self, args: List[str], prefix: str, offset: int, limit: int) -> dict:
+        entries = [entry for entry in self.list_entries(*args) if entry.startswith(prefix)]
+        return {'total': len(entries), 'entries': entries[offset:offset + limit]}
+
+    def list_entries(self, kind: str, name: str = None) -> List[str]:
+        """
+        :param kind: excel for excel classes, or the keys of the excel name, config for configs and stories,
+                     or textmap for languages
+        """
+        if kind == 'excel' and name is not None:
+            return list(self._open_excel(name))
+        if kind == 'excel':
+            names = set(self._excel_map) | {name for name in self._class.get_excel_classes()
+                                            if self._conf.find_excel_path(name)}
+            return sorted(names)
+        if kind == 'config' and name is None:
+            return sorted(self._get_config_classes())
+        if kind == 'textmap' and name is None:
+            return [lang.value.upper() for lang in Language
+                    if self._design.find_entry(TextmapLoader.get_textmap_path(lang)) is not None]
+        raise QueryError(404, f'Unknown list {kind}')
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    server_version = 'SRExtractorPy'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [unquote(part) for part in url.path.split('/') if part]
+        try:
+            status, body = 200, self.server.service.handle(parts, parse_qs(url.query))
+        except QueryError as e:
+            status, body = e.status, json.dumps({'error': str(e)}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Unix socket clients have no address
+        logger.debug(format % args)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(service: ExtractionService, host: str = '127.0.0.1', port: int = 8642, socket_path: str = None):
+    """
+    Answer HTTP GET requests with the service until interrupted, on a Unix socket if socket_path is given.
+    """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = _UnixHTTPServer(socket_path, _RequestHandler)
+        address = socket_path
+    else:
+        server = ThreadingHTTPServer((host, port), _RequestHandler)
+        address = f'http://{host}:{server.server_address[1]}'
+    server.service = service
+    logger.info(f'Serving on {address}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
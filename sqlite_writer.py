@@ -0,0 +1,203 @@
+import json
+import os
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+from class_loader import FieldDecl
+from logger import get_logger
+
+logger = get_logger('SqliteWriter')
+
+# Declared column type of scalar fields. Other fields keep the value as decoded, nested values are stored as JSON
+COLUMN_TYPES = {
+    'bool': 'INTEGER',
+    'byte': 'INTEGER',
+    'sbyte': 'INTEGER',
+    'short': 'INTEGER',
+    'ushort': 'INTEGER',
+    'int': 'INTEGER',
+    'uint': 'INTEGER',
+    'long': 'INTEGER',
+    'ulong': 'INTEGER',
+    'float': 'REAL',
+    'double': 'REAL',
+    'FixPoint': 'REAL',
+    'string': 'TEXT',
+}
+_INT64_MIN = -0x8000000000000000
+_INT64_MAX = 0x7FFFFFFFFFFFFFFF
+
+
+def quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def get_column_type(field: FieldDecl) -> str:
+    if field.is_array or field.is_generic:
+        return 'TEXT'
+    return COLUMN_TYPES.get(field.type, '')
+
+
+def get_excel_table(name: str) -> str:
+    return 'excel_' + name
+
+
+def to_json(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def to_column(value):
+    if isinstance(value, (dict, list)):
+        return to_json(value)
+    if isinstance(value, int) and not _INT64_MIN <= value <= _INT64_MAX:
+        # Out of the range of SQLite integers, e.g. a large ulong
+        return str(value)
+    return value
+
+
+class SqliteWriter:
+    """
+    Output of an extraction as a single SQLite database:
+    one table excel_<class> per excel class, with a column per row field and the index field as primary key,
+    a configs table of decoded configs and stories as JSON keyed by path,
+    and a textmap table keyed by language and hash.
+    Rows are inserted in batches with executemany, and every phase is one transaction.
+    """
+
+    def __init__(self, path: str, batch_size: int = 10000):
+        """
+        :param path: Database to write. It is built from scratch in a temp file, which replaces path on close
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._tmp_path = f'{path}.{os.getpid()}.tmp'
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+        self._batch_size = batch_size
+        # Transactions are handled explicitly, see commit
+        self._conn = sqlite3.connect(self._tmp_path, isolation_level=None)
+        # The temp file is discarded if the extraction fails, so durability is traded for load speed
+        self._conn.execute('PRAGMA journal_mode=MEMORY')
+        self._conn.execute('PRAGMA synchronous=OFF')
+        self._conn.execute('CREATE TABLE configs (path TEXT PRIMARY KEY, class TEXT, data TEXT)')
+        self._conn.execute('CREATE TABLE textmap (language TEXT, hash INTEGER, text TEXT, '
+                           'has_param INTEGER, PRIMARY KEY (language, hash)) WITHOUT ROWID')
+        self._configs: List[tuple] = []
+        self._conn.execute('BEGIN')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(exc_type is None)
+
+    def write_excel(self, name: str, fields: List[FieldDecl], index_field: str,
+                    rows: Iterable[Tuple[str, dict]]) -> int:
+        """
+        Replace the table of an excel. Tables are named excel_<name>, so no excel can replace the configs or
+        textmap table, whose names SQLite compares case-insensitively.
+        :param fields: Columns of the table, the fields of the row class
+        :param index_field: Primary key column. A repeated key keeps the last row, same as the JSON output
+        :param rows: (key, row) as from ConfigLoader.iter_binary_excel
+        :return: Number of rows inserted
+        """
+        # A field redeclared by a subclass is a single key of the decoded row
+        columns: Dict[str, FieldDecl] = {}
+        for field in fields:
+            columns.setdefault(field.name, field)
+        fields = list(columns.values())
+        names = [field.name for field in fields]
+        definition = ', '.join(f'{quote(field.name)} {get_column_type(field)}'.rstrip() +
+                               (' PRIMARY KEY' if field.name == index_field else '') for field in fields)
+        table = quote(get_excel_table(name))
+        self._conn.execute(f'DROP TABLE IF EXISTS {table}')
+        self._conn.execute(f'CREATE TABLE {table} ({definition})')
+        sql = (f'INSERT OR REPLACE INTO {table} ({", ".join(quote(n) for n in names)}) '
+               f'VALUES ({", ".join("?" * len(names))})')
+        count = 0
+        batch = []
+        for _, row in rows:
+            batch.append(tuple(to_column(row.get(n)) for n in names))
+            if len(batch) >= self._batch_size:
+                self._conn.executemany(sql, batch)
+                count += len(batch)
+                batch.clear()
+        self._conn.executemany(sql, batch)
+        return count + len(batch)
+
+    def insert_config(self, path: str, class_name: str, data: str):
+        """
+        :param path: Output path of the config relative to the output folder, e.g. Config/Level/Foo.json
+        :param data: Config as JSON
+        """
+        self._configs.append((path, class_name, data))
+        if len(self._configs) >= self._batch_size:
+            self._flush_configs()
+
+    def copy_config(self, src: str, dst: str) -> Optional[int]:
+        """
+        Store the config of src under dst as well, e.g. for chunks with identical content.
+        :return: Size of the JSON, or None if src doesn't exist
+        """
+        self._flush_configs()
+        self._conn.execute('INSERT OR REPLACE INTO configs SELECT ?, class, data FROM configs WHERE path = ?',
+                           (dst, src))
+        row = self._conn.execute('SELECT length(data) FROM configs WHERE path = ?', (dst,)).fetchone()
+        return row[0] if row else None
+
+    def _flush_configs(self):
+        if self._configs:
+            self._conn.executemany('INSERT OR REPLACE INTO configs VALUES (?, ?, ?)', self._configs)
+            self._configs.clear()
+
+    def write_textmap(self, language: str, entries: Iterable[Tuple[int, str, bool]]) -> int:
+        """
+        Replace the texts of a language.
+        :param entries: (hash, text, has_param). A repeated hash keeps the last text, same as the JSON output
+        :return: Number of entries inserted
+        """
+        self._conn.execute('DELETE FROM textmap WHERE language = ?', (language,))
+        sql = 'INSERT OR REPLACE INTO textmap VALUES (?, ?, ?, ?)'
+        count = 0
+        batch = []
+        for hash_, text, has_param in entries:
+            batch.append((language, hash_, text, has_param))
+            if len(batch) >= self._batch_size:
+                self._conn.executemany(sql, batch)
+                count += len(batch)
+                batch.clear()
+        self._conn.executemany(sql, batch)
+        return count + len(batch)
+
+    def commit(self):
+        """
+        End the current transaction and start the next one.
+        """
+        self._flush_configs()
+        self._conn.execute('COMMIT')
+        self._conn.execute('BEGIN')
+
+    def close(self, commit: bool = True):
+        """
+        :param commit: Commit and replace path with the new database, otherwise it is discarded and path kept as is
+        """
+        if self._conn is None:
+            return
+        try:
+            if commit:
+                self._flush_configs()
+                self._conn.execute('COMMIT')
+            else:
+                self._conn.execute('ROLLBACK')
+        except BaseException:
+            commit = False
+            raise
+        finally:
+            self._conn.close()
+            self._conn = None
+            if not commit:
+                os.remove(self._tmp_path)
+                logger.warning(f'Discarded database {self.path}')
+        if not commit:
+            return
+        os.replace(self._tmp_path, self.path)
+        logger.info(f'Wrote database {self.path}')
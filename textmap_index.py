@@ -0,0 +1,128 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Optional
+
+# Layout, all little endian:
+#   header   magic, format version, entry count, string pool size
+#   hashes   int32[count], sorted
+#   offsets  uint32[count + 1], text i is pool[offsets[i]:offsets[i + 1]]
+#   params   uint8[count], has_param flag of each text
+#   pool     UTF-8 texts
+INDEX_MAGIC = b'SRTM'
+INDEX_VERSION = 1
+_header = struct.Struct('<4sIII')
+
+
+def _to_little_endian(table: array) -> array:
+    if sys.byteorder != 'little':
+        table = array(table.typecode, table)
+        table.byteswap()
+    return table
+
+
+def write_textmap_index(path: str, hashes: array, offsets: array, params: bytes, texts: Iterable[bytes]):
+    """
+    Write a textmap index file.
+    :param hashes: Sorted and unique int32 hashes
+    :param offsets: Offsets of the texts into the string pool, one more than hashes
+    :param params: has_param flag of each text
+    :param texts: UTF-8 texts in the order of hashes
+    """
+    if offsets[-1] > 0xFFFFFFFF:
+        raise ValueError(f'String pool too large for a textmap index: {offsets[-1]} bytes')
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(_header.pack(INDEX_MAGIC, INDEX_VERSION, len(hashes), offsets[-1]))
+            f.write(_to_little_endian(array('i', hashes)).tobytes())
+            f.write(_to_little_endian(array('I', offsets)).tobytes())
+            f.write(params)
+            for text in texts:
+                f.write(text)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+class TextmapIndex:
+    """
+    Read only view of a textmap index file. The file is mapped instead of read, so opening it is cheap and only the
+    pages touched by lookups become resident.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = self._view = memoryview(self._mmap)
+        try:
+            magic, version, count, pool_size = _header.unpack_from(view)
+        except struct.error:
+            magic, version, count, pool_size = b'', 0, 0, 0
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            self.close()
+            raise ValueError(f'{path} is not a textmap index of version {INDEX_VERSION}')
+        if len(view) < _header.size + count * 9 + 4 + pool_size:
+            self.close()
+            raise ValueError(f'Textmap index {path} is truncated')
+        pos = _header.size
+        hashes = view[pos:pos + count * 4]
+        pos += count * 4
+        offsets = view[pos:pos + (count + 1) * 4]
+        pos += (count + 1) * 4
+        self._params = view[pos:pos + count]
+        pos += count
+        self._pool = view[pos:pos + pool_size]
+        if sys.byteorder == 'little':
+            self._hashes = hashes.cast('i')
+            self._offsets = offsets.cast('I')
+        else:
+            # Tables can't be used in place on big endian machines, so they are copied
+            self._hashes = _to_little_endian(array('i', hashes.tobytes()))
+            self._offsets = _to_little_endian(array('I', offsets.tobytes()))
+        hashes.release()
+        offsets.release()
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, hash_: int) -> bool:
+        return self._find(hash_) is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _find(self, hash_: int) -> Optional[int]:
+        idx = bisect_left(self._hashes, hash_)
+        if idx < self._count and self._hashes[idx] == hash_:
+            return idx
+        return None
+
+    def get_text_by_hash(self, hash_: int) -> str:
+        idx = self._find(hash_)
+        if idx is None:
+            raise KeyError(hash_)
+        return str(self._pool[self._offsets[idx]:self._offsets[idx + 1]], 'utf-8')
+
+    def has_param_by_hash(self, hash_: int) -> bool:
+        idx = self._find(hash_)
+        if idx is None:
+            raise KeyError(hash_)
+        return self._params[idx] != 0
+
+    def close(self):
+        for name in ['_hashes', '_offsets', '_params', '_pool', '_view']:
+            view = self.__dict__.pop(name, None)
+            if isinstance(view, memoryview):
+                view.release()
+        if not self._mmap.closed:
+            self._mmap.close()
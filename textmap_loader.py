@@ -1,7 +1,14 @@
-import json
 import os
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
+from typing import Iterator, List, Optional, Tuple
+from binary_reader import BinaryReader
 from design_index_loader import DesignIndexLoader
+from json_writer import DuplicateKeyError, JsonStreamWriter, atomic_open
+from sqlite_writer import SqliteWriter
+from textmap_index import write_textmap_index
 from logger import get_logger
 
 logger = get_logger('TextmapLoader')
@@ -24,17 +31,66 @@ class Language(Enum):
 
 
 class TextmapLoader:
+    """
+    Textmap of one language. Texts are kept as a sorted hash array with offsets into one UTF-8 blob,
+    and only decoded on lookup.
+    """
+
     def __init__(self):
-        self._textmap = {}
+        self._clear()
 
-    def load_by_language(self, design: DesignIndexLoader, language: Language):
-        self._textmap.clear()
-        reader = design.get_reader(name=f'BakedConfig/ExcelOutput/Textmap_{language.value}.bytes')
+    def _clear(self):
+        # Sorted and unique, text i is _blob[_starts[i]:_ends[i]]
+        self._hashes = array('i')
+        self._starts = array('I')
+        self._ends = array('I')
+        self._params = bytearray()
+        # Indices into _hashes in order of first appearance, which is the order of the dump
+        self._order = array('I')
+        self._blob = bytearray()
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __contains__(self, hash_: int) -> bool:
+        return self._find(hash_) is not None
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Memory held by the texts and their index.
+        """
+        return sum(it.itemsize * len(it) for it in (self._hashes, self._starts, self._ends, self._order)) + \
+            len(self._params) + len(self._blob)
+
+    @staticmethod
+    def get_textmap_path(language: Language) -> str:
+        return f'BakedConfig/ExcelOutput/Textmap_{language.value}.bytes'
+
+    @classmethod
+    def _open(cls, design: DesignIndexLoader, language: Language) -> Optional[Tuple[BinaryReader, int]]:
+        reader = design.get_reader(name=cls.get_textmap_path(language))
         if not reader:
             logger.warning(f'Textmap_{language.value}.bytes not found.')
-            return
+            return None
         num_entry = reader.read_array_len()
         logger.info(f'Loading textmap for {language.name}. Entry count: {num_entry}')
+        return reader, num_entry
+
+    @classmethod
+    def iter_by_language(cls, design: DesignIndexLoader,
+                         language: Language) -> Optional[Iterator[Tuple[int, str, bool]]]:
+        """
+        Decode the entries of a textmap one by one.
+        :return: Iterator of (hash, text, has_param), or None if the textmap is not found
+        """
+        opened = cls._open(design, language)
+        if opened is None:
+            return None
+        return cls._iter_entries(*opened)
+
+    @staticmethod
+    def _iter_entries(reader: BinaryReader, num_entry: int):
         for _ in range(num_entry):
             mask = reader.read_uleb128()
             hash_ = reader.read_hash()
@@ -42,16 +98,180 @@ class TextmapLoader:
             has_param = False
             if (mask & 0b100) != 0:
                 has_param = reader.read_bool()
-            self._textmap[hash_] = (text, has_param)
+            yield hash_, text, has_param
+
+    def load_by_language(self, design: DesignIndexLoader, language: Language):
+        self._clear()
+        opened = self._open(design, language)
+        if opened is None:
+            return
+        reader, num_entry = opened
+        hashes = array('i')
+        starts = array('I')
+        ends = array('I')
+        params = bytearray()
+        blob = bytearray()
+        for _ in range(num_entry):
+            mask = reader.read_uleb128()
+            hashes.append(reader.read_hash())
+            # Keep the raw UTF-8 bytes, texts are decoded on lookup
+            starts.append(len(blob))
+            blob += reader.read_bytes(reader.read_uleb128())
+            ends.append(len(blob))
+            params.append((mask & 0b100) != 0 and reader.read_bool())
+        self._build(hashes, starts, ends, params)
+        self._blob = blob
         logger.info(f'Successfully loaded textmap for {language.name}.')
 
+    def _build(self, hashes: array, starts: array, ends: array, params: bytearray):
+        # Sort packed (hash, position) keys, cheaper than sorting indices by a key function.
+        # Entries of a repeated hash stay in the order they were read
+        keys = sorted((hashes[i] + 0x80000000) << 32 | i for i in range(len(hashes)))
+        slots = array('i', [-1]) * len(hashes)
+        prev = None
+        for key in keys:
+            i = key & 0xFFFFFFFF
+            hash_ = hashes[i]
+            if hash_ == prev:
+                # Same as a dict, a repeated hash keeps its first position with the last text
+                self._starts[-1] = starts[i]
+                self._ends[-1] = ends[i]
+                self._params[-1] = params[i]
+                continue
+            prev = hash_
+            slots[i] = len(self._hashes)
+            self._hashes.append(hash_)
+            self._starts.append(starts[i])
+            self._ends.append(ends[i])
+            self._params.append(params[i])
+        self._order = array('I', (idx for idx in slots if idx >= 0))
+
+    def _find(self, hash_: int) -> Optional[int]:
+        idx = bisect_left(self._hashes, hash_)
+        if idx < len(self._hashes) and self._hashes[idx] == hash_:
+            return idx
+        return None
+
+    def _get_text(self, idx: int) -> str:
+        return self._blob[self._starts[idx]:self._ends[idx]].decode('utf-8')
+
     def get_text_by_hash(self, hash_: int) -> str:
-        return self._textmap[hash_][0]
+        idx = self._find(hash_)
+        if idx is None:
+            raise KeyError(hash_)
+        return self._get_text(idx)
+
+    def has_param_by_hash(self, hash_: int) -> bool:
+        idx = self._find(hash_)
+        if idx is None:
+            raise KeyError(hash_)
+        return bool(self._params[idx])
 
-    def dump(self, path: str):
+    def dump(self, path: str, indent: Optional[int] = 2):
         os.makedirs(os.path.dirname(path), exist_ok=True)
-        text_map = {}
-        for k, v in self._textmap.items():
-            text_map[k] = v[0]
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(text_map, f, ensure_ascii=False, indent=2)
+        with atomic_open(path) as f:
+            self._write(f, indent)
+
+    def _write(self, f, indent: Optional[int]):
+        writer = JsonStreamWriter(f, indent, ensure_ascii=False)
+        for idx in self._order:
+            writer.write_item(self._hashes[idx], self._get_text(idx))
+        writer.close()
+
+    def dump_index(self, path: str):
+        """
+        Write the textmap as an index file, see TextmapIndex for reading it.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        offsets = array('Q', [0])
+        for start, end in zip(self._starts, self._ends):
+            offsets.append(offsets[-1] + end - start)
+        blob = memoryview(self._blob)
+        try:
+            write_textmap_index(path, self._hashes, offsets, self._params,
+                                (blob[start:end] for start, end in zip(self._starts, self._ends)))
+        finally:
+            blob.release()
+
+    @staticmethod
+    def get_index_path(path: str) -> str:
+        return os.path.splitext(path)[0] + '.idx'
+
+    @classmethod
+    def dump_by_language(cls, design: DesignIndexLoader, language: Language, path: str, indent: Optional[int] = 2):
+        """
+        Stream a textmap straight to a JSON file without loading it first.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entries = cls.iter_by_language(design, language)
+        with atomic_open(path) as f:
+            writer = JsonStreamWriter(f, indent, ensure_ascii=False, unique_keys=True)
+            try:
+                for hash_, text, _ in entries or ():
+                    writer.write_item(hash_, text)
+                writer.close()
+            except DuplicateKeyError:
+                # A repeated hash can't be streamed, load the textmap to dump it in dict order instead
+                f.seek(0)
+                f.truncate()
+                textmap = cls()
+                textmap.load_by_language(design, language)
+                textmap._write(f, indent)
+        if entries is not None:
+            logger.info(f'Successfully loaded textmap for {language.name}.')
+
+    @classmethod
+    def dump_language(cls, design: DesignIndexLoader, language: Language, path: str, indent: Optional[int] = 2,
+                      index: bool = False):
+        """
+        Dump the textmap of a language to JSON, and to an index file next to it if index is set.
+        """
+        if not index:
+            cls.dump_by_language(design, language, path, indent)
+            return
+        # The index needs the whole textmap sorted anyway, so load it once for both outputs
+        textmap = cls()
+        textmap.load_by_language(design, language)
+        textmap.dump(path, indent)
+        textmap.dump_index(cls.get_index_path(path))
+
+    @classmethod
+    def dump_languages(cls, design: DesignIndexLoader, tasks: List[Tuple[Language, str]],
+                       indent: Optional[int] = 2, jobs: int = 1, index: bool = False):
+        """
+        Dump textmaps of several languages, in worker processes if jobs > 1.
+        :param tasks: List of (language, output path)
+        """
+        if jobs > 1 and len(tasks) > 1:
+            # Every language is its own chunk, so one task per language is balanced enough
+            with ProcessPoolExecutor(max_workers=min(jobs, len(tasks)), initializer=_init_worker,
+                                     initargs=(design.path, design.version)) as pool:
+                list(pool.map(_dump_language_worker, tasks, [indent] * len(tasks), [index] * len(tasks)))
+            return
+        for language, path in tasks:
+            cls.dump_language(design, language, path, indent, index)
+
+    @classmethod
+    def insert_language(cls, design: DesignIndexLoader, language: Language, db: SqliteWriter) -> bool:
+        """
+        Stream the textmap of a language into a database, keyed by the upper case language code.
+        :return: False if the textmap is not found
+        """
+        entries = cls.iter_by_language(design, language)
+        if entries is None:
+            return False
+        db.write_textmap(language.value.upper(), entries)
+        logger.info(f'Successfully loaded textmap for {language.name}.')
+        return True
+
+
+_worker_design: DesignIndexLoader = None
+
+
+def _init_worker(design_path: str, version: str):
+    global _worker_design
+    _worker_design = DesignIndexLoader(design_path, version)
+
+
+def _dump_language_worker(task: Tuple[Language, str], indent: Optional[int], index: bool):
+    TextmapLoader.dump_language(_worker_design, task[0], task[1], indent, index)
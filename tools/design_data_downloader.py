@@ -1,4 +1,7 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
 import requests
 import argparse
 import sys
@@ -6,29 +9,123 @@ import sys
 sys.path.append('..')
 from design_index_loader import DesignIndexLoader
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--base', help='Base url point to Design data', required=True)
-parser.add_argument('--dst', help='Destination directory', required=True)
-parser.add_argument('--client', help='Client type', default='Windows')
-args = parser.parse_args()
-
-os.makedirs(args.dst, exist_ok=True)
-index_base_url = args.base + f'/client/{args.client}/'
-
-print('Downloading M_DesignV.bytes...')
-with open(args.dst + '/M_DesignV.bytes', 'wb') as f:
-    design_data_ii = requests.get(index_base_url + 'M_DesignV.bytes').content
-    f.write(design_data_ii)
-index_name = ''
-for i in range(4):
-    for j in range(4):
-        index_name += f'{design_data_ii[31 + i * 4 - j]:02x}'
-print(f'Downloading DesignV_{index_name}.bytes...')
-with open(args.dst + f'/DesignV_{index_name}.bytes', 'wb') as f:
-    design_data_i = requests.get(index_base_url + f'DesignV_{index_name}.bytes').content
-    f.write(design_data_i)
-index_loader = DesignIndexLoader(args.dst)
-for f in index_loader.file_entries:
-    print(f'Downloading {f.filename}...')
-    with open(os.path.join(args.dst, f.filename), 'wb') as fo:
-        fo.write(requests.get(index_base_url + f.filename).content)
+CHUNK_SIZE = 1 << 16
+_local = threading.local()
+
+
+def get_session() -> requests.Session:
+    # Sessions aren't thread safe, so every worker thread keeps its own, and reuses its connections
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+
+def download_file(session: requests.Session, url: str, path: str, size: Optional[int] = None,
+                  retries: int = 3) -> Optional[int]:
+    """
+    Stream a file to disk. Data goes to path.part first, an interrupted download continues from there with a Range
+    request, and the file is only moved to path once complete.
+    :param size: Expected size. A file of this size at path is skipped, and the download must end at this size
+    :return: Number of bytes downloaded, or None if the file was already complete
+    """
+    if size is not None and os.path.isfile(path) and os.path.getsize(path) == size:
+        return None
+    part_path = path + '.part'
+    downloaded = 0
+    for attempt in range(retries + 1):
+        pos = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+        if size is not None and pos >= size:
+            if pos == size:
+                os.replace(part_path, path)
+                return downloaded
+            pos = 0
+        headers = {'Range': f'bytes={pos}-'} if pos else {}
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=30) as response:
+                if response.status_code == 416:
+                    # Nothing left to download in range, start over to be sure of the content
+                    os.remove(part_path)
+                    continue
+                response.raise_for_status()
+                if response.status_code != 206:
+                    # Range not supported, the whole file is sent again
+                    pos = 0
+                with open(part_path, 'r+b' if pos else 'wb') as f:
+                    f.seek(pos)
+                    f.truncate()
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+                        downloaded += len(chunk)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            if attempt == retries:
+                raise
+            print(f'Retrying {os.path.basename(path)} after error: {e}')
+            continue
+        actual = os.path.getsize(part_path)
+        if size is None or actual == size:
+            os.replace(part_path, path)
+            return downloaded
+        if actual > size:
+            os.remove(part_path)
+        if attempt == retries:
+            raise IOError(f'Size mismatch for {os.path.basename(path)}: {actual} bytes, expected {size}')
+        print(f'Retrying {os.path.basename(path)}, got {actual} of {size} bytes')
+    raise IOError(f'Failed to download {os.path.basename(path)}')
+
+
+def download_design_data(base: str, dst: str, client: str = 'Windows', version: str = '1.2.53', jobs: int = 8):
+    os.makedirs(dst, exist_ok=True)
+    index_base_url = base + f'/client/{client}/'
+    session = get_session()
+
+    # M_DesignV points to the current index, so it is always fetched again
+    print('Downloading M_DesignV.bytes...')
+    if os.path.isfile(os.path.join(dst, 'M_DesignV.bytes.part')):
+        os.remove(os.path.join(dst, 'M_DesignV.bytes.part'))
+    download_file(session, index_base_url + 'M_DesignV.bytes', os.path.join(dst, 'M_DesignV.bytes'))
+    with open(os.path.join(dst, 'M_DesignV.bytes'), 'rb') as f:
+        design_data_ii = f.read()
+    index_name = ''
+    for i in range(4):
+        for j in range(4):
+            index_name += f'{design_data_ii[31 + i * 4 - j]:02x}'
+    # The index is named after its content, an existing one is complete
+    index_path = os.path.join(dst, f'DesignV_{index_name}.bytes')
+    if not os.path.isfile(index_path):
+        print(f'Downloading DesignV_{index_name}.bytes...')
+        download_file(session, index_base_url + f'DesignV_{index_name}.bytes', index_path)
+    index_loader = DesignIndexLoader(index_path, version)
+
+    total = len(index_loader.file_entries)
+    downloaded = skipped = 0
+
+    def download_entry(entry):
+        return download_file(get_session(), index_base_url + entry.filename, os.path.join(dst, entry.filename),
+                             entry.size)
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(download_entry, f): f for f in index_loader.file_entries}
+        for done, future in enumerate(as_completed(futures), 1):
+            size = future.result()
+            if size is None:
+                skipped += 1
+            else:
+                downloaded += size
+            print(f'[{done}/{total}] {futures[future].filename}' + (' (complete, skipped)' if size is None else ''))
+    print(f'Downloaded {downloaded} bytes. {skipped} of {total} files were already complete.')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--base', help='Base url point to Design data', required=True)
+    parser.add_argument('--dst', help='Destination directory', required=True)
+    parser.add_argument('--client', help='Client type', default='Windows')
+    parser.add_argument('--version', help='Version of the game', default='1.2.53')
+    parser.add_argument('--jobs', help='Number of concurrent downloads', type=int, default=8)
+    args = parser.parse_args()
+    download_design_data(args.base, args.dst, args.client, args.version, args.jobs)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,95 +1,172 @@
 import json
 import os
 import re
-from tqdm import tqdm
-from sentence_transformers import SentenceTransformer, util
 import sys
 import argparse
+from difflib import SequenceMatcher
 
 sys.path.append('..')
+from binary_reader import BinaryReader
 from class_loader import ClassLoader
 from design_index_loader import DesignIndexLoader
 from config_loader import ConfigLoader
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--cs', help='Path to dump.cs provided by il2cpp dumper', required=True)
-parser.add_argument('--string', help='Path to stringliteral.json provided by il2cpp dumper', required=True)
-parser.add_argument('--design', help='Path to design data folder', required=True)
-parser.add_argument('--output', help='Path to output file', required=True)
-parser.add_argument('--map', help='Path to ID map file. If not provided the program will guess the id.', required=False)
-args = parser.parse_args()
 
-
-cls = ClassLoader(args.cs, args.map)
-design = DesignIndexLoader(args.design)
-conf = ConfigLoader(design, cls)
-
-
-def pass1():
+def pass1(cls: ClassLoader, design: DesignIndexLoader, conf: ConfigLoader, string_path: str):
     mapping = {}
     valid = {}
-    string_json = json.load(open(args.string, 'r', encoding='utf-8'))
-    for s in string_json:
-        if re.fullmatch(r'[a-zA-Z]+', s['value']):
-            if design.get_entry(name='BakedConfig/ExcelOutput/' + s['value'] + '.bytes') is not None:
-                valid[s['value']] = 'BakedConfig/ExcelOutput/' + s['value'] + '.bytes'
-            elif design.get_entry(name='BakedConfig/ExcelOutputGameCore/' + s['value'] + '.bytes') is not None:
-                valid[s['value']] = 'BakedConfig/ExcelOutputGameCore/' + s['value'] + '.bytes'
+    string_json = json.load(open(string_path, 'r', encoding='utf-8'))
+    literals = [s['value'] for s in string_json if re.fullmatch(r'[a-zA-Z]+', s['value'])]
+    # Hash every candidate path once, later existence checks are dict hits
+    design.register_names([f'BakedConfig/{folder}/{value}.bytes'
+                           for value in literals for folder in ['ExcelOutput', 'ExcelOutputGameCore']])
+    design.register_names([path for class_name in cls.get_excel_classes()
+                           for path in conf.get_excel_candidates(class_name)])
+    for value in literals:
+        if design.contains('BakedConfig/ExcelOutput/' + value + '.bytes'):
+            valid[value] = 'BakedConfig/ExcelOutput/' + value + '.bytes'
+        elif design.contains('BakedConfig/ExcelOutputGameCore/' + value + '.bytes'):
+            valid[value] = 'BakedConfig/ExcelOutputGameCore/' + value + '.bytes'
 
     for class_name in cls.get_excel_classes():
         if class_name == 'Textmap' or class_name == 'TextmapMT':
             continue
         # Guess from all excel classes
-        if design.get_entry(name=f'BakedConfig/ExcelOutput/{class_name}.bytes') is not None:
+        if design.contains(f'BakedConfig/ExcelOutput/{class_name}.bytes'):
             mapping[class_name] = f'BakedConfig/ExcelOutput/{class_name}.bytes'
-        elif design.get_entry(name=f'BakedConfig/ExcelOutputGameCore/{class_name}.bytes') is not None:
+        elif design.contains(f'BakedConfig/ExcelOutputGameCore/{class_name}.bytes'):
             mapping[class_name] = f'BakedConfig/ExcelOutputGameCore/{class_name}.bytes'
-        elif class_name.endswith('Config') and design.get_entry(
-                name=f'BakedConfig/ExcelOutput/{class_name[:-6]}.bytes') is not None:
+        elif class_name.endswith('Config') and design.contains(f'BakedConfig/ExcelOutput/{class_name[:-6]}.bytes'):
             mapping[class_name] = f'BakedConfig/ExcelOutput/{class_name[:-6]}.bytes'
-        elif class_name.endswith('Config') and design.get_entry(
-                name=f'BakedConfig/ExcelOutputGameCore/{class_name[:-6]}.bytes') is not None:
+        elif class_name.endswith('Config') and design.contains(
+                f'BakedConfig/ExcelOutputGameCore/{class_name[:-6]}.bytes'):
             mapping[class_name] = f'BakedConfig/ExcelOutputGameCore/{class_name[:-6]}.bytes'
         else:
-            if design.get_entry(name=f'BakedConfig/ExcelOutputGameCore/{class_name}Config.bytes') is not None:
+            if design.contains(f'BakedConfig/ExcelOutputGameCore/{class_name}Config.bytes'):
                 mapping[class_name] = f'BakedConfig/ExcelOutputGameCore/{class_name}Config.bytes'
-            elif design.get_entry(name=f'BakedConfig/ExcelOutput/{class_name}Config.bytes') is not None:
+            elif design.contains(f'BakedConfig/ExcelOutput/{class_name}Config.bytes'):
                 mapping[class_name] = f'BakedConfig/ExcelOutput/{class_name}Config.bytes'
 
     return mapping, valid
 
 
-def pass2(mapping: dict, valid: dict):
+def split_words(name: str) -> str:
+    return ' '.join(re.findall(r'[A-Z][^A-Z]*', name))
+
+
+def name_scores(need_to_find: list, available: list):
+    # Similarity of the CamelCase words of the names, used to try the likely files first
+    words = [split_words(it).lower().split() for it in available]
+    scores = []
+    for class_name in need_to_find:
+        matcher = SequenceMatcher(None, split_words(class_name).lower().split())
+        row = []
+        for it in words:
+            matcher.set_seq1(it)
+            row.append(matcher.ratio())
+        scores.append(row)
+    return scores
+
+
+def semantic_scores(need_to_find: list, available: list):
+    from sentence_transformers import SentenceTransformer, util
     model = SentenceTransformer('paraphrase-MiniLM-L6-v2')
+    available_embedding = model.encode([split_words(it) for it in available])
+    need_to_find_embedding = model.encode([split_words(it) for it in need_to_find])
+    return util.cos_sim(need_to_find_embedding, available_embedding).tolist()
+
+
+def first_row_width(design: DesignIndexLoader, path: str) -> int:
+    """
+    :return: Number of fields needed by the bitmask of the first row, or -1 if the excel is empty or broken
+    """
+    reader = BinaryReader(buffer=design.get_chunk(design.find_entry(path)))
+    try:
+        if reader.read_array_len() == 0:
+            return -1
+        return reader.read_uleb128().bit_length()
+    except IndexError:
+        return -1
+
+
+def resolve_collisions(conf: ConfigLoader, candidates: dict, widths: dict, field_counts: dict, path_scores: dict,
+                       mapping: dict, jobs: int):
+    """
+    Match the classes to their chunks into mapping, so that no chunk is given to two classes.
+    Classes are matched independently, and a chunk several of them decode goes to the class whose field count is
+    closest to the first row width of the chunk, then to the best name score. The others are matched again without
+    the chunks taken so far.
+    """
+    taken = set()
+    pending = candidates
+    while pending:
+        claims = {}
+        for class_name, path in conf.match_excels(pending, jobs).items():
+            if path is not None:
+                claims.setdefault(path, []).append(class_name)
+            else:
+                print(f'Failed to find {class_name}')
+        pending = {}
+        for path, classes in claims.items():
+            classes.sort(key=lambda it: (abs(field_counts[it] - widths[path]), -path_scores[it][path], it))
+            mapping[classes[0]] = path
+            taken.add(path)
+            for class_name in classes[1:]:
+                print(f'{path} matches {classes[0]} better than {class_name}')
+                pending[class_name] = None
+        pending = {class_name: [path for path in candidates[class_name] if path not in taken] for class_name in pending}
+
+
+def pass2(cls: ClassLoader, design: DesignIndexLoader, conf: ConfigLoader, mapping: dict, valid: dict, jobs: int,
+          semantic: bool):
     available = list(set(valid.keys()) - set([os.path.basename(it)[:-6] for it in mapping.values()]))
     need_to_find = list(set(cls.get_excel_classes()) - set(mapping.keys()) - {'Textmap', 'TextmapMT'})
-    available_l2 = [' '.join(re.findall(r'[A-Z][^A-Z]*', it)) for it in available]
-    need_to_find_l2 = [' '.join(re.findall(r'[A-Z][^A-Z]*', it)) for it in need_to_find]
-    available_embedding = model.encode(available_l2)
-    need_to_find_embedding = model.encode(need_to_find_l2)
-    cos_scores = util.cos_sim(need_to_find_embedding, available_embedding)
-    for idx, class_name in tqdm(enumerate(need_to_find)):
-        score_list = [(cos_scores[idx][it], available[it]) for it in range(len(available))]
+    # A row bitmask can't have more bits than the row class has fields, which rules out most pairs without decoding
+    widths = {valid[it]: first_row_width(design, valid[it]) for it in available}
+    scores = (semantic_scores if semantic else name_scores)(need_to_find, available)
+    field_counts = {}
+    path_scores = {}
+    candidates = {}
+    for idx, class_name in enumerate(need_to_find):
+        field_counts[class_name] = len(cls.get_class(class_name + 'Row', True) or [])
+        path_scores[class_name] = {valid[available[it]]: scores[idx][it] for it in range(len(available))}
+        score_list = [(scores[idx][it], valid[available[it]]) for it in range(len(available))
+                      if 0 <= widths[valid[available[it]]] <= field_counts[class_name]]
         score_list.sort(key=lambda x: x[0], reverse=True)
-        for item in score_list:
-            print(f'Trying {class_name}Row with {item[1]}')
-            path = valid[item[1]]
-            try:
-                result = conf.load_binary_excel(class_name, path)
-            except:
-                continue
-            if result is not None and len(result) > 0:
-                mapping[class_name] = path
-                break
-        else:
-            print(f'Failed to find {class_name}')
+        candidates[class_name] = [path for _, path in score_list]
+    print(f'Matching {len(need_to_find)} classes against {len(available)} files, '
+          f'{sum(len(it) for it in candidates.values())} candidate pairs')
+    resolve_collisions(conf, candidates, widths, field_counts, path_scores, mapping, jobs)
     return {
         'mapping': mapping,
         'valid': valid
     }
 
 
-if __name__ == '__main__':
-    data = pass2(*pass1())
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cs', help='Path to dump.cs provided by il2cpp dumper', required=True)
+    parser.add_argument('--string', help='Path to stringliteral.json provided by il2cpp dumper', required=True)
+    parser.add_argument('--design', help='Path to design data folder', required=True)
+    parser.add_argument('--output', help='Path to output file', required=True)
+    parser.add_argument('--map', help='Path to ID map file. If not provided the program will guess the id.',
+                        required=False)
+    parser.add_argument('--version', help='Version of the game', default='1.2.53')
+    parser.add_argument('--beta', help='Parse in beta mode', action='store_true', default=False)
+    parser.add_argument('--jobs', help='Number of worker processes for matching', type=int, default=1)
+    parser.add_argument('--semantic', help='Order candidates by sentence embeddings of the names, '
+                                           'needs sentence-transformers', action='store_true', default=False)
+    parser.add_argument('--no-schema-cache', help='Always reparse dump.cs instead of using the schema cache',
+                        action='store_true', default=False)
+    args = parser.parse_args()
+
+    cls = ClassLoader(args.cs, args.map, use_cache=not args.no_schema_cache)
+    design = DesignIndexLoader(args.design, args.version)
+    conf = ConfigLoader(design, cls, args.beta)
+    data = pass2(cls, design, conf, *pass1(cls, design, conf, args.string), args.jobs, args.semantic)
     with open(args.output, 'w', encoding='utf-8') as f:
         json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()